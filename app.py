@@ -2,10 +2,11 @@
 import plotly.graph_objects as go
 import streamlit as st
 
-G = 9.81
-COURT_LENGTH = 18.0
-COURT_WIDTH = 9.0
-ANTENNA_HEIGHT_ABOVE_NET = 0.8
+# Physics comes from the UI-free core module of the vb3d_sim package
+from vb3d_sim.core import ANTENNA_ABOVE_NET, SIDELINE_ORIGIN, FlightEngine
+
+# Court coordinates here run y = 0..9 from the left sideline
+ENGINE = FlightEngine(SIDELINE_ORIGIN)
 
 
 def _set_hnet_from_preset() -> None:
@@ -60,37 +61,13 @@ def get_inputs() -> dict:
     }
 
 
-def velocity_from_angles(speed: float, theta_deg: float, phi_deg: float) -> np.ndarray:
-    theta = np.deg2rad(theta_deg)
-    phi = np.deg2rad(phi_deg)
-    vx = speed * np.cos(theta) * np.cos(phi)
-    vy = speed * np.cos(theta) * np.sin(phi)
-    vz = speed * np.sin(theta)
-    return np.array([vx, vy, vz], dtype=float)
-
-
-def simulate_trajectory(S: np.ndarray, v0: np.ndarray, t_end: float, dt: float) -> tuple[np.ndarray, np.ndarray]:
-    t = np.arange(0.0, t_end + dt, dt)
-    g_vec = np.array([0.0, 0.0, -G], dtype=float)
-    r = S + np.outer(t, v0) + 0.5 * np.outer(t**2, g_vec)
-    return t, r
-
-
-def compute_apex(S: np.ndarray, v0: np.ndarray) -> tuple[float, np.ndarray]:
-    vz0 = v0[2]
-    t_apex = max(0.0, vz0 / G)
-    g_vec = np.array([0.0, 0.0, -G], dtype=float)
-    apex = S + v0 * t_apex + 0.5 * g_vec * (t_apex**2)
-    return t_apex, apex
-
-
 def make_court_traces(hnet: float) -> list[go.Scatter3d]:
-    half_len = COURT_LENGTH / 2.0
-    width = COURT_WIDTH
+    x_lo, x_hi = ENGINE.frame.x_range
+    y_lo, y_hi = ENGINE.frame.y_range
     traces: list[go.Scatter3d] = []
 
-    boundary_x = [-half_len, half_len, half_len, -half_len, -half_len]
-    boundary_y = [0.0, 0.0, width, width, 0.0]
+    boundary_x = [x_lo, x_hi, x_hi, x_lo, x_lo]
+    boundary_y = [y_lo, y_lo, y_hi, y_hi, y_lo]
     boundary_z = [0.0] * len(boundary_x)
     traces.append(
         go.Scatter3d(
@@ -106,7 +83,7 @@ def make_court_traces(hnet: float) -> list[go.Scatter3d]:
     traces.append(
         go.Scatter3d(
             x=[0.0, 0.0],
-            y=[0.0, width],
+            y=[y_lo, y_hi],
             z=[0.0, 0.0],
             mode="lines",
             name="Net Line (floor)",
@@ -117,7 +94,7 @@ def make_court_traces(hnet: float) -> list[go.Scatter3d]:
     traces.append(
         go.Scatter3d(
             x=[0.0, 0.0],
-            y=[0.0, width],
+            y=[y_lo, y_hi],
             z=[hnet, hnet],
             mode="lines",
             name="Net Top",
@@ -125,12 +102,12 @@ def make_court_traces(hnet: float) -> list[go.Scatter3d]:
         )
     )
 
-    for y_val, label in [(0.0, "Antenna y=0"), (width, "Antenna y=9")]:
+    for y_val, label in [(y_lo, f"Antenna y={y_lo:g}"), (y_hi, f"Antenna y={y_hi:g}")]:
         traces.append(
             go.Scatter3d(
                 x=[0.0, 0.0],
                 y=[y_val, y_val],
-                z=[hnet, hnet + ANTENNA_HEIGHT_ABOVE_NET],
+                z=[hnet, hnet + ANTENNA_ABOVE_NET],
                 mode="lines",
                 name=label,
                 line={"color": "red", "width": 8},
@@ -140,11 +117,14 @@ def make_court_traces(hnet: float) -> list[go.Scatter3d]:
     return traces
 
 
-def build_figure(r: np.ndarray, apex: np.ndarray, hnet: float) -> go.Figure:
-    fig = go.Figure()
+@st.cache_resource
+def court_traces(hnet: float) -> tuple[go.Scatter3d, ...]:
+    # Static per net height; validated once instead of on every rerun
+    return tuple(make_court_traces(hnet))
 
-    for tr in make_court_traces(hnet):
-        fig.add_trace(tr)
+
+def build_figure(r: np.ndarray, apex: np.ndarray, hnet: float) -> go.Figure:
+    fig = go.Figure(data=court_traces(hnet))
 
     fig.add_trace(
         go.Scatter3d(
@@ -181,14 +161,15 @@ def build_figure(r: np.ndarray, apex: np.ndarray, hnet: float) -> go.Figure:
 
     fig.update_layout(
         scene={
-            "xaxis": {"title": "x (m)", "range": [-9, 9]},
-            "yaxis": {"title": "y (m)", "range": [0, 9]},
+            "xaxis": {"title": "x (m)", "range": ENGINE.frame.x_range},
+            "yaxis": {"title": "y (m)", "range": ENGINE.frame.y_range},
             "zaxis": {"title": "z (m)", "range": [0, max(6.0, float(np.max(r[:, 2])) + 1.0)]},
             "aspectmode": "data",
         },
         margin={"l": 0, "r": 0, "b": 0, "t": 35},
         legend={"x": 0.01, "y": 0.99},
         title="3D Volleyball Court Simulator",
+        uirevision="court",
     )
     return fig
 
@@ -199,9 +180,9 @@ def main() -> None:
     st.caption("No-aerodynamic ball flight: r(t) = S + v0 t + 0.5 g t^2")
 
     params = get_inputs()
-    v0 = velocity_from_angles(params["speed"], params["theta_deg"], params["phi_deg"])
-    t, r = simulate_trajectory(params["S"], v0, params["t_end"], params["dt"])
-    t_apex, apex = compute_apex(params["S"], v0)
+    v0 = ENGINE.launch_from_angles(params["speed"], params["theta_deg"], params["phi_deg"])
+    t, r = ENGINE.trajectory(params["S"], v0, params["t_end"], params["dt"])
+    t_apex, apex = ENGINE.apex(params["S"], v0)
 
     fig = build_figure(r, apex, params["hnet"])
     st.plotly_chart(fig, use_container_width=True)
@@ -0,0 +1,306 @@
+﻿import numpy as np
+import pytest
+
+from vb3d_sim.core import (
+    BLOCK_DEFAULTS,
+    ENVELOPE_MESH_PARTS,
+    PROGRESSIVE_MIN_NODES,
+    KernelCache,
+    LandingHeatmap,
+    LegalSpikeEnvelope,
+    block_anchor_from_hitter,
+    blocker_positions,
+    cached_legal_spike_envelope,
+    classify_blocked_attacks,
+    classify_blocked_spikes,
+    compute_landing_heatmap,
+    compute_legal_landing_region,
+    envelope_mesh,
+    iter_progressive_envelope,
+)
+from vb3d_sim.envelope_index import ZONES, EnvelopeIndex
+
+P_HIT = np.array([-0.8, 3.8, 3.1])
+
+
+def _assert_same_segments(a, b) -> None:
+    np.testing.assert_array_equal(a.landing, b.landing)
+    np.testing.assert_array_equal(a.cross, b.cross)
+    assert a.cell_area == b.cell_area
+
+
+def _assert_same(env: LegalSpikeEnvelope, fresh: LegalSpikeEnvelope) -> None:
+    _assert_same_segments(env.segments(), fresh.segments())
+    env.refresh()
+    fresh.refresh()
+    np.testing.assert_array_equal(env.envelope_pts, fresh.envelope_pts)
+
+
+def test_incremental_updates_match_a_full_recompute():
+    env = LegalSpikeEnvelope(P_HIT, 2.43, 40, 40, 6)
+    env.refresh()
+    updates = [
+        {"h_net": 2.24},
+        {"P_hit": np.array([-1.2, -2.0, 3.3])},
+        {"k_samples": 12},
+        {"nx": 24},
+        {"ny": 30, "h_net": 2.43},
+        {"P_hit": np.array([-0.4, 4.4, 2.9]), "k_samples": 4},
+        {},
+    ]
+    state = {"P_hit": P_HIT, "h_net": 2.43, "nx": 40, "ny": 40, "k_samples": 6}
+    for change in updates:
+        state.update(change)
+        env.update(**change)
+        _assert_same(env, LegalSpikeEnvelope(**state))
+
+
+def test_only_downstream_stages_rerun():
+    env = LegalSpikeEnvelope(P_HIT, 2.43, 40, 40, 6)
+    env.refresh()
+    assert all(isinstance(v, float) for v in env.timings_us().values())
+
+    env.update(h_net=2.24).refresh()
+    timings = env.timings_us()
+    assert timings["grid"] == timings["crossing"] == "reused"
+    assert all(isinstance(timings[s], float) for s in ("legal", "points", "segments"))
+
+    env.update(k_samples=8).refresh()
+    timings = env.timings_us()
+    assert [s for s, v in timings.items() if v != "reused"] == ["segments"]
+
+    env.update(P_hit=np.array([-1.0, 0.0, 3.0])).refresh(dense=False)
+    timings = env.timings_us()
+    assert timings["grid"] == "reused" and timings["segments"] == "deferred"
+
+
+def test_cached_envelope_reports_the_requested_grid():
+    cache = KernelCache()
+    session = LegalSpikeEnvelope(P_HIT, 2.43, 20, 20, 6)
+    cached_legal_spike_envelope(cache, P_HIT, 2.43, 20, 20, 6, session)
+    cached_legal_spike_envelope(cache, P_HIT, 2.43, 60, 60, 6, session)
+    # Back to 20 x 20: a cache hit, while the session envelope is still at 60 x 60
+    hit = cached_legal_spike_envelope(cache, P_HIT, 2.43, 20, 20, 6, session)
+    assert cache.hits == 1
+    assert hit.cell_area == LegalSpikeEnvelope(P_HIT, 2.43, 20, 20, 6).cell_area()
+
+    progressive = cached_legal_spike_envelope(KernelCache(), P_HIT, 2.43, 80, 80, 6, session, on_level=lambda level: None)
+    assert progressive.cell_area == LegalSpikeEnvelope(P_HIT, 2.43, 80, 80, 6).cell_area()
+
+
+def test_progressive_envelope_matches_the_full_grid():
+    for nx, ny in [(80, 80), (13, 47), (1, 30), (2, 2)]:
+        final = list(iter_progressive_envelope(P_HIT, 2.43, nx, ny))[-1]
+        assert final["final"]
+        _assert_same_segments(final["segments"], LegalSpikeEnvelope(P_HIT, 2.43, nx, ny, 6).segments())
+        if nx * ny >= 80 * 80:
+            assert final["evaluated"] < nx * ny // 4
+
+
+def test_progressive_levels_at_app_grids():
+    # The app's largest grid: the coarse level first, then one push per refinement level
+    shown = []
+    seg = cached_legal_spike_envelope(KernelCache(), P_HIT, 2.43, 80, 80, 6, on_level=shown.append)
+    assert 80 * 80 >= PROGRESSIVE_MIN_NODES
+    assert len(shown) >= 2 and not any(level["final"] for level in shown)
+    assert [level["level"] for level in shown] == list(range(len(shown)))
+    nodes = [level["nodes"][0] * level["nodes"][1] for level in shown]
+    assert nodes == sorted(nodes) and nodes[-1] < 80 * 80
+    assert [level["evaluated"] for level in shown] == sorted(level["evaluated"] for level in shown)
+    assert all(0 < len(level["segments"]) < len(seg) for level in shown)
+
+    # Below the threshold the plain pass runs with no partial levels
+    small = []
+    cached_legal_spike_envelope(KernelCache(), P_HIT, 2.43, 20, 20, 6, on_level=small.append)
+    assert small == []
+
+
+def test_result_rows_are_float64_and_timed_on_a_cold_run():
+    env = LegalSpikeEnvelope(P_HIT, 2.43, 60, 60, 10)
+    cross_pts, landing_pts, envelope_pts = env.result()
+    assert all(isinstance(v, float) for v in env.stage_timings.values())
+    assert cross_pts.dtype == landing_pts.dtype == envelope_pts.dtype == np.float64
+
+    # Float64 baseline straight from the grid, no float32 round trip
+    X, Y = np.meshgrid(np.linspace(0.2, 9.0, 60), np.linspace(-4.5, 4.5, 60))
+    s_star = -P_HIT[0] / (X.ravel() - P_HIT[0])
+    z_cross = P_HIT[2] - s_star * P_HIT[2]
+    y_cross = P_HIT[1] + s_star * (Y.ravel() - P_HIT[1])
+    legal = (s_star > 0) & (s_star < 1) & (np.abs(y_cross) <= 4.5) & (z_cross >= 2.43)
+    np.testing.assert_array_equal(landing_pts[:, :2], np.column_stack([X.ravel()[legal], Y.ravel()[legal]]))
+    np.testing.assert_allclose(cross_pts[:, 1:], np.column_stack([y_cross[legal], z_cross[legal]]), rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(envelope_pts[::10], np.repeat(P_HIT[None, :], len(landing_pts), axis=0))
+    np.testing.assert_allclose(envelope_pts[9::10], landing_pts, rtol=0, atol=1e-12)
+
+
+def test_spike_segments_keep_float32_columns_with_implicit_axes():
+    seg = LegalSpikeEnvelope(P_HIT, 2.43, 60, 60, 0).segments()
+    m = len(seg)
+    for block in (seg.landing, seg.cross):
+        assert block.dtype == np.float32 and block.shape == (2, m) and block.flags.c_contiguous
+    assert seg.nbytes == 16 * m
+
+    # Plotly columns are views; the constant axis is a zero-stride column
+    land, cross = seg.landing_xyz(), seg.cross_xyz()
+    assert np.shares_memory(land["x"], seg.landing) and np.shares_memory(cross["z"], seg.cross)
+    assert land["z"].strides == (0,) and not land["z"].any() and not cross["x"].any()
+    keep = seg.landing_x > 6.0
+    np.testing.assert_array_equal(seg.landing_xyz(keep)["y"], seg.landing_y[keep])
+
+    # Dense points run from P_hit to the landing point, and stay inside the envelope
+    pts = seg.sample(5).reshape(m, 5, 3)
+    np.testing.assert_allclose(pts[:, 0], np.repeat(P_HIT[None, :], m, axis=0), atol=1e-6)
+    np.testing.assert_allclose(pts[:, -1], seg.landing_pts, atol=1e-5)
+    assert seg.contains(pts[:, 1:].reshape(-1, 3).astype(float), tol=1e-5).all()
+    assert seg.contains(seg.landing_pts).all() and seg.contains(P_HIT).all()
+
+
+def test_landing_polygon_area_matches_the_grid_count():
+    rng = np.random.default_rng(5)
+    for _ in range(6):
+        P = np.array([rng.uniform(-3.0, -0.3), rng.uniform(-4.0, 4.0), rng.uniform(2.7, 3.6)])
+        region = compute_legal_landing_region(P, 2.43)
+        poly = region["landing_polygon"][:, :2]
+        perimeter = np.linalg.norm(poly - np.roll(poly, -1, axis=0), axis=1).sum()
+        errors = []
+        for n in (100, 400):
+            seg = LegalSpikeEnvelope(P, 2.43, n, n, 0).segments()
+            errors.append(abs(len(seg) * (seg.cell_area or 0.0) - region["landing_area_m2"]))
+            # Grid samples miss or gain at most a band one cell wide along the boundary
+            assert errors[-1] <= perimeter * 9.0 / (n - 1)
+        assert errors[1] <= errors[0]
+    assert compute_legal_landing_region(np.array([-1.0, 0.0, 2.3]), 2.43)["landing_area_m2"] == 0.0
+
+
+def test_blocker_masks_and_coverage():
+    # One blocker at y = 0: its hands are centred at +-hand_offset, with a gap between them
+    P = np.array([-0.5, 0.0, 3.0])
+    width = BLOCK_DEFAULTS["hands_width"] - BLOCK_DEFAULTS["hand_gap"]
+    hand_offset = BLOCK_DEFAULTS["hand_gap"] / 2.0 + width / 4.0
+    r = 0.5 / 6.5  # spikes to x = 6 cross the net at this fraction of their run
+    landing = np.array([[6.0, y / r, 0.0] for y in (hand_offset, 0.0, -hand_offset, 1.0)])
+    split = classify_blocked_spikes(P, landing, 2.43, np.array([0.0]))
+    assert split["blocked"].tolist() == [True, False, True, False]
+    assert split["coverage"].tolist() == [2]
+    # The same line from high above passes over the hands
+    assert not classify_blocked_spikes(P + [0.0, 0.0, 3.0], landing, 2.43, np.array([0.0]))["blocked"].any()
+
+    # Over a whole envelope: blocked is the union of the single-blocker masks, coverage their sizes
+    landing = LegalSpikeEnvelope(P_HIT, 2.43, 60, 60, 0).segments().landing_pts
+    ys = blocker_positions(P_HIT[1], 3)
+    split = classify_blocked_spikes(P_HIT, landing, 2.43, ys)
+    singles = [classify_blocked_spikes(P_HIT, landing, 2.43, ys[[b]])["blocked"] for b in range(ys.size)]
+    np.testing.assert_array_equal(split["blocked"], np.any(singles, axis=0))
+    np.testing.assert_array_equal(split["free"], ~split["blocked"])
+    assert split["coverage"].tolist() == [int(m.sum()) for m in singles]
+    assert 0 < split["blocked"].sum() < len(landing)
+    assert classify_blocked_spikes(P_HIT, landing, 2.43, np.zeros(0))["free"].all()
+
+
+def test_blocked_attacks_agree_with_per_contact_walls():
+    rng = np.random.default_rng(5)
+    m = 400
+    P = np.column_stack([rng.uniform(-2.5, -0.3, m), rng.uniform(-4.5, 4.5, m), rng.uniform(2.8, 3.4, m)])
+    aim = np.column_stack([rng.uniform(1.0, 9.0, m), rng.uniform(-4.5, 4.5, m)])
+    # Tracks near the antennae exercise the slide back inside the court
+    y_tracks = rng.uniform(-5.0, 5.0, m)
+    for count in (1, 2, 3):
+        batch = classify_blocked_attacks(P, aim, 2.43, y_tracks, count)
+        assert batch["hits"].shape == (m, count)
+        for k in range(m):
+            single = classify_blocked_spikes(P[k], aim[k : k + 1], 2.43, blocker_positions(y_tracks[k], count))
+            assert batch["blocked"][k] == single["blocked"][0]
+            np.testing.assert_array_equal(batch["hits"][k], single["coverage"] > 0)
+        assert 0 < batch["blocked"].sum() < m
+    assert not classify_blocked_attacks(P, aim, 2.43, y_tracks, 0)["blocked"].any()
+
+
+def test_envelope_mesh_is_a_closed_cone_over_the_region():
+    region = compute_legal_landing_region(P_HIT, 2.43)
+    mesh = envelope_mesh(P_HIT, 2.43, region)
+    V, F, part = mesh["vertices"], mesh["faces"], mesh["part"]
+    np.testing.assert_array_equal(V[0], P_HIT)
+    shell = F[part != ENVELOPE_MESH_PARTS.index("net_window")]
+
+    # Every edge of the outer shell is shared by exactly two faces
+    edges = np.sort(np.concatenate([shell[:, [0, 1]], shell[:, [1, 2]], shell[:, [2, 0]]]), axis=1)
+    _, counts = np.unique(edges, axis=0, return_counts=True)
+    assert (counts == 2).all()
+
+    # Outward-oriented: the divergence-theorem volume is the cone's A h / 3
+    tri = V[shell]
+    volume = np.einsum("ij,ij->i", tri[:, 0], np.cross(tri[:, 1], tri[:, 2])).sum() / 6.0
+    assert volume == pytest.approx(region["volume_m3"], rel=1e-12)
+
+    # The internal cut is the net-plane window
+    cut = V[F[part == ENVELOPE_MESH_PARTS.index("net_window")]]
+    np.testing.assert_array_equal(cut[:, :, 0], 0.0)
+    area = 0.5 * np.linalg.norm(np.cross(cut[:, 1] - cut[:, 0], cut[:, 2] - cut[:, 0]), axis=1).sum()
+    assert area == pytest.approx(region["net_window_area_m2"], rel=1e-12)
+
+    assert envelope_mesh(np.array([-1.0, 0.0, 2.3]), 2.43)["faces"].shape == (0, 3)
+
+
+def test_heatmap_halves_merge_and_round_trip(tmp_path):
+    rng = np.random.default_rng(3)
+    P = np.column_stack([rng.uniform(-2.5, -0.3, 12), rng.uniform(-4.0, 4.0, 12), rng.uniform(2.6, 3.4, 12)])
+    w = rng.uniform(0.5, 2.0, 12)
+    whole = compute_landing_heatmap(P, w)
+    # Each contact adds its weight once per legal landing sample of the same grid
+    legal = [len(LegalSpikeEnvelope(p, 2.43, 60, 60, 0).segments().landing_pts) for p in P]
+    assert whole.landing_counts.sum() == pytest.approx(w @ legal)
+    assert whole.net_counts.sum() + whole.net_overflow == pytest.approx(w @ legal)
+
+    # Small batches, then two halves merged, give the same bins
+    merged = LandingHeatmap(max_batch_bytes=1).add(P[:5], w[:5]).merge(compute_landing_heatmap(P[5:], w[5:]))
+    np.testing.assert_allclose(merged.landing_counts, whole.landing_counts, rtol=1e-12)
+    np.testing.assert_allclose(merged.net_counts, whole.net_counts, rtol=1e-12)
+    assert merged.contacts == 12 and merged.weight_total == pytest.approx(w.sum())
+    with pytest.raises(ValueError):
+        merged.merge(LandingHeatmap(landing_bins=(10, 10)))
+
+    whole.save(tmp_path / "h.npz")
+    loaded = LandingHeatmap.load(tmp_path / "h.npz")
+    np.testing.assert_array_equal(loaded.landing_probability(), whole.landing_probability())
+    np.testing.assert_array_equal(loaded.net_distribution(), whole.net_distribution())
+    assert (loaded.contacts, loaded.weight_total) == (whole.contacts, whole.weight_total)
+
+
+def _in_box(pts: np.ndarray, box: tuple) -> bool:
+    (a0, a1), (b0, b1) = box
+    return bool(((pts[:, 0] >= a0) & (pts[:, 0] <= a1) & (pts[:, 1] >= b0) & (pts[:, 1] <= b1)).any())
+
+
+def test_envelope_index_queries_match_brute_force(tmp_path):
+    rng = np.random.default_rng(11)
+    P = np.column_stack([rng.uniform(-3.0, -0.3, 60), rng.uniform(-4.5, 4.5, 60), rng.uniform(2.5, 3.4, 60)])
+    t = rng.uniform(0.5, 1.5, 60)
+    index = EnvelopeIndex()
+    index.insert(P[:25], t[:25])
+    index.insert(P[25:], t[25:])
+    index.save(tmp_path / "idx.npz")
+    index = EnvelopeIndex.load(tmp_path / "idx.npz")
+
+    # Boxes on bin edges (no sample falls on an inner one), so "bin centre inside" is "spike inside"
+    net_window = ((-2.0, 1.0), (2.6, 3.0))
+    for blockers in (0, 2, 3):
+        free = []
+        for p in P:
+            seg = LegalSpikeEnvelope(p, 2.43, 60, 60, 0).segments()
+            ys = blocker_positions(block_anchor_from_hitter(p[1]), blockers)
+            keep = classify_blocked_spikes(p, seg.landing_pts, 2.43, ys)["free"]
+            free.append((seg.landing_pts[keep], seg.cross_pts[keep]))
+        for zone, box in ZONES.items():
+            expected = [i for i, (L, _) in enumerate(free) if _in_box(L[:, :2], box)]
+            assert index.query(zone=zone, blockers=blockers).tolist() == expected
+        expected = [i for i, (_, X) in enumerate(free) if _in_box(X[:, 1:], net_window)]
+        assert 0 < len(expected) < len(P)
+        assert index.query(net_window=net_window, blockers=blockers).tolist() == expected
+
+    # Contact and set-time filters keep exactly the matching contacts of the unfiltered query
+    ids = index.query(zone=1)
+    expected = ids[(P[ids, 0] >= -2.0) & (P[ids, 0] <= -0.5) & (t[ids] >= 0.8) & (t[ids] <= 1.5)]
+    hits = index.query(zone=1, contact_box=((-2.0, -0.5), (-5.0, 5.0), (2.5, 3.4)), t_range=(0.8, 1.5))
+    assert 0 < hits.size < ids.size
+    np.testing.assert_array_equal(hits, expected)
+    np.testing.assert_array_equal(index.entries(hits)["P_hit"], P[hits])
@@ -0,0 +1,27 @@
+﻿import pytest
+
+from vb3d_sim import service
+
+BASE = {"S": [0.0, 0.0, 1.0], "P_hit": [4.0, 0.0, 3.0]}
+TUNE = {"S": [0.0, 0.0, 1.0], "hitter_top": [8.0, 0.0, 3.3]}
+
+
+@pytest.mark.parametrize("op,params", [
+    ("trajectory", {**BASE, "t_hit": 0.55, "t_after": 1e12}),
+    ("trajectory", {**BASE, "t_hit": 1e9}),
+    ("trajectory", {**BASE, "t_hit": 0.0}),
+    ("trajectory", {**BASE, "t_hit": 0.55, "t_after": float("nan")}),
+    ("solve_v0", {**BASE, "t_hit": 0.0}),
+    ("solve_v0", {**BASE, "t_hit": -0.5}),
+    ("solve_v0", {"S": [0.0, 0.0, 1.0], "P_hit": [[4.0, 0.0, 3.0], [4.0, 1.0, 3.0]], "t_hit": [0.5, float("nan")]}),
+    ("auto_tune", {**TUNE, "t_after": -1.0}),
+    ("auto_tune", {**TUNE, "nominal_time": 1e12}),
+])
+def test_flight_times_are_bounded(op, params):
+    with pytest.raises(ValueError, match="must be in"):
+        service.run_op(op, params)
+
+
+def test_trajectory_within_bounds_still_runs():
+    frame = service.run_op("trajectory", {**BASE, "t_hit": 0.55, "t_after": service.MAX_FLIGHT_S})
+    assert isinstance(frame, bytes) and frame
@@ -0,0 +1,54 @@
+﻿import threading
+
+from vb3d_sim.spans import SpanRecorder
+
+
+def test_enabled_flag_is_per_thread():
+    recorder = SpanRecorder()
+    assert not recorder.enabled
+    recorder.enabled = True
+    seen = {}
+
+    def other_session():
+        seen["before"] = recorder.enabled
+        recorder.enabled = False
+        recorder.begin_rerun()
+        with recorder.span("other"):
+            pass
+        seen["frame"] = recorder.end_rerun()
+
+    recorder.begin_rerun()
+    worker = threading.Thread(target=other_session)
+    worker.start()
+    worker.join()
+    with recorder.span("mine"):
+        pass
+    frame = recorder.end_rerun()
+
+    assert seen["before"] is False
+    assert "other" not in seen["frame"]
+    assert recorder.enabled
+    assert "mine" in frame and "other" not in frame
+
+
+def test_disabled_recorder_records_nothing():
+    recorder = SpanRecorder()
+    with recorder.span("kernel"):
+        pass
+    recorder.lap_timer()("stage")
+    assert recorder.summary() == []
+
+
+def test_end_rerun_reports_its_own_duration():
+    class Racing(SpanRecorder):
+        # Another session ends its rerun right after this one records, before end_rerun returns
+        def record(self, name, seconds):
+            super().record(name, seconds)
+            if name == "rerun":
+                super().record("rerun", 1e3)
+
+    recorder = Racing()
+    recorder.enabled = True
+    recorder.begin_rerun()
+    frame = recorder.end_rerun()
+    assert frame["rerun"] < 1e3
@@ -0,0 +1,70 @@
+﻿import numpy as np
+
+from vb3d_sim.store import ResultStore, ResultStoreWriter
+
+FIELDS = ["a", "b"]
+ARRAYS = {"R": 3, "t": 1}
+
+
+def _row(i: int) -> tuple[dict, dict]:
+    n = 3 + i
+    return {"a": float(i), "b": 10.0 * i}, {"R": np.full((n, 3), i, dtype=float), "t": np.arange(n, dtype=float)}
+
+
+def _check(path, count: int) -> None:
+    store = ResultStore(path)
+    assert len(store) == count
+    for i in range(count):
+        params, arrays = _row(i)
+        assert store.param("a")[i] == params["a"]
+        np.testing.assert_array_equal(store.get(i, "R"), arrays["R"])
+        np.testing.assert_array_equal(store.get(i, "t"), arrays["t"])
+
+
+def test_reopened_writer_drops_a_torn_row(tmp_path):
+    writer = ResultStoreWriter(tmp_path, FIELDS, ARRAYS)
+    for i in range(3):
+        writer.append(*_row(i))
+    writer.flush()
+
+    # Crash mid-append: row 3's data (plus half a float) is on disk, its offsets and params are not
+    _, arrays = _row(3)
+    for c, col in enumerate(writer._data["R"]):
+        col.append(arrays["R"][:, c])
+    writer._data["t"][0].fh.write(b"\x01\x02")
+    writer.flush()
+    for col in writer._all_columns():
+        col.fh.close()
+
+    # Readers of the unclosed store see only the complete rows
+    _check(tmp_path, 3)
+
+    with ResultStoreWriter(tmp_path, FIELDS, ARRAYS) as writer:
+        assert writer.count == 3
+        writer.append(*_row(3))
+        writer.append(*_row(4))
+    _check(tmp_path, 5)
+
+
+def test_reopened_writer_drops_a_row_without_params(tmp_path):
+    with ResultStoreWriter(tmp_path, FIELDS, ARRAYS) as writer:
+        writer.append(*_row(0))
+        writer.append(*_row(1))
+
+    # Crash after the offsets of row 2 but before its params
+    writer = ResultStoreWriter(tmp_path, FIELDS, ARRAYS)
+    _, arrays = _row(2)
+    for name, width in ARRAYS.items():
+        arr = arrays[name].reshape(-1, width)
+        for c, col in enumerate(writer._data[name]):
+            col.append(arr[:, c])
+        writer._offsets[name].append([writer._data[name][0].count])
+    writer._params["a"].append([2.0])
+    writer.flush()
+    for col in writer._all_columns():
+        col.fh.close()
+
+    with ResultStoreWriter(tmp_path, FIELDS, ARRAYS) as writer:
+        assert writer.count == 2
+        writer.append(*_row(2))
+    _check(tmp_path, 3)
@@ -0,0 +1,38 @@
+﻿import numpy as np
+
+from vb3d_sim import sweep
+
+AXES = {"y_t": [-3.0, -1.0, 1.0, 3.0], "z_t": [2.8, 3.2]}
+
+
+def _run(scenarios, tmp_path, **kwargs):
+    return sweep.run_sweep(scenarios, tmp_path / "out.jsonl", workers=1, chunk_size=2, **kwargs)
+
+
+def test_resumed_heatmap_recovers_records_written_before_a_crash(tmp_path):
+    scenarios = sweep.build_grid(AXES)
+    _run(scenarios, tmp_path / "ref", heatmap_path=tmp_path / "ref" / "h.npz")
+    ref = sweep.LandingHeatmap.load(tmp_path / "ref" / "h.npz")
+    assert ref.contacts == len(scenarios)
+
+    # First half with the heatmap, then two records whose heatmap save never happened
+    _run(scenarios[:4], tmp_path, heatmap_path=tmp_path / "h.npz")
+    _run(scenarios[4:6], tmp_path)
+    assert sweep.LandingHeatmap.load(tmp_path / "h.npz").contacts == 4
+
+    stats = _run(scenarios, tmp_path, heatmap_path=tmp_path / "h.npz")
+    assert stats["skipped"] == 6
+    merged = sweep.LandingHeatmap.load(tmp_path / "h.npz")
+    assert merged.contacts == len(scenarios)
+    np.testing.assert_allclose(merged.landing_counts, ref.landing_counts)
+    np.testing.assert_allclose(merged.net_counts, ref.net_counts)
+
+
+def test_heatmap_is_saved_as_chunks_finish(tmp_path, monkeypatch):
+    scenarios = sweep.build_grid(AXES)
+    saved = []
+    real_save = sweep._save_heatmap
+    monkeypatch.setattr(sweep, "_save_heatmap", lambda h, p: (saved.append(h.contacts), real_save(h, p)))
+    _run(scenarios, tmp_path, heatmap_path=tmp_path / "h.npz")
+    # Once on start-up, then after every chunk of two
+    assert saved == [0, 2, 4, 6, 8]
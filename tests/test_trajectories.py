@@ -0,0 +1,199 @@
+﻿import numpy as np
+import pytest
+
+from vb3d_sim.core import (
+    SET_LIMITS,
+    ZONE_GREEN_START,
+    TrajectoryColumns,
+    auto_tune_set,
+    compute_flight_events,
+    dome_quality,
+    hitting_window,
+    integrate_trajectories_rk4,
+    iter_trajectory_batches,
+    iter_trajectory_blocks,
+    simulate_trajectories,
+    simulate_trajectories_ragged,
+    simulate_trajectory,
+    solve_v0_from_target,
+)
+
+
+def _launches(n: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    S = np.column_stack([rng.uniform(-6.0, -1.0, n), rng.uniform(-4.0, 4.0, n), rng.uniform(1.8, 2.6, n)])
+    P = np.column_stack([rng.uniform(-2.0, -0.2, n), rng.uniform(-4.5, 4.5, n), rng.uniform(2.6, 3.6, n)])
+    return S, solve_v0_from_target(S, P, rng.uniform(0.3, 1.0, (n, 1)))
+
+
+def test_batched_rows_match_scalar_trajectories():
+    S, v0 = _launches(17)
+    t, R = simulate_trajectories(S, v0, 1.2, 0.01)
+    for i in range(S.shape[0]):
+        t_i, R_i = simulate_trajectory(S[i], v0[i], 1.2, 0.01)
+        np.testing.assert_array_equal(t, t_i)
+        np.testing.assert_array_equal(R[i], R_i)
+
+
+def test_chunking_does_not_change_the_batch():
+    S, v0 = _launches(50)
+    t, R = simulate_trajectories(S, v0, 1.0, 0.02)
+    # A budget of a few rows forces many chunks
+    _, R_small = simulate_trajectories(S, v0, 1.0, 0.02, max_batch_bytes=4 * R[0].nbytes)
+    np.testing.assert_array_equal(R, R_small)
+
+
+def test_batch_stream_matches_the_full_batch():
+    S, v0 = _launches(50)
+    t, R = simulate_trajectories(S, v0, 1.0, 0.02)
+    budget = 4 * R[0].nbytes
+    ends = []
+    for lo, hi, t_b, R_b in iter_trajectory_batches(S, v0, 1.0, 0.02, max_batch_bytes=budget):
+        assert R_b.nbytes <= budget
+        np.testing.assert_array_equal(t_b, t)
+        np.testing.assert_array_equal(R_b, R[lo:hi])
+        ends.append(hi)
+    assert ends[-1] == S.shape[0]
+
+
+def test_ragged_rows_are_prefixes_of_the_batch():
+    S, v0 = _launches(20)
+    _, R = simulate_trajectories(S, v0, 2.0, 0.01)
+    _, flat, offsets = simulate_trajectories_ragged(S, v0, 2.0, 0.01, max_batch_bytes=3 * R[0].nbytes)
+    for i in range(S.shape[0]):
+        rows = flat[offsets[i] : offsets[i + 1]]
+        np.testing.assert_array_equal(rows, R[i, : rows.shape[0]])
+
+
+def test_time_blocks_match_scalar_trajectory():
+    S, v0 = _launches(1)
+    t, R = simulate_trajectory(S[0], v0[0], 1.5, 0.005)
+    blocks = list(iter_trajectory_blocks(S[0], v0[0], 0.005, 1.5, block_size=64, stop_at_floor=False))
+    np.testing.assert_array_equal(np.concatenate([b[0] for b in blocks]), t)
+    np.testing.assert_array_equal(np.concatenate([b[1] for b in blocks]), R)
+
+
+# integrateTrajectoryRK4 (vb3d_three/src/main.js) with air drag and Magnus on, dragStrength
+# 0.012 / magnusStrength 0.0009, run under node with three.js:
+# (S, v0, omega, tEnd, dt, point count, [(index, point), ...])
+JS_RK4_REFERENCE = [
+    (
+        [-6.0, 0.5, 2.2], [7.5, -0.4, 6.8], [0.0, 25.0, 0.0], 1.6, 0.006, 268,
+        [
+            (89, [-2.092138577375081, 0.29240551021425176, 4.331958458457969]),
+            (178, [1.6382459655294834, 0.09465574853341667, 3.5840288459258596]),
+            (267, [5.142321105122537, -0.09241086662303159, 0.12938870197721866]),
+        ],
+    ),
+    (
+        [-4.0, -2.0, 1.0], [11.0, 2.5, 4.0], [-8.0, -30.0, 5.0], 2.0, 0.01, 105,
+        [
+            (35, [-0.2465838998461064, -1.141587718746739, 1.7918214962034544]),
+            (70, [3.336547734025137, -0.3152911275548928, 1.4048685152795513]),
+            (104, [6.673477083217259, 0.4555055261348926, -0.05098165253377569]),
+        ],
+    ),
+    (
+        [-2.0, 3.0, 3.1], [14.0, -3.0, -2.0], [3.0, 40.0, -2.0], 0.5, 0.007, 73,
+        [
+            (24, [0.31680588191116943, 2.50299777918759, 2.6246379140139755]),
+            (48, [2.5636152606525795, 2.0197897761332757, 1.8761346529383447]),
+            (72, [4.689422584556893, 1.5612305600213003, 0.8900276012792917]),
+        ],
+    ),
+]
+
+
+def test_rk4_matches_the_js_integrator():
+    for S, v0, omega, t_end, dt, n, samples in JS_RK4_REFERENCE:
+        _, R, n_samples = integrate_trajectories_rk4(
+            np.array([S]), np.array([v0]), t_end, dt, np.array(omega), drag_strength=0.012, magnus_strength=0.0009
+        )
+        assert n_samples[0] == n
+        for i, point in samples:
+            np.testing.assert_allclose(R[0, i], point, rtol=0, atol=1e-9)
+
+
+def test_flight_events_bracketed_by_dense_samples():
+    S, v0 = _launches(40, seed=3)
+    events = compute_flight_events(S, v0, 2.43)
+    t, R = simulate_trajectories(S, v0, 3.0, 1e-4)
+    rows = np.arange(len(S))
+
+    # Floor and net-plane times fall between the last sample before and the first one past them
+    k = (R[:, :, 2] < 0.0).argmax(axis=1)
+    assert (t[k - 1] < events["t_floor"]).all() and (events["t_floor"] <= t[k]).all()
+    past = R[:, :, 0] >= 0.0
+    crossed = past.any(axis=1)
+    k = past.argmax(axis=1)
+    assert crossed.sum() > 20 and not (events["t_net"][~crossed] <= t[-1]).any()
+    assert (t[k - 1] < events["t_net"])[crossed].all() and (events["t_net"] <= t[k])[crossed].all()
+    airborne = crossed & events["crosses_net"]
+    np.testing.assert_allclose(events["z_net"][airborne], R[rows, k, 2][airborne], rtol=0, atol=2e-3)
+
+    # The apex is the highest sample, and the floor points sit on the floor
+    np.testing.assert_allclose(events["apex"][:, 2], R[:, :, 2].max(axis=1), rtol=0, atol=1e-7)
+    np.testing.assert_array_equal(events["floor_pts"][:, 2], 0.0)
+    assert (events["crosses_net"] == (events["t_net"] <= events["t_floor"])).all()
+
+
+def test_auto_tune_picks_a_feasible_green_contact():
+    S = np.array([-6.0, 1.0, 2.3])
+    window = hitting_window(np.array([-0.6, 0.5, 3.3]))
+    tuned = auto_tune_set(S, window, 0.55, 2.43)
+    assert tuned["ok"]
+
+    # The target is a green contact above the net in the hitter's lane, reached at t_hit
+    inside, q = dome_quality(tuned["target"][None, :], window)
+    assert inside[0] and q[0] >= ZONE_GREEN_START
+    assert tuned["target"][2] >= 2.43 and abs(tuned["target"][1] - window["hitter_y"]) <= 0.8
+    assert 0.35 <= tuned["t_hit"] <= 0.75
+    np.testing.assert_allclose(tuned["v0"], solve_v0_from_target(S, tuned["target"], tuned["t_hit"]), rtol=1e-12)
+    assert SET_LIMITS["speed_min"] <= tuned["speed"] <= SET_LIMITS["speed_max"]
+    assert SET_LIMITS["elev_min_deg"] <= tuned["elevation_deg"] <= SET_LIMITS["elev_max_deg"]
+
+    # Refinement never ends below the best grid candidate
+    assert tuned["objective"] >= auto_tune_set(S, window, 0.55, 2.43, refine_iters=0)["objective"]
+    # A hitter whose whole window is below the net has nothing to aim at
+    assert not auto_tune_set(S, hitting_window(np.array([-0.6, 0.5, 2.4])), 0.55, 2.43)["ok"]
+
+
+def test_time_blocks_stop_at_the_floor_and_reuse_out_buffers():
+    S, v0 = _launches(1, seed=2)
+    t, R = simulate_trajectory(S[0], v0[0], 5.0, 0.005)
+    k = int((R[:, 2] < 0.0).argmax()) + 1
+
+    # t_end=None streams up to and including the first sample below the floor
+    blocks = list(iter_trajectory_blocks(S[0], v0[0], 0.005, block_size=64))
+    assert all(len(b[0]) <= 64 for b in blocks)
+    np.testing.assert_array_equal(np.concatenate([b[1] for b in blocks]), R[:k])
+
+    # With out=, every block is a view into the caller's buffers, sized by them
+    out = (np.empty(50), np.empty((50, 3)))
+    copies = []
+    for t_block, R_block in iter_trajectory_blocks(S[0], v0[0], 0.005, out=out):
+        assert np.shares_memory(t_block, out[0]) and np.shares_memory(R_block, out[1])
+        assert len(t_block) <= 50
+        copies.append((t_block.copy(), R_block.copy()))
+    np.testing.assert_array_equal(np.concatenate([c[0] for c in copies]), t[:k])
+    np.testing.assert_array_equal(np.concatenate([c[1] for c in copies]), R[:k])
+
+    with pytest.raises(ValueError):
+        next(iter_trajectory_blocks(S[0], v0[0], 0.005, stop_at_floor=False))
+
+
+def test_trajectory_columns_are_float32_views_of_the_flight():
+    S, v0 = _launches(1, seed=4)
+    t, R = simulate_trajectory(S[0], v0[0], 1.5, 0.005)
+    cols = TrajectoryColumns.simulate(S[0], v0[0], 1.5, 0.005)
+    assert cols.xyz.dtype == np.float32 and cols.xyz.flags.c_contiguous and cols.nbytes == 12 * len(t)
+    np.testing.assert_array_equal(cols.t, t)
+    np.testing.assert_array_equal(cols.R, R.astype(np.float32))
+    assert np.shares_memory(cols.R, cols.xyz) and np.shares_memory(cols.plotly()["z"], cols.xyz)
+
+    # Split points are slices: k samples up to and including t_k
+    k = cols.index_after(t[100])
+    assert k == 101 and cols.index_after(t[100] - 1e-6) == 100
+    np.testing.assert_array_equal(cols.plotly(slice(k, None))["x"], cols.xyz[0, k:])
+    with pytest.raises(ValueError):
+        TrajectoryColumns.from_arrays(t ** 2, R)
@@ -0,0 +1,2 @@
+﻿# Physics kernels and tools for the volleyball simulator. Scripts run as package modules from the
+# repository root (python -m vb3d_sim.sweep); the Streamlit UI through vb3d_sim_app.py.
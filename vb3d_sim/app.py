@@ -1,36 +1,51 @@
-﻿import numpy as np
+﻿import time
+
+import numpy as np
 import plotly.graph_objects as go
 import streamlit as st
 
-# =========================
-# Constants / Coordinates
-# =========================
-# Origin: net center
-# x: -9 (our endline) -> +9 (opponent endline)
-# y: -4.5 (left sideline) -> +4.5 (right sideline)
-# z: vertical
-X_MIN, X_MAX = -9.0, 9.0
-Y_MIN, Y_MAX = -4.5, 4.5
-Z_MIN, Z_MAX = 0.0, 5.0
-
-COURT_LENGTH = 18.0
-COURT_WIDTH = 9.0
-ATTACK_LINE_X = 3.0
-
-NET_HEIGHTS = {"Men (2.43m)": 2.43, "Women (2.24m)": 2.24}
-POLE_OFFSET = 0.5
-POLE_HEIGHT = 2.55
-ANTENNA_ABOVE_NET = 0.8
-
-G = 9.81
-G_VEC = np.array([0.0, 0.0, -G], dtype=float)
-
-AXIS_RANGES = {
-    "x": [X_MIN, X_MAX],
-    "y": [Y_MIN, Y_MAX],
-    "z": [Z_MIN, Z_MAX],
-}
-ASPECT_RATIO = {"x": 18, "y": 9, "z": 5}
+from .core import (
+    ANTENNA_ABOVE_NET,
+    ASPECT_RATIO,
+    ATTACK_LINE_X,
+    AXIS_RANGES,
+    G_VEC,
+    NET_CENTERED,
+    NET_HEIGHTS,
+    POLE_HEIGHT,
+    PROGRESSIVE_MIN_NODES,
+    Y_MAX,
+    Y_MIN,
+    FlightEngine,
+    KernelCache,
+    LandingHeatmap,
+    LegalSpikeEnvelope,
+    auto_tune_set,
+    block_anchor_from_hitter,
+    blocker_positions,
+    cached_legal_spike_envelope,
+    cached_trajectory,
+    classify_blocked_spikes,
+    compute_landing_heatmap,
+    compute_legal_landing_region,
+    decimation_indices,
+    envelope_mesh,
+    hitting_window,
+    simplify_polyline,
+    validate_scene_config,
+    velocity_at,
+)
+from .spans import RECORDER
+
+# Streamlit UI over core.py:  streamlit run vb3d_sim_app.py
+ENGINE = FlightEngine(NET_CENTERED)
+
+# Display-side decimation of dynamic traces
+DISPLAY_POINT_BUDGET = 6000
+TRAJECTORY_TOLERANCE_M = 0.005
+
+# Contacts sampled around P_hit for the landing heatmap
+HEATMAP_CONTACTS = 2000
 
 CAMERA_BROADCAST = {
     "eye": {"x": 1.8, "y": 1.25, "z": 0.85},
@@ -38,6 +53,15 @@ CAMERA_BROADCAST = {
     "up": {"x": 0.0, "y": 0.0, "z": 1.0},
 }
 
+SCENE_CONFIG = {
+    "xaxis": {"title": "x (m)", "range": AXIS_RANGES["x"]},
+    "yaxis": {"title": "y (m)", "range": AXIS_RANGES["y"]},
+    "zaxis": {"title": "z (m)", "range": AXIS_RANGES["z"]},
+    "aspectmode": "manual",
+    "aspectratio": ASPECT_RATIO,
+    "camera": CAMERA_BROADCAST,
+}
+
 
 def draw_court(fig: go.Figure) -> None:
     corners = np.array(
@@ -147,91 +171,123 @@ def draw_net(fig: go.Figure, h_net: float) -> None:
         )
 
 
-def solve_v0_from_target(S: np.ndarray, P_hit: np.ndarray, t_hit: float) -> np.ndarray:
-    return (P_hit - S - 0.5 * G_VEC * (t_hit**2)) / t_hit
-
-
-def simulate_trajectory(S: np.ndarray, v0: np.ndarray, t_end: float, dt: float) -> tuple[np.ndarray, np.ndarray]:
-    t = np.arange(0.0, t_end + dt, dt)
-    R = S[None, :] + v0[None, :] * t[:, None] + 0.5 * G_VEC[None, :] * (t[:, None] ** 2)
-    return t, R
-
-
-def velocity_at(v0: np.ndarray, t: float) -> np.ndarray:
-    return v0 + G_VEC * t
+@st.cache_resource
+def static_scene_traces(h_net: float) -> tuple:
+    # Court and net never change for a given net height; build and validate them once
+    fig = go.Figure()
+    draw_court(fig)
+    draw_net(fig, h_net)
+    return fig.data
 
 
-def compute_legal_spike_envelope(
-    P_hit: np.ndarray,
-    h_net: float,
-    nx: int,
-    ny: int,
-    k_samples: int,
-) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
-    x_hit, y_hit, z_hit = P_hit
+@st.cache_resource
+def static_scene_kb(h_net: float) -> float:
+    # Serialized size of the static traces; st.plotly_chart has no partial updates, so every
+    # rerun resends them inside the full figure even though building them is cached
+    return len(go.Figure(data=static_scene_traces(h_net)).to_json()) / 1024
 
-    xL_vals = np.linspace(0.2, 9.0, nx)
-    yL_vals = np.linspace(-4.5, 4.5, ny)
-    Xg, Yg = np.meshgrid(xL_vals, yL_vals, indexing="xy")
 
-    xL = Xg.ravel()
-    yL = Yg.ravel()
+def _xyz(P: np.ndarray) -> dict:
+    # float32 halves the binary-encoded payload; sub-micron error at court scale
+    P = np.asarray(P, dtype=np.float32)
+    return {"x": P[:, 0], "y": P[:, 1], "z": P[:, 2]}
 
-    denom = xL - x_hit
-    safe = np.abs(denom) > 1e-10
 
-    s_star = np.empty_like(denom)
-    s_star.fill(np.nan)
-    s_star[safe] = (0.0 - x_hit) / denom[safe]
-
-    y_cross = y_hit + s_star * (yL - y_hit)
-    z_cross = z_hit + s_star * (0.0 - z_hit)
-
-    legal = (
-        safe
-        & (s_star > 0.0)
-        & (s_star < 1.0)
-        & (z_cross >= h_net)
-        & (y_cross >= -4.5)
-        & (y_cross <= 4.5)
+def envelope_preview_figure(level: dict, P_hit: np.ndarray, h_net: float, k_samples: int) -> go.Figure:
+    # Court, contact and one partial level of the progressive envelope; k_samples=0 skips the cloud
+    seg = level["segments"]
+    fig = go.Figure(data=static_scene_traces(h_net))
+    fig.add_trace(
+        go.Scatter3d(
+            x=[P_hit[0]],
+            y=[P_hit[1]],
+            z=[P_hit[2]],
+            mode="markers",
+            marker={"size": 14, "color": "#ff1744", "symbol": "diamond"},
+            name="Contact P_hit",
+        )
+    )
+    if len(seg) > 0:
+        fig.add_trace(
+            go.Scatter3d(
+                **seg.cross_xyz(),
+                mode="markers",
+                marker={"size": 3, "color": "#ff7043", "opacity": 0.8},
+                name="Legal net crossings (coarse)",
+            )
+        )
+        if k_samples > 0:
+            fig.add_trace(
+                go.Scatter3d(
+                    **_xyz(seg.sample(k_samples)),
+                    mode="markers",
+                    marker={"size": 2, "color": "#26a69a", "opacity": 0.15},
+                    name="Legal spike envelope (coarse)",
+                )
+            )
+    nodes_x, nodes_y = level["nodes"]
+    fig.update_layout(
+        scene=SCENE_CONFIG,
+        margin={"l": 0, "r": 0, "t": 30, "b": 0},
+        height=800,
+        legend={"x": 0.01, "y": 0.99},
+        title=f"Refining envelope: level {level['level']} ({nodes_x}x{nodes_y} nodes)",
+        uirevision="court",
+    )
+    return fig
+
+
+@st.cache_resource(max_entries=32)
+def contact_spread_heatmap(P_hit: tuple, h_net: float, spread: float, nx: int, ny: int) -> LandingHeatmap:
+    # Hitter's contact scatter: Gaussian around P_hit, half as wide vertically
+    rng = np.random.default_rng(0)
+    P = np.array(P_hit) + rng.normal(0.0, 1.0, (HEATMAP_CONTACTS, 3)) * np.array([spread, spread, spread / 2])
+    P[:, 0] = np.minimum(P[:, 0], -0.05)
+    return compute_landing_heatmap(P, h_net=h_net, nx=nx, ny=ny)
+
+
+def heatmap_figures(heatmap: LandingHeatmap) -> tuple[go.Figure, go.Figure]:
+    def centres(edges: np.ndarray) -> np.ndarray:
+        return 0.5 * (edges[:-1] + edges[1:])
+
+    landing = go.Figure(
+        go.Heatmap(
+            x=centres(heatmap.landing_x_edges),
+            y=centres(heatmap.landing_y_edges),
+            z=heatmap.landing_probability().T,
+            zmin=0.0,
+            zmax=1.0,
+            colorscale="Viridis",
+            colorbar={"title": "P(legal)"},
+        )
+    )
+    landing.update_layout(
+        title="Legal landing probability", xaxis_title="x (m)", yaxis_title="y (m)", height=380, yaxis_scaleanchor="x"
+    )
+    net = go.Figure(
+        go.Heatmap(
+            x=centres(heatmap.net_y_edges),
+            y=centres(heatmap.net_z_edges),
+            z=heatmap.net_distribution().T,
+            colorscale="Magma",
+            colorbar={"title": "share"},
+        )
     )
+    net.update_layout(title="Net crossings", xaxis_title="y (m)", yaxis_title="z (m)", height=380)
+    return landing, net
 
-    landing_pts = np.zeros((legal.sum(), 3), dtype=float)
-    landing_pts[:, 0] = xL[legal]
-    landing_pts[:, 1] = yL[legal]
-    landing_pts[:, 2] = 0.0
-
-    cross_pts = np.zeros((legal.sum(), 3), dtype=float)
-    cross_pts[:, 0] = 0.0
-    cross_pts[:, 1] = y_cross[legal]
-    cross_pts[:, 2] = z_cross[legal]
-
-    if landing_pts.shape[0] == 0:
-        return cross_pts, landing_pts, np.zeros((0, 3), dtype=float)
-
-    s = np.linspace(0.0, 1.0, k_samples)
-    d = landing_pts - P_hit[None, :]
-    seg = P_hit[None, None, :] + s[None, :, None] * d[:, None, :]
-    envelope_pts = seg.reshape(-1, 3)
-    return cross_pts, landing_pts, envelope_pts
-
-
-def validate_scene_config(scene_cfg: dict) -> tuple[bool, str]:
-    try:
-        assert scene_cfg["aspectmode"] == "manual"
-        assert list(scene_cfg["xaxis"]["range"]) == AXIS_RANGES["x"]
-        assert list(scene_cfg["yaxis"]["range"]) == AXIS_RANGES["y"]
-        assert list(scene_cfg["zaxis"]["range"]) == AXIS_RANGES["z"]
-        ar = scene_cfg["aspectratio"]
-        assert ar["x"] == ASPECT_RATIO["x"]
-        assert ar["y"] == ASPECT_RATIO["y"]
-        assert ar["z"] == ASPECT_RATIO["z"]
-        return True, "Scene scale config OK"
-    except AssertionError as exc:
-        return False, f"Scene scale config FAILED: {exc}"
+
+@st.cache_resource
+def get_kernel_cache() -> KernelCache:
+    return KernelCache()
 
 
 def main() -> None:
+    # Per session: the flag only covers this rerun's script thread
+    RECORDER.enabled = st.session_state.get("record_spans", RECORDER.default_enabled)
+    if RECORDER.enabled:
+        RECORDER.begin_rerun()
+    lap = RECORDER.lap_timer()
     st.set_page_config(layout="wide")
     st.title("3D Volleyball Simulator: Set-to-Contact + Legal Spike Envelope")
 
@@ -256,6 +312,7 @@ def main() -> None:
         P_hit = np.array([x_t, y_t, z_t], dtype=float)
 
         t_hit = st.slider("t_hit (s)", 0.15, 2.0, 0.55, 0.01)
+        auto_tune = st.checkbox("Auto-tune set to hitting window at P_hit", value=False)
 
         st.markdown("### Simulation / Envelope")
         t_after = st.slider("extra time after hit (s)", 0.0, 1.0, 0.3, 0.05)
@@ -267,18 +324,50 @@ def main() -> None:
         k_samples = st.slider("Envelope K (points per spike)", 4, 16, 10, 1)
 
         show_envelope = st.checkbox("Show legal spike 3D envelope", value=True)
-        show_hull = st.checkbox("Show optional hull mesh (slow)", value=False)
+        show_hull = st.checkbox("Show envelope surface mesh", value=False)
+        progressive = st.checkbox(
+            "Progressive envelope (coarse levels first)",
+            value=False,
+            disabled=nx * ny < PROGRESSIVE_MIN_NODES,
+            help=f"Draws the coarse envelope, then each refinement level, on grids of {PROGRESSIVE_MIN_NODES:,}+ samples",
+        )
+        point_budget = st.slider("Max points per plotted cloud", 1000, 40000, DISPLAY_POINT_BUDGET, 1000)
+        traj_tol_mm = st.select_slider(
+            "Trajectory simplification tolerance (mm)", options=[0, 1, 2, 5, 10, 20], value=int(TRAJECTORY_TOLERANCE_M * 1000)
+        )
 
-    with right:
-        v0 = solve_v0_from_target(S, P_hit, t_hit)
-        t, R = simulate_trajectory(S, v0, t_end, dt)
+        st.markdown("### Block")
+        blocker_count = st.selectbox("Blockers", [0, 1, 2, 3], index=0)
 
-        # Set segment: 0..t_hit
-        set_mask = t <= (t_hit + 1e-9)
-        R_set = R[set_mask]
+        st.markdown("### Landing heatmap")
+        show_heatmap = st.checkbox("Show landing heatmap over contact spread", value=False)
+        contact_spread = st.slider("Contact spread (m)", 0.05, 1.0, 0.3, 0.05)
+
+        st.markdown("### Debug")
+        st.checkbox("Record timing spans", value=RECORDER.default_enabled, key="record_spans")
+
+    lap("main.controls")
+    with right:
+        cache = get_kernel_cache()
+        # Progressive mode draws the chart first so coarse envelope levels show up immediately
+        chart_slot = st.empty() if progressive and nx * ny >= PROGRESSIVE_MIN_NODES else None
+        tuned = None
+        if auto_tune:
+            # P_hit is the hitter's top reach; the tuned contact lands on the green shell in front
+            tuned = auto_tune_set(S, hitting_window(P_hit), t_hit, h_net)
+            if tuned["ok"]:
+                P_hit, t_hit = tuned["target"], tuned["t_hit"]
+                t_end = t_hit + t_after
+        v0 = ENGINE.launch_to_target(S, P_hit, t_hit)
+        traj = cached_trajectory(cache, S, v0, t_end, dt)
+
+        # Set segment: 0..t_hit, as views of the cached columns
+        n_set = traj.index_after(t_hit)
+        R_set = traj.R[:n_set]
+        set_events = ENGINE.flight_events(S, v0, h_net)
 
         # Required constraint: stay on our side unless user sets x_t >= 0
-        set_crosses_net = bool(np.any(R_set[:, 0] >= 0.0))
+        set_crosses_net = bool(set_events["t_net"][0] <= t_hit + 1e-9)
         set_constraint_ok = True
         set_constraint_msg = ""
         if x_t < 0.0:
@@ -290,32 +379,84 @@ def main() -> None:
 
         p_hit_curve = S + v0 * t_hit + 0.5 * G_VEC * (t_hit**2)
         v_hit = velocity_at(v0, t_hit)
+        lap("main.physics")
+
+        if "spike_envelope" not in st.session_state:
+            st.session_state["spike_envelope"] = LegalSpikeEnvelope(P_hit, h_net, nx, ny, k_samples)
+        envelope = st.session_state["spike_envelope"]
+        misses_before = cache.misses
+        levels = []
+
+        def show_level(level: dict) -> None:
+            levels.append(level)
+            chart_slot.plotly_chart(
+                envelope_preview_figure(level, P_hit, h_net, k_samples if show_envelope else 0), use_container_width=True
+            )
 
-        cross_pts, landing_pts, env_pts = compute_legal_spike_envelope(P_hit, h_net, nx, ny, k_samples)
+        segments = cached_legal_spike_envelope(
+            cache, P_hit, h_net, nx, ny, k_samples, envelope, on_level=show_level if chart_slot is not None else None
+        )
+        # Dense envelope cloud only when a trace is going to draw it
+        env_pts = segments.sample(k_samples) if show_envelope else np.zeros((0, 3), dtype=np.float32)
+        lap("main.envelope")
 
         st.subheader("Debug / Validation")
         st.write(f"Axis ranges (x,y,z): {AXIS_RANGES}")
         st.write(f"Aspect mode: manual")
         st.write(f"Aspect ratio: {ASPECT_RATIO}")
         st.write(f"Set crosses net before t_hit: {set_crosses_net}")
-        st.write(f"Legal spikes count: {landing_pts.shape[0]}")
-        st.write(f"Envelope point count: {env_pts.shape[0]}")
+        st.write(f"Legal spikes count: {len(segments)}")
+        st.write(f"Envelope point count: {segments.point_count(k_samples)} (materialized: {env_pts.shape[0]})")
+        st.write(f"Envelope metrics: {segments.metrics()}")
+        if blocker_count > 0:
+            blocker_ys = blocker_positions(block_anchor_from_hitter(P_hit[1]), blocker_count)
+            split = classify_blocked_spikes(P_hit, segments.landing.T, h_net, blocker_ys)
+            st.write(
+                f"Blocked spikes: {int(split['blocked'].sum())} / {len(segments)} "
+                f"(per blocker: {split['coverage'].tolist()})"
+            )
+        st.write(f"Kernel cache: {cache.stats()}")
+        if levels:
+            st.write(
+                "Progressive levels (nodes, open cells, points tested): "
+                f"{[(lv['nodes'], lv['open_cells'], lv['evaluated']) for lv in levels]}"
+            )
+        elif cache.misses > misses_before:
+            st.write(f"Envelope stage timings (us): {envelope.timings_us()}")
+        payload_slot = st.empty()
+        timing_slot = st.empty()
 
         st.subheader("Set Metrics")
+        if tuned is not None and not tuned["ok"]:
+            st.warning(f"Auto-tune: {tuned['reason']}")
+        elif tuned is not None:
+            st.write(
+                f"Auto-tune: speed {tuned['speed']:.2f} m/s, elevation {tuned['elevation_deg']:.1f} deg, "
+                f"green time {tuned['green_time']:.3f} s ({tuned['candidates']} candidates)"
+            )
         st.write(f"Target Contact P_hit = ({P_hit[0]:.3f}, {P_hit[1]:.3f}, {P_hit[2]:.3f})")
         st.write(f"Trajectory at t_hit = ({p_hit_curve[0]:.3f}, {p_hit_curve[1]:.3f}, {p_hit_curve[2]:.3f})")
         st.write(f"|v(t_hit)| = {np.linalg.norm(v_hit):.3f} m/s")
         st.write(f"Flight time = t_hit = {t_hit:.3f} s")
+        st.write(
+            f"Set apex z = {set_events['apex'][0, 2]:.3f} m at t = {set_events['t_apex'][0]:.3f} s, "
+            f"floor contact at t = {set_events['t_floor'][0]:.3f} s"
+        )
 
-        fig = go.Figure()
-        draw_court(fig)
-        draw_net(fig, h_net)
-
-        fig.add_trace(
+        lap("main.metrics")
+        t_fig = time.perf_counter()
+        traj_tol = traj_tol_mm / 1000.0
+        points_full = 0
+        points_sent = 0
+        # Dynamic traces only; the static court / net traces are prepended from the cache
+        dyn = go.Figure()
+
+        keep = simplify_polyline(R_set, traj_tol)
+        points_full += R_set.shape[0]
+        points_sent += keep.size
+        dyn.add_trace(
             go.Scatter3d(
-                x=R_set[:, 0],
-                y=R_set[:, 1],
-                z=R_set[:, 2],
+                **_xyz(R_set[keep]),
                 mode="lines",
                 line={"color": "#ff8c00", "width": 6},
                 name="Set trajectory (0..t_hit)",
@@ -323,20 +464,21 @@ def main() -> None:
         )
 
         if t_after > 0:
-            R_after = R[~set_mask]
+            R_after = traj.R[n_set:]
             if R_after.shape[0] > 1:
-                fig.add_trace(
+                keep = simplify_polyline(R_after, traj_tol)
+                points_full += R_after.shape[0]
+                points_sent += keep.size
+                dyn.add_trace(
                     go.Scatter3d(
-                        x=R_after[:, 0],
-                        y=R_after[:, 1],
-                        z=R_after[:, 2],
+                        **_xyz(R_after[keep]),
                         mode="lines",
                         line={"color": "#ffb870", "width": 3, "dash": "dot"},
                         name="Post-hit extrapolation",
                     )
                 )
 
-        fig.add_trace(
+        dyn.add_trace(
             go.Scatter3d(
                 x=[S[0]],
                 y=[S[1]],
@@ -348,7 +490,7 @@ def main() -> None:
         )
 
         # Contact point highlight (required)
-        fig.add_trace(
+        dyn.add_trace(
             go.Scatter3d(
                 x=[P_hit[0]],
                 y=[P_hit[1]],
@@ -362,7 +504,7 @@ def main() -> None:
         )
 
         # Ball at t_hit (same point, larger)
-        fig.add_trace(
+        dyn.add_trace(
             go.Scatter3d(
                 x=[p_hit_curve[0]],
                 y=[p_hit_curve[1]],
@@ -374,16 +516,18 @@ def main() -> None:
         )
 
         # Net-plane legal crossing points
-        if cross_pts.shape[0] > 0:
-            fig.add_trace(
+        if len(segments) > 0:
+            keep = decimation_indices(len(segments), point_budget)
+            points_full += len(segments)
+            points_sent += keep.size
+            cross_shown = segments.cross_xyz(None if keep.size == len(segments) else keep)
+            dyn.add_trace(
                 go.Scatter3d(
-                    x=cross_pts[:, 0],
-                    y=cross_pts[:, 1],
-                    z=cross_pts[:, 2],
+                    **cross_shown,
                     mode="markers",
                     marker={
                         "size": 2,
-                        "color": cross_pts[:, 2],
+                        "color": cross_shown["z"],
                         "colorscale": "Turbo",
                         "opacity": 0.8,
                         "cmin": h_net,
@@ -394,17 +538,34 @@ def main() -> None:
                 )
             )
 
+        # Exact legal landing region outline on the floor
+        region = compute_legal_landing_region(P_hit, h_net)
+        if region["landing_polygon"].shape[0] > 0:
+            outline = np.vstack([region["landing_polygon"], region["landing_polygon"][:1]])
+            dyn.add_trace(
+                go.Scatter3d(
+                    x=outline[:, 0],
+                    y=outline[:, 1],
+                    z=outline[:, 2],
+                    mode="lines",
+                    line={"color": "#26a69a", "width": 4},
+                    name="Legal landing region",
+                )
+            )
+
         # 3D envelope shape as translucent point cloud volume
         if show_envelope and env_pts.shape[0] > 0:
-            fig.add_trace(
+            keep = decimation_indices(env_pts.shape[0], point_budget)
+            points_full += env_pts.shape[0]
+            points_sent += keep.size
+            env_shown = env_pts if keep.size == env_pts.shape[0] else env_pts[keep]
+            dyn.add_trace(
                 go.Scatter3d(
-                    x=env_pts[:, 0],
-                    y=env_pts[:, 1],
-                    z=env_pts[:, 2],
+                    **_xyz(env_shown),
                     mode="markers",
                     marker={
                         "size": 1.6,
-                        "color": env_pts[:, 0],
+                        "color": env_shown[:, 0],
                         "colorscale": "Viridis",
                         "opacity": 0.08,
                         "showscale": False,
@@ -413,33 +574,41 @@ def main() -> None:
                 )
             )
 
-        if show_hull and env_pts.shape[0] > 100:
-            fig.add_trace(
+        # Exact envelope boundary, built server-side from the landing polygon
+        mesh = envelope_mesh(P_hit, h_net, region) if show_hull else None
+        if mesh is not None and mesh["faces"].shape[0] > 0:
+            dyn.add_trace(
                 go.Mesh3d(
-                    x=env_pts[:, 0],
-                    y=env_pts[:, 1],
-                    z=env_pts[:, 2],
-                    alphahull=6,
+                    **_xyz(mesh["vertices"]),
+                    i=mesh["faces"][:, 0],
+                    j=mesh["faces"][:, 1],
+                    k=mesh["faces"][:, 2],
                     opacity=0.12,
                     color="#26a69a",
                     name="Envelope hull",
                 )
             )
 
-        scene_cfg = {
-            "xaxis": {"title": "x (m)", "range": AXIS_RANGES["x"]},
-            "yaxis": {"title": "y (m)", "range": AXIS_RANGES["y"]},
-            "zaxis": {"title": "z (m)", "range": AXIS_RANGES["z"]},
-            "aspectmode": "manual",
-            "aspectratio": ASPECT_RATIO,
-            "camera": CAMERA_BROADCAST,
-        }
+        scene_cfg = dict(SCENE_CONFIG)
 
+        fig = go.Figure(data=static_scene_traces(h_net) + dyn.data)
         fig.update_layout(
             scene=scene_cfg,
             margin={"l": 0, "r": 0, "t": 10, "b": 0},
             height=800,
             legend={"x": 0.01, "y": 0.99},
+            # Keep the user's camera across reruns
+            uirevision="court",
+        )
+        t_fig = time.perf_counter() - t_fig
+        lap("main.figure_build")
+        payload_kb = len(fig.to_json()) / 1024
+        lap("main.figure_serialize")
+        static_kb = static_scene_kb(h_net)
+        payload_slot.write(
+            f"Figure payload: {payload_kb:.0f} KB per rerun, of which static court / net {static_kb:.0f} KB "
+            f"(resent: Streamlit replaces the whole figure) and dynamic {payload_kb - static_kb:.0f} KB; "
+            f"dynamic points sent {points_sent} of {points_full}, built in {t_fig * 1e3:.1f} ms"
         )
 
         scene_ok, scene_msg = validate_scene_config(scene_cfg)
@@ -448,8 +617,21 @@ def main() -> None:
         if not set_constraint_ok:
             st.warning(set_constraint_msg)
 
-        st.plotly_chart(fig, use_container_width=True)
-
-
-if __name__ == "__main__":
-    main()
+        (chart_slot or st).plotly_chart(fig, use_container_width=True, key="court_figure")
+        lap("main.plotly_chart")
+
+        if show_heatmap:
+            heatmap = contact_spread_heatmap(tuple(P_hit), h_net, contact_spread, nx, ny)
+            st.subheader(f"Landing heatmap ({heatmap.contacts} contacts around P_hit)")
+            landing_fig, net_fig = heatmap_figures(heatmap)
+            col_landing, col_net = st.columns(2)
+            col_landing.plotly_chart(landing_fig, use_container_width=True, key="landing_heatmap")
+            col_net.plotly_chart(net_fig, use_container_width=True, key="net_heatmap")
+            lap("main.heatmap")
+
+        if RECORDER.enabled:
+            rerun_ms = RECORDER.end_rerun()
+            with timing_slot.container():
+                st.write(f"Rerun spans (ms): {rerun_ms}")
+                st.write("Rolling span histogram (this process):")
+                st.table(RECORDER.summary())
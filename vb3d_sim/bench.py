@@ -0,0 +1,328 @@
+﻿import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from .core import (
+    compute_apex,
+    compute_flight_events,
+    compute_landing_heatmap,
+    compute_legal_spike_envelope,
+    iter_progressive_envelope,
+    iter_trajectory_batches,
+    simulate_trajectories,
+    simulate_trajectory,
+    solve_v0_from_target,
+    velocity_from_angles,
+)
+
+# Kernel benchmarks with baseline comparison:
+#   python -m vb3d_sim.bench --out bench.json
+#   python -m vb3d_sim.bench --out new.json --baseline bench.json --threshold 0.2
+# Each case records per-call wall time (min / median / mean over --repeat samples, each sample
+# looping the call until it takes MIN_SAMPLE_S), plus tracemalloc peak bytes and the bytes / blocks
+# allocated during the call and still live when it returns (live_bytes / live_blocks; tracemalloc
+# has no count of allocations made). Exit status is 1 when a case regresses past the threshold.
+
+ROOT_APP = Path(__file__).resolve().parent.parent / "app.py"
+SIM_APP = Path(__file__).resolve().parent.parent / "vb3d_sim_app.py"
+MIN_SAMPLE_S = 0.02
+S_DEFAULT = np.array([-3.0, 0.0, 2.3])
+P_HIT_DEFAULT = np.array([-0.8, 3.8, 3.1])
+T_HIT_DEFAULT = 0.55
+H_NET = 2.43
+
+DT_SIZES = (0.005, 0.01, 0.02, 0.05, 0.1)
+GRID_SIZES = (20, 40, 60, 80)
+K_SIZES = (4, 10, 16)
+BATCH_SIZES = (1, 100, 10_000, 1_000_000)
+QUICK_BATCH_SIZES = (1, 100, 10_000)
+HEATMAP_SIZES = (100, 10_000)
+STREAM_BATCH_BYTES = 8 * 1024 * 1024
+
+
+def _random_contacts(n: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    P = np.column_stack([rng.uniform(-2.0, -0.2, n), rng.uniform(-4.5, 4.5, n), rng.uniform(2.6, 3.6, n)])
+    return P, rng.uniform(0.3, 1.0, (n, 1))
+
+
+def _apptest_rerun(script: Path, widgets: dict | None = None, cold: bool = False):
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    # The root app's keyed-default slider warns on every rerun; keep the report readable
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    at = AppTest.from_file(str(script), default_timeout=600)
+    at.run()
+    for label, value in (widgets or {}).items():
+        for group in (at.slider, at.select_slider, at.checkbox, at.selectbox):
+            match = [w for w in group if w.label == label]
+            if match:
+                match[0].set_value(value)
+                break
+        else:
+            raise KeyError(f"No widget labelled {label!r} in {script.name}")
+    at.run()
+
+    def rerun():
+        if cold:
+            st.cache_resource.clear()
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+    return rerun
+
+
+def build_cases(quick: bool = False) -> list[dict]:
+    # Each case: name, kernel, params, setup() -> zero-argument callable
+    cases = []
+    for dt in DT_SIZES:
+        cases.append(
+            {
+                "name": f"simulate_trajectory[dt={dt}]",
+                "kernel": "simulate_trajectory",
+                "params": {"dt": dt, "t_end": 1.2},
+                "setup": lambda dt=dt: (
+                    lambda: simulate_trajectory(
+                        S_DEFAULT, solve_v0_from_target(S_DEFAULT, P_HIT_DEFAULT, T_HIT_DEFAULT), 1.2, dt
+                    )
+                ),
+            }
+        )
+
+    batches = QUICK_BATCH_SIZES if quick else BATCH_SIZES
+    for n in batches:
+
+        def setup_v0(n=n):
+            P, t = _random_contacts(n)
+            return lambda: solve_v0_from_target(S_DEFAULT, P, t)
+
+        def setup_traj(n=n):
+            P, t = _random_contacts(n)
+            v0 = solve_v0_from_target(S_DEFAULT, P, t)
+            # float32 at dt=0.1 keeps the 1e6 batch at ~150 MB
+            return lambda: simulate_trajectories(S_DEFAULT, v0, 1.2, 0.1, dtype=np.float32)
+
+        def setup_batches(n=n):
+            P, t = _random_contacts(n)
+            v0 = solve_v0_from_target(S_DEFAULT, P, t)
+            # Consumed block by block: peak memory is one STREAM_BATCH_BYTES block, not the batch
+            return lambda: max(
+                float(R[:, :, 2].max())
+                for _, _, _, R in iter_trajectory_batches(S_DEFAULT, v0, 1.2, 0.1, np.float32, STREAM_BATCH_BYTES)
+            )
+
+        def setup_events(n=n):
+            P, t = _random_contacts(n)
+            v0 = solve_v0_from_target(S_DEFAULT, P, t)
+            return lambda: compute_flight_events(S_DEFAULT, v0, H_NET)
+
+        cases.append({"name": f"solve_v0_from_target[n={n}]", "kernel": "solve_v0_from_target", "params": {"n": n}, "setup": setup_v0})
+        cases.append(
+            {
+                "name": f"simulate_trajectories[n={n}]",
+                "kernel": "simulate_trajectories",
+                "params": {"n": n, "dt": 0.1, "t_end": 1.2, "dtype": "float32"},
+                "setup": setup_traj,
+            }
+        )
+        cases.append(
+            {
+                "name": f"iter_trajectory_batches[n={n}]",
+                "kernel": "iter_trajectory_batches",
+                "params": {"n": n, "dt": 0.1, "t_end": 1.2, "dtype": "float32", "max_batch_bytes": STREAM_BATCH_BYTES},
+                "setup": setup_batches,
+            }
+        )
+        cases.append({"name": f"compute_flight_events[n={n}]", "kernel": "compute_flight_events", "params": {"n": n}, "setup": setup_events})
+
+    def setup_apex():
+        v0 = velocity_from_angles(10.0, 55.0, 20.0)
+        return lambda: compute_apex(S_DEFAULT, v0)
+
+    cases.append({"name": "compute_apex", "kernel": "compute_apex", "params": {"n": 1}, "setup": setup_apex})
+
+    for nxy in GRID_SIZES:
+        for k in K_SIZES:
+            if quick and k != 10:
+                continue
+            cases.append(
+                {
+                    "name": f"compute_legal_spike_envelope[nx=ny={nxy},K={k}]",
+                    "kernel": "compute_legal_spike_envelope",
+                    "params": {"nx": nxy, "ny": nxy, "k_samples": k},
+                    "setup": lambda nxy=nxy, k=k: (
+                        lambda: compute_legal_spike_envelope(P_HIT_DEFAULT, H_NET, nxy, nxy, k)
+                    ),
+                }
+            )
+        cases.append(
+            {
+                "name": f"iter_progressive_envelope[nx=ny={nxy}]",
+                "kernel": "iter_progressive_envelope",
+                "params": {"nx": nxy, "ny": nxy},
+                "setup": lambda nxy=nxy: (lambda: list(iter_progressive_envelope(P_HIT_DEFAULT, H_NET, nxy, nxy))),
+            }
+        )
+
+    for n in HEATMAP_SIZES:
+
+        def setup_heatmap(n=n):
+            P, _ = _random_contacts(n)
+            return lambda: compute_landing_heatmap(P, h_net=H_NET)
+
+        cases.append(
+            {"name": f"compute_landing_heatmap[n={n}]", "kernel": "compute_landing_heatmap", "params": {"n": n}, "setup": setup_heatmap}
+        )
+
+    # End-to-end reruns of main() through Streamlit's headless AppTest (no browser rendering)
+    e2e = [
+        ("main[default,warm]", SIM_APP, {}, False),
+        ("main[default,cold]", SIM_APP, {}, True),
+        (
+            "main[dense,cold]",
+            SIM_APP,
+            {"Envelope nx (landing x samples)": 80, "Envelope ny (landing y samples)": 80, "Envelope K (points per spike)": 16},
+            True,
+        ),
+        ("main[auto_tune+mesh+3 blockers,cold]", SIM_APP, {"Auto-tune set to hitting window at P_hit": True, "Show envelope surface mesh": True, "Blockers": 3}, True),
+        ("root_main[default]", ROOT_APP, {}, False),
+    ]
+    for name, script, widgets, cold in e2e:
+        cases.append(
+            {
+                "name": name,
+                "kernel": "main",
+                "params": {"script": script.name, "widgets": widgets, "cold": cold},
+                "setup": lambda script=script, widgets=widgets, cold=cold: _apptest_rerun(script, widgets, cold),
+            }
+        )
+    return cases
+
+
+def measure(fn, repeat: int) -> dict:
+    fn()  # warm-up
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - t0 >= MIN_SAMPLE_S or number >= 1 << 20:
+            break
+        number *= 2
+
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - t0) / number)
+
+    # Separate traced call: tracemalloc slows allocation-heavy code, so it never overlaps timing
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    result = fn()
+    current, peak = tracemalloc.get_traced_memory()
+    live_blocks = len(tracemalloc.take_snapshot().traces)
+    tracemalloc.stop()
+    del result
+
+    samples = np.array(samples)
+    return {
+        "wall_s": {"min": float(samples.min()), "median": float(np.median(samples)), "mean": float(samples.mean())},
+        "calls_per_sample": number,
+        "repeat": repeat,
+        "peak_bytes": int(peak - base),
+        "live_bytes": int(current - base),
+        "live_blocks": live_blocks,
+    }
+
+
+def run_benchmarks(cases: list[dict], repeat: int = 5, progress=None) -> dict:
+    results = []
+    for i, case in enumerate(cases):
+        fn = case["setup"]()
+        results.append({"name": case["name"], "kernel": case["kernel"], "params": case["params"], **measure(fn, repeat)})
+        if progress is not None:
+            progress(i + 1, len(cases), results[-1])
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[dict]:
+    # A case regresses when its median time or peak memory grows by more than threshold
+    old = {r["name"]: r for r in baseline["results"]}
+    rows = []
+    for r in current["results"]:
+        b = old.get(r["name"])
+        if b is None:
+            continue
+        time_ratio = r["wall_s"]["median"] / max(b["wall_s"]["median"], 1e-12)
+        mem_ratio = (r["peak_bytes"] + 1) / (b["peak_bytes"] + 1)
+        rows.append(
+            {
+                "name": r["name"],
+                "time_ratio": time_ratio,
+                "mem_ratio": mem_ratio,
+                "regressed": time_ratio > 1.0 + threshold or mem_ratio > 1.0 + threshold,
+            }
+        )
+    return rows
+
+
+def _print_progress(done: int, total: int, result: dict) -> None:
+    print(
+        f"[{done}/{total}] {result['name']}: {result['wall_s']['median'] * 1e3:.3f} ms, "
+        f"peak {result['peak_bytes'] / 2**20:.1f} MiB",
+        file=sys.stderr,
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the vb3d_sim kernels and compare against a baseline")
+    parser.add_argument("--out", required=True, help="JSON result file")
+    parser.add_argument("--baseline", help="earlier --out file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed fractional slowdown / memory growth")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this string")
+    parser.add_argument("--quick", action="store_true", help="skip the largest batch and most K variants")
+    args = parser.parse_args(argv)
+
+    cases = [c for c in build_cases(args.quick) if args.filter in c["name"]]
+    report = run_benchmarks(cases, repeat=args.repeat, progress=_print_progress)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            rows = compare(report, json.load(fh), args.threshold)
+        report["comparison"] = {"baseline": args.baseline, "threshold": args.threshold, "cases": rows}
+        for row in rows:
+            flag = "REGRESSED" if row["regressed"] else "ok"
+            print(f"{flag:>9}  time x{row['time_ratio']:.2f}  mem x{row['mem_ratio']:.2f}  {row['name']}")
+        status = int(any(row["regressed"] for row in rows))
+
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2187 @@
+﻿import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .spans import RECORDER, timed
+
+# Physics and court geometry shared by the Streamlit app, sweeps and benchmarks. No UI
+# imports here, so pool workers and scripts load only NumPy.
+
+# =========================
+# Constants / Coordinates
+# =========================
+# Origin: net center
+# x: -9 (our endline) -> +9 (opponent endline)
+# y: -4.5 (left sideline) -> +4.5 (right sideline)
+# z: vertical
+X_MIN, X_MAX = -9.0, 9.0
+Y_MIN, Y_MAX = -4.5, 4.5
+Z_MIN, Z_MAX = 0.0, 5.0
+
+COURT_LENGTH = 18.0
+COURT_WIDTH = 9.0
+ATTACK_LINE_X = 3.0
+
+NET_HEIGHTS = {"Men (2.43m)": 2.43, "Women (2.24m)": 2.24}
+POLE_OFFSET = 0.5
+POLE_HEIGHT = 2.55
+ANTENNA_ABOVE_NET = 0.8
+
+G = 9.81
+G_VEC = np.array([0.0, 0.0, -G], dtype=float)
+
+# Upper bound on the dense (n, T, 3) block evaluated at once by batched kernels
+BATCH_MAX_BYTES = 64 * 1024 * 1024
+# Samples per block of the streaming trajectory generator
+TRAJECTORY_BLOCK_SIZE = 4096
+
+# Aerodynamics, matching the defaults of the Three.js frontend (vb3d_three/src/main.js)
+DRAG_STRENGTH = 0.012
+MAGNUS_STRENGTH = 0.0009
+SPIN_DIRECTION = {"Topspin": 1.0, "Backspin": -1.0, "Float": 0.0}
+RK4_CHUNK_ROWS = 16384
+
+# Block model, same parameters and defaults as the Three.js frontend
+BLOCK_DEFAULTS = {
+    "shade_inside": 0.35,
+    "blocker_gap": 0.05,
+    "hands_width": 0.6,
+    "reach_above_net": 0.5,
+    "press_over_net": 0.15,
+    "press_over_angle_deg": 12.0,
+    "wrist_over_deg": 8.0,
+    "hand_gap": 0.03,
+}
+BLOCK_TIMING_BASE = {"Early": 1.0, "Normal": 0.85, "Late": 0.65}
+
+# Hitting window (contact dome in front of the hitter) and set limits, as in vb3d_three
+HITTING_WINDOW_DEFAULTS = {"forward_offset": 0.2, "width": 1.4, "height_range": 0.6, "thickness": 0.18}
+ZONE_GREEN_START = 0.7
+ZONE_YELLOW_START = 0.35
+SET_LIMITS = {"speed_min": 5.0, "speed_max": 16.0, "elev_min_deg": 20.0, "elev_max_deg": 75.0}
+
+# Landing (x, y) and net-crossing (y, z) bins of LandingHeatmap
+LANDING_HEATMAP_BINS = (18, 18)
+NET_HEATMAP_BINS = (18, 12)
+NET_HEATMAP_Z_RANGE = (2.0, 4.4)
+
+# Progressive envelope: nodes per axis on the first (coarsest) level, and the smallest grid
+# (nx * ny) that gets refined in levels; coarser grids are only one or two levels deep
+PROGRESSIVE_COARSE_NODES = 10
+PROGRESSIVE_MIN_NODES = 40 * 40
+
+# Server-wide kernel result cache shared by all Streamlit sessions
+KERNEL_CACHE_MAX_BYTES = 256 * 1024 * 1024
+KERNEL_CACHE_QUANTUM = 1e-6
+
+# Dormand-Prince 5(4) tableau; the 7th stage is evaluated at the step end (FSAL)
+DOPRI_A = (
+    (),
+    (1 / 5,),
+    (3 / 40, 9 / 40),
+    (44 / 45, -56 / 15, 32 / 9),
+    (19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729),
+    (9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656),
+    (35 / 384, 0.0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84),
+)
+DOPRI_B = (35 / 384, 0.0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0.0)
+DOPRI_E = (71 / 57600, 0.0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40)
+
+AXIS_RANGES = {
+    "x": [X_MIN, X_MAX],
+    "y": [Y_MIN, Y_MAX],
+    "z": [Z_MIN, Z_MAX],
+}
+ASPECT_RATIO = {"x": 18, "y": 9, "z": 5}
+
+
+@timed("kernel.simplify_polyline")
+def simplify_polyline(R: np.ndarray, tol: float) -> np.ndarray:
+    # Ramer-Douglas-Peucker: indices of a sub-polyline whose dropped points lie within tol of it
+    n = R.shape[0]
+    if n <= 2 or tol <= 0.0:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, n - 1]] = True
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        ab = R[j] - R[i]
+        rel = R[i + 1 : j] - R[i]
+        L2 = float(ab @ ab)
+        s = np.clip(rel @ ab / L2, 0.0, 1.0) if L2 > 0.0 else np.zeros(rel.shape[0])
+        d = np.linalg.norm(rel - s[:, None] * ab, axis=1)
+        k = int(np.argmax(d))
+        if d[k] > tol:
+            mid = i + 1 + k
+            keep[mid] = True
+            stack.append((i, mid))
+            stack.append((mid, j))
+    return np.flatnonzero(keep)
+
+
+def decimation_indices(n: int, budget: int, seed: int = 0) -> np.ndarray:
+    # Fixed-seed subset so the displayed cloud does not flicker between reruns
+    if n <= budget:
+        return np.arange(n)
+    return np.sort(np.random.default_rng(seed).choice(n, budget, replace=False))
+
+
+def solve_v0_from_target(S: np.ndarray, P_hit: np.ndarray, t_hit: float) -> np.ndarray:
+    return (P_hit - S - 0.5 * G_VEC * (t_hit**2)) / t_hit
+
+
+def _batch_chunk_rows(n_samples: int, itemsize: int, max_batch_bytes: int) -> int:
+    row_bytes = max(1, n_samples * 3 * itemsize)
+    return max(1, int(max_batch_bytes // row_bytes))
+
+
+def _as_launch_batch(S: np.ndarray, v0: np.ndarray, dtype) -> tuple[np.ndarray, np.ndarray]:
+    # Accepts (3,) or (N, 3) for either argument; a single S fans out over many v0 and vice versa
+    S = np.atleast_2d(np.asarray(S, dtype=dtype))
+    v0 = np.atleast_2d(np.asarray(v0, dtype=dtype))
+    S, v0 = np.broadcast_arrays(S, v0)
+    if S.ndim != 2 or S.shape[1] != 3:
+        raise ValueError(f"Expected (N, 3) launch arrays, got {S.shape}")
+    return S, v0
+
+
+def _fill_trajectory_rows(out: np.ndarray, S: np.ndarray, v0: np.ndarray, tt: np.ndarray, gravity_term: np.ndarray) -> None:
+    np.multiply(v0[:, None, :], tt, out=out)
+    out += S[:, None, :]
+    out += gravity_term
+
+
+@timed("kernel.simulate_trajectories")
+def simulate_trajectories(
+    S: np.ndarray,
+    v0: np.ndarray,
+    t_end: float,
+    dt: float,
+    dtype=np.float64,
+    max_batch_bytes: int = BATCH_MAX_BYTES,
+) -> tuple[np.ndarray, np.ndarray]:
+    # The whole (N, T, 3) output is allocated here; max_batch_bytes only bounds the work per
+    # chunk. Batches too large to hold at once go through iter_trajectory_batches instead.
+    S, v0 = _as_launch_batch(S, v0, dtype)
+    t = np.arange(0.0, t_end + dt, dt).astype(dtype, copy=False)
+    n = S.shape[0]
+
+    R = np.empty((n, t.size, 3), dtype=dtype)
+    tt = t[None, :, None]
+    gravity_term = (0.5 * G_VEC.astype(dtype))[None, None, :] * (tt**2)
+
+    rows = _batch_chunk_rows(t.size, R.itemsize, max_batch_bytes)
+    for lo in range(0, n, rows):
+        hi = min(lo + rows, n)
+        _fill_trajectory_rows(R[lo:hi], S[lo:hi], v0[lo:hi], tt, gravity_term)
+    return t, R
+
+
+def iter_trajectory_batches(
+    S: np.ndarray,
+    v0: np.ndarray,
+    t_end: float,
+    dt: float,
+    dtype=np.float64,
+    max_batch_bytes: int = BATCH_MAX_BYTES,
+):
+    # simulate_trajectories one launch chunk at a time: yields (lo, hi, t, R) with R the
+    # (hi - lo, T, 3) samples of launches lo..hi-1 (the same values, bit for bit). Each block
+    # fits in max_batch_bytes and is dropped once the caller moves on, so peak memory stays
+    # at one block however large N is.
+    S, v0 = _as_launch_batch(S, v0, dtype)
+    t = np.arange(0.0, t_end + dt, dt).astype(dtype, copy=False)
+    n = S.shape[0]
+    tt = t[None, :, None]
+    gravity_term = (0.5 * G_VEC.astype(dtype))[None, None, :] * (tt**2)
+
+    rows = _batch_chunk_rows(t.size, np.dtype(dtype).itemsize, max_batch_bytes)
+    for lo in range(0, n, rows):
+        hi = min(lo + rows, n)
+        R = np.empty((hi - lo, t.size, 3), dtype=dtype)
+        _fill_trajectory_rows(R, S[lo:hi], v0[lo:hi], tt, gravity_term)
+        yield lo, hi, t, R
+
+
+def simulate_trajectories_ragged(
+    S: np.ndarray,
+    v0: np.ndarray,
+    t_end: float,
+    dt: float,
+    dtype=np.float64,
+    max_batch_bytes: int = BATCH_MAX_BYTES,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Trajectory i is R[offsets[i]:offsets[i + 1]] sampled at t[:offsets[i + 1] - offsets[i]],
+    # cut after its first sample below the floor.
+    S, v0 = _as_launch_batch(S, v0, dtype)
+    t = np.arange(0.0, t_end + dt, dt).astype(dtype, copy=False)
+    n = S.shape[0]
+
+    counts = np.empty(n, dtype=np.int64)
+    pieces = []
+    sample_idx = np.arange(t.size)
+    for lo, hi, _, R_chunk in iter_trajectory_batches(S, v0, t_end, dt, dtype, max_batch_bytes):
+        below = R_chunk[:, :, 2] < 0.0
+        n_keep = np.where(below.any(axis=1), below.argmax(axis=1) + 1, t.size)
+        pieces.append(R_chunk[sample_idx[None, :] < n_keep[:, None]])
+        counts[lo:hi] = n_keep
+
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    R = np.concatenate(pieces) if pieces else np.empty((0, 3), dtype=dtype)
+    return t, R, offsets
+
+
+def simulate_trajectory(S: np.ndarray, v0: np.ndarray, t_end: float, dt: float) -> tuple[np.ndarray, np.ndarray]:
+    t, R = simulate_trajectories(S[None, :], v0[None, :], t_end, dt)
+    return t, R[0]
+
+
+class TrajectoryColumns:
+    # One sampled trajectory as a contiguous float32 (3, n) block of x / y / z rows. The time
+    # axis is implicit (t_i = i * dt, as simulate_trajectories samples it); R is a zero-copy
+    # (n, 3) view and time windows are slices rather than boolean-masked copies.
+    __slots__ = ("dt", "xyz")
+
+    def __init__(self, xyz: np.ndarray, dt: float) -> None:
+        self.xyz = np.ascontiguousarray(xyz, dtype=np.float32).reshape(3, -1)
+        self.dt = float(dt)
+
+    @classmethod
+    def from_arrays(cls, t: np.ndarray, R: np.ndarray) -> "TrajectoryColumns":
+        dt = float(t[1] - t[0]) if t.size > 1 else 0.0
+        if not np.array_equal(t, np.arange(t.size) * dt):
+            raise ValueError("TrajectoryColumns needs uniform samples starting at t = 0")
+        return cls(np.asarray(R).T, dt)
+
+    @classmethod
+    def simulate(cls, S: np.ndarray, v0: np.ndarray, t_end: float, dt: float) -> "TrajectoryColumns":
+        # Integrated in float64, stored in float32
+        return cls.from_arrays(*simulate_trajectory(np.asarray(S, dtype=float), np.asarray(v0, dtype=float), t_end, dt))
+
+    def __len__(self) -> int:
+        return self.xyz.shape[1]
+
+    @property
+    def t(self) -> np.ndarray:
+        return np.arange(len(self)) * self.dt
+
+    @property
+    def R(self) -> np.ndarray:
+        return self.xyz.T
+
+    @property
+    def nbytes(self) -> int:
+        return self.xyz.nbytes
+
+    def index_after(self, t: float, tol: float = 1e-9) -> int:
+        # Number of samples with t_i <= t + tol; R[:k] / R[k:] split the flight there
+        return int(np.searchsorted(self.t, t + tol, side="right"))
+
+    def plotly(self, keep: np.ndarray | slice | None = None) -> dict:
+        xyz = self.xyz if keep is None else self.xyz[:, keep]
+        return {"x": xyz[0], "y": xyz[1], "z": xyz[2]}
+
+
+def iter_trajectory_blocks(
+    S: np.ndarray,
+    v0: np.ndarray,
+    dt: float,
+    t_end: float | None = None,
+    block_size: int = TRAJECTORY_BLOCK_SIZE,
+    stop_at_floor: bool = True,
+    out: tuple[np.ndarray, np.ndarray] | None = None,
+):
+    # The samples of simulate_trajectory (bit for bit), yielded as (t, R) blocks of at most
+    # block_size rows, so memory stays O(block_size) however long the window. t_end=None runs
+    # until the floor. With stop_at_floor the last block ends at the first sample below it.
+    # With out=(t_buf, R_buf) every block is a view into those buffers, valid until the next one.
+    if t_end is None and not stop_at_floor:
+        raise ValueError("An unbounded stream needs stop_at_floor")
+    S = np.asarray(S, dtype=float)
+    v0 = np.asarray(v0, dtype=float)
+    # Same length as np.arange(0.0, t_end + dt, dt)
+    n_total = None if t_end is None else int(np.ceil((t_end + dt) / dt))
+    if out is not None:
+        t_buf, R_buf = out
+        block_size = t_buf.shape[0]
+    half_g = 0.5 * G_VEC
+
+    i0 = 0
+    while n_total is None or i0 < n_total:
+        b = block_size if n_total is None else min(block_size, n_total - i0)
+        if out is None:
+            t_buf = np.empty(b)
+            R_buf = np.empty((b, 3))
+        t = t_buf[:b]
+        R = R_buf[:b]
+        np.multiply(np.arange(i0, i0 + b, dtype=float), dt, out=t)
+        tt = t[:, None]
+        np.multiply(v0[None, :], tt, out=R)
+        R += S[None, :]
+        R += half_g[None, :] * (tt**2)
+        if stop_at_floor:
+            below = R[:, 2] < 0.0
+            if below.any():
+                k = int(below.argmax()) + 1
+                yield t[:k], R[:k]
+                return
+        yield t, R
+        i0 += b
+
+
+def velocity_at(v0: np.ndarray, t: float) -> np.ndarray:
+    return v0 + G_VEC * t
+
+
+def velocity_from_angles(speed, theta_deg, phi_deg) -> np.ndarray:
+    # Scalars give (3,); arrays broadcast to (..., 3)
+    theta = np.deg2rad(theta_deg)
+    phi = np.deg2rad(phi_deg)
+    vx = speed * np.cos(theta) * np.cos(phi)
+    vy = speed * np.cos(theta) * np.sin(phi)
+    vz = speed * np.sin(theta)
+    return np.stack(np.broadcast_arrays(vx, vy, vz), axis=-1).astype(float, copy=False)
+
+
+def compute_apex(S: np.ndarray, v0: np.ndarray) -> tuple[float, np.ndarray]:
+    vz0 = v0[2]
+    t_apex = max(0.0, vz0 / G)
+    apex = S + v0 * t_apex + 0.5 * G_VEC * (t_apex**2)
+    return t_apex, apex
+
+
+@timed("kernel.compute_flight_events")
+def compute_flight_events(S: np.ndarray, v0: np.ndarray, h_net: float) -> dict:
+    # Analytic event times for drag-free flight, vectorized over (N, 3) launches.
+    # Times with no root for t >= 0 are NaN; positions at those times are NaN as well.
+    S, v0 = _as_launch_batch(S, v0, np.float64)
+    x0, y0, z0 = S[:, 0], S[:, 1], S[:, 2]
+    vx, vy, vz = v0[:, 0], v0[:, 1], v0[:, 2]
+
+    # Floor contact: z0 + vz t - G t^2 / 2 = 0, larger root
+    disc = vz**2 + 2.0 * G * z0
+    with np.errstate(invalid="ignore"):
+        t_floor = (vz + np.sqrt(disc)) / G
+    t_floor = np.where((disc >= 0.0) & (t_floor >= 0.0), t_floor, np.nan)
+
+    t_apex = np.maximum(0.0, vz / G)
+    apex = S + v0 * t_apex[:, None] + 0.5 * G_VEC[None, :] * (t_apex[:, None] ** 2)
+
+    # Net plane x = 0: x is linear in t
+    moving = np.abs(vx) > 1e-12
+    t_net = np.full_like(x0, np.nan)
+    t_net[moving] = -x0[moving] / vx[moving]
+    t_net[x0 == 0.0] = 0.0
+    t_net = np.where(t_net >= 0.0, t_net, np.nan)
+
+    y_net = y0 + vy * t_net
+    z_net = z0 + vz * t_net - 0.5 * G * t_net**2
+    crosses_net = t_net <= t_floor
+
+    floor_pts = S + v0 * t_floor[:, None] + 0.5 * G_VEC[None, :] * (t_floor[:, None] ** 2)
+    floor_pts[:, 2] = np.where(np.isnan(t_floor), np.nan, 0.0)
+
+    return {
+        "t_net": t_net,
+        "y_net": y_net,
+        "z_net": z_net,
+        "crosses_net": crosses_net,
+        "net_clearance": z_net - h_net,
+        "antenna_clearance": Y_MAX - np.abs(y_net),
+        "clears_net": crosses_net & (z_net >= h_net) & (np.abs(y_net) <= Y_MAX),
+        "t_apex": t_apex,
+        "apex": apex,
+        "t_floor": t_floor,
+        "floor_pts": floor_pts,
+    }
+
+
+class CourtFrame:
+    # A court coordinate frame as a pure translation of the net-centred frame the kernels use
+    # (x across the net, y along it, z up). origin is where this frame's origin sits in
+    # net-centred coordinates, so net_centred = local + origin. Velocities are frame-free.
+    def __init__(self, name: str, origin) -> None:
+        self.name = name
+        self.origin = np.asarray(origin, dtype=float)
+        self.origin.flags.writeable = False
+
+    def __repr__(self) -> str:
+        return f"CourtFrame({self.name!r}, origin={self.origin.tolist()})"
+
+    @property
+    def x_range(self) -> list[float]:
+        return [float(X_MIN - self.origin[0]), float(X_MAX - self.origin[0])]
+
+    @property
+    def y_range(self) -> list[float]:
+        return [float(Y_MIN - self.origin[1]), float(Y_MAX - self.origin[1])]
+
+    def convert(self, P: np.ndarray, target: "CourtFrame", out: np.ndarray | None = None) -> np.ndarray:
+        # (..., 3) points from this frame into target. Same origin returns P itself; out=P
+        # shifts a batch in place. Neither allocates.
+        shift = self.origin - target.origin
+        if not shift.any():
+            if out is None or out is P:
+                return P
+            out[...] = P
+            return out
+        return np.add(P, shift.astype(P.dtype, copy=False), out=out)
+
+    def to_canonical(self, P: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+        return self.convert(P, NET_CENTERED, out)
+
+    def from_canonical(self, P: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+        return NET_CENTERED.convert(P, self, out)
+
+
+NET_CENTERED = CourtFrame("net_centered", [0.0, 0.0, 0.0])
+# The root app's frame: y = 0 on the left sideline
+SIDELINE_ORIGIN = CourtFrame("sideline_origin", [0.0, Y_MIN, 0.0])
+FRAMES = {f.name: f for f in (NET_CENTERED, SIDELINE_ORIGIN)}
+
+
+class FlightEngine:
+    # One entry point for both launch parameterizations, working in a chosen court frame.
+    # Gravity-only flight is translation invariant, so trajectories are computed directly in
+    # the frame; only net-relative results go through the net-centred frame.
+    def __init__(
+        self,
+        frame: CourtFrame | None = None,
+        dtype=np.float64,
+        max_batch_bytes: int = BATCH_MAX_BYTES,
+    ) -> None:
+        self.frame = frame or NET_CENTERED
+        self.dtype = dtype
+        self.max_batch_bytes = max_batch_bytes
+
+    def launch_from_angles(self, speed, theta_deg, phi_deg) -> np.ndarray:
+        return velocity_from_angles(speed, theta_deg, phi_deg)
+
+    def launch_to_target(self, S: np.ndarray, P_hit: np.ndarray, t_hit) -> np.ndarray:
+        # S and P_hit in the same frame; the translation cancels
+        t_hit = np.asarray(t_hit, dtype=float)
+        if t_hit.ndim == 1:
+            t_hit = t_hit[:, None]
+        return solve_v0_from_target(np.asarray(S, dtype=float), np.asarray(P_hit, dtype=float), t_hit)
+
+    def trajectories(self, S: np.ndarray, v0: np.ndarray, t_end: float, dt: float) -> tuple[np.ndarray, np.ndarray]:
+        return simulate_trajectories(S, v0, t_end, dt, self.dtype, self.max_batch_bytes)
+
+    def trajectory_batches(self, S: np.ndarray, v0: np.ndarray, t_end: float, dt: float):
+        return iter_trajectory_batches(S, v0, t_end, dt, self.dtype, self.max_batch_bytes)
+
+    def trajectories_ragged(
+        self, S: np.ndarray, v0: np.ndarray, t_end: float, dt: float
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return simulate_trajectories_ragged(S, v0, t_end, dt, self.dtype, self.max_batch_bytes)
+
+    def stream(
+        self,
+        S: np.ndarray,
+        v0: np.ndarray,
+        dt: float,
+        t_end: float | None = None,
+        block_size: int = TRAJECTORY_BLOCK_SIZE,
+        out: tuple[np.ndarray, np.ndarray] | None = None,
+    ):
+        return iter_trajectory_blocks(S, v0, dt, t_end, block_size, True, out)
+
+    def trajectory(self, S: np.ndarray, v0: np.ndarray, t_end: float, dt: float) -> tuple[np.ndarray, np.ndarray]:
+        t, R = self.trajectories(np.asarray(S)[None, :], np.asarray(v0)[None, :], t_end, dt)
+        return t, R[0]
+
+    def apex(self, S: np.ndarray, v0: np.ndarray) -> tuple[float, np.ndarray]:
+        return compute_apex(np.asarray(S, dtype=float), np.asarray(v0, dtype=float))
+
+    def flight_events(self, S: np.ndarray, v0: np.ndarray, h_net: float) -> dict:
+        events = compute_flight_events(self.frame.to_canonical(np.asarray(S, dtype=float)), v0, h_net)
+        # Back into this frame in place; the arrays are fresh
+        self.frame.from_canonical(events["apex"], out=events["apex"])
+        self.frame.from_canonical(events["floor_pts"], out=events["floor_pts"])
+        events["y_net"] -= self.frame.origin[1]
+        return events
+
+    def legal_spike_envelope(
+        self, P_hit: np.ndarray, h_net: float, nx: int, ny: int, k_samples: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        P = self.frame.to_canonical(np.asarray(P_hit, dtype=float))
+        return tuple(self.frame.from_canonical(a, out=a) for a in compute_legal_spike_envelope(P, h_net, nx, ny, k_samples))
+
+
+def _clip_polygon(poly: list[tuple[float, float]], a: float, b: float, c: float) -> list[tuple[float, float]]:
+    # Sutherland-Hodgman against the half-plane a x + b y <= c
+    out = []
+    n = len(poly)
+    for i in range(n):
+        p, q = poly[i], poly[(i + 1) % n]
+        fp = a * p[0] + b * p[1] - c
+        fq = a * q[0] + b * q[1] - c
+        if fp <= 0.0:
+            out.append(p)
+        if (fp < 0.0 < fq) or (fq < 0.0 < fp):
+            u = fp / (fp - fq)
+            out.append((p[0] + u * (q[0] - p[0]), p[1] + u * (q[1] - p[1])))
+    return out
+
+
+def polygon_area(poly: np.ndarray) -> float:
+    if poly.shape[0] < 3:
+        return 0.0
+    x, y = poly[:, 0], poly[:, 1]
+    return 0.5 * abs(float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))))
+
+
+def legal_landing_polygon(
+    P_hit: np.ndarray,
+    h_net: float,
+    x_near: float = 0.2,
+    x_far: float = X_MAX,
+) -> np.ndarray:
+    # Exact straight-line version of the grid scan in LegalSpikeEnvelope, as (V, 2) floor
+    # vertices. Clearing the net top bounds xL from below; the antenna window is two
+    # half-planes through P_hit, so the region is the court rectangle clipped three times.
+    x_hit, y_hit, z_hit = (float(c) for c in P_hit)
+    if x_hit >= 0.0 or z_hit <= h_net:
+        return np.zeros((0, 2), dtype=float)
+
+    x_lo = max(x_near, -x_hit * h_net / (z_hit - h_net))
+    if x_lo >= x_far:
+        return np.zeros((0, 2), dtype=float)
+    poly = [(x_lo, Y_MIN), (x_far, Y_MIN), (x_far, Y_MAX), (x_lo, Y_MAX)]
+    # y_cross <= Y_MAX and y_cross >= Y_MIN, multiplied through by (xL - x_hit) > 0
+    poly = _clip_polygon(poly, y_hit - Y_MAX, -x_hit, -Y_MAX * x_hit)
+    poly = _clip_polygon(poly, -y_hit + Y_MIN, x_hit, Y_MIN * x_hit)
+    return np.array(poly, dtype=float).reshape(-1, 2)
+
+
+@timed("kernel.compute_legal_landing_region")
+def compute_legal_landing_region(P_hit: np.ndarray, h_net: float) -> dict:
+    P_hit = np.asarray(P_hit, dtype=float)
+    poly = legal_landing_polygon(P_hit, h_net)
+    landing = np.column_stack([poly, np.zeros(poly.shape[0])])
+
+    # Central projection from P_hit maps the floor polygon onto the net-plane crossing window
+    x_hit, y_hit, z_hit = P_hit
+    s_star = (0.0 - x_hit) / (poly[:, 0] - x_hit)
+    window = np.column_stack(
+        [np.zeros(poly.shape[0]), y_hit + s_star * (poly[:, 1] - y_hit), z_hit + s_star * (0.0 - z_hit)]
+    )
+    landing_area = polygon_area(poly)
+    return {
+        "landing_polygon": landing,
+        "landing_area_m2": landing_area,
+        "net_window": window,
+        "net_window_area_m2": polygon_area(window[:, 1:]),
+        "volume_m3": landing_area * float(z_hit) / 3.0,
+    }
+
+
+ENVELOPE_MESH_PARTS = ("near", "far", "base", "net_window")
+
+
+@timed("kernel.envelope_mesh")
+def envelope_mesh(P_hit: np.ndarray, h_net: float, region: dict | None = None) -> dict:
+    # Closed cone from the apex P_hit over the legal landing polygon, with its side split at the
+    # net plane. Vertices: [P_hit, net window (M), landing polygon (M)]; faces index into them and
+    # part[f] names the piece per ENVELOPE_MESH_PARTS. The net-window faces are an internal cut.
+    P_hit = np.asarray(P_hit, dtype=float)
+    if region is None:
+        region = compute_legal_landing_region(P_hit, h_net)
+    m = region["landing_polygon"].shape[0]
+    if m < 3:
+        return {"vertices": np.zeros((0, 3)), "faces": np.zeros((0, 3), dtype=np.int64), "part": np.zeros(0, dtype=np.int8)}
+
+    vertices = np.vstack([P_hit[None, :], region["net_window"], region["landing_polygon"]])
+    i = np.arange(m)
+    j = (i + 1) % m
+    w_i, w_j = 1 + i, 1 + j
+    l_i, l_j = 1 + m + i, 1 + m + j
+    fan = np.arange(1, m - 1)
+    near = np.column_stack([np.zeros(m, dtype=np.int64), w_i, w_j])
+    far = np.vstack([np.column_stack([w_i, l_i, l_j]), np.column_stack([w_i, l_j, w_j])])
+    base = np.column_stack([np.full(m - 2, 1 + m), 1 + m + fan, 2 + m + fan])
+    window = np.column_stack([np.ones(m - 2, dtype=np.int64), 1 + fan, 2 + fan])
+    faces = np.vstack([near, far, base, window])
+    part = np.repeat(np.arange(4, dtype=np.int8), [near.shape[0], far.shape[0], base.shape[0], window.shape[0]])
+    return {"vertices": vertices, "faces": faces, "part": part}
+
+
+def _constant_column(n: int, value: float = 0.0) -> np.ndarray:
+    # Read-only zero-stride column for an implicit axis; costs one scalar, not n floats
+    return np.broadcast_to(np.float32(value), (n,))
+
+
+class SpikeSegments:
+    # Compact envelope: every legal spike is the segment P_hit -> (landing_x[i], landing_y[i], 0).
+    # Columns are float32 rows of two contiguous (2, M) blocks, landing = [x; y] on the floor and
+    # cross = [y; z] in the net plane; the constant axes (landing z, crossing x) are implicit.
+    # Dense points are only built by sample(); metrics and membership come from the geometry.
+    __slots__ = ("P_hit", "landing", "cross", "h_net", "cell_area")
+
+    def __init__(
+        self,
+        P_hit: np.ndarray,
+        landing: np.ndarray,
+        cross: np.ndarray,
+        h_net: float,
+        cell_area: float | None = None,
+    ) -> None:
+        self.P_hit = np.asarray(P_hit, dtype=float)
+        self.landing = np.ascontiguousarray(landing, dtype=np.float32).reshape(2, -1)
+        self.cross = np.ascontiguousarray(cross, dtype=np.float32).reshape(2, -1)
+        self.h_net = float(h_net)
+        self.cell_area = cell_area
+
+    def __len__(self) -> int:
+        return self.landing.shape[1]
+
+    @property
+    def landing_x(self) -> np.ndarray:
+        return self.landing[0]
+
+    @property
+    def landing_y(self) -> np.ndarray:
+        return self.landing[1]
+
+    @property
+    def cross_y(self) -> np.ndarray:
+        return self.cross[0]
+
+    @property
+    def cross_z(self) -> np.ndarray:
+        return self.cross[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.landing.nbytes + self.cross.nbytes
+
+    @property
+    def landing_pts(self) -> np.ndarray:
+        # (M, 3) float64 copy for callers that want rows
+        return np.column_stack([self.landing_x, self.landing_y, np.zeros(len(self))])
+
+    @property
+    def cross_pts(self) -> np.ndarray:
+        return np.column_stack([np.zeros(len(self)), self.cross_y, self.cross_z])
+
+    def landing_xyz(self, keep: np.ndarray | None = None) -> dict:
+        # Plotly x / y / z columns: views of the stored rows (gathered only when keep is given)
+        landing = self.landing if keep is None else self.landing[:, keep]
+        return {"x": landing[0], "y": landing[1], "z": _constant_column(landing.shape[1])}
+
+    def cross_xyz(self, keep: np.ndarray | None = None) -> dict:
+        cross = self.cross if keep is None else self.cross[:, keep]
+        return {"x": _constant_column(cross.shape[1]), "y": cross[0], "z": cross[1]}
+
+    def point_count(self, k_samples: int) -> int:
+        return len(self) * int(k_samples)
+
+    def sample(self, k_samples: int) -> np.ndarray:
+        # (M * k_samples, 3) float32, k_samples evenly spaced points along each spike
+        m = len(self)
+        if m == 0:
+            return np.zeros((0, 3), dtype=np.float32)
+        s = np.linspace(0.0, 1.0, k_samples, dtype=np.float32)
+        P = self.P_hit.astype(np.float32)
+        out = np.empty((m, k_samples, 3), dtype=np.float32)
+        np.multiply(s[None, :], (self.landing_x - P[0])[:, None], out=out[:, :, 0])
+        np.multiply(s[None, :], (self.landing_y - P[1])[:, None], out=out[:, :, 1])
+        out[:, :, 2] = s * -P[2]
+        out += P
+        return out.reshape(-1, 3)
+
+    def contains(self, points: np.ndarray, tol: float = 1e-9) -> np.ndarray:
+        # Continuous envelope test: extend P_hit -> q to the floor and check that landing point
+        # against the same court / net-window rules the grid uses (boundaries widened by tol).
+        q = np.atleast_2d(np.asarray(points, dtype=float))
+        x_hit, y_hit, z_hit = self.P_hit
+        with np.errstate(divide="ignore", invalid="ignore"):
+            s = (z_hit - q[:, 2]) / z_hit
+            xL = x_hit + (q[:, 0] - x_hit) / s
+            yL = y_hit + (q[:, 1] - y_hit) / s
+            s_star = (0.0 - x_hit) / (xL - x_hit)
+            y_cross = y_hit + s_star * (yL - y_hit)
+            z_cross = z_hit + s_star * (0.0 - z_hit)
+        inside = (
+            (s > 0.0)
+            & (s <= 1.0 + tol)
+            & (xL >= 0.2 - tol)
+            & (xL <= 9.0 + tol)
+            & (yL >= -4.5 - tol)
+            & (yL <= 4.5 + tol)
+            & (np.abs(xL - x_hit) > 1e-10)
+            & (s_star > 0.0)
+            & (s_star < 1.0)
+            & (z_cross >= self.h_net - tol)
+            & (y_cross >= -4.5 - tol)
+            & (y_cross <= 4.5 + tol)
+        )
+        return inside | (np.all(q == self.P_hit[None, :], axis=1) & (len(self) > 0))
+
+    def metrics(self) -> dict:
+        if len(self) == 0:
+            return {"spikes": 0, "landing_area_m2": 0.0, "net_window_area_m2": 0.0, "volume_m3": 0.0}
+        x_hit, y_hit, z_hit = self.P_hit
+        lengths = np.sqrt(
+            (self.landing_x.astype(float) - x_hit) ** 2 + (self.landing_y.astype(float) - y_hit) ** 2 + z_hit**2
+        )
+        out = {
+            "spikes": len(self),
+            "length_min_m": float(lengths.min()),
+            "length_mean_m": float(lengths.mean()),
+            "length_max_m": float(lengths.max()),
+            "z_cross_min_m": float(self.cross_z.min()),
+            "z_cross_max_m": float(self.cross_z.max()),
+        }
+        region = compute_legal_landing_region(self.P_hit, self.h_net)
+        out["landing_area_m2"] = region["landing_area_m2"]
+        out["net_window_area_m2"] = region["net_window_area_m2"]
+        # Cone over the landing region with its apex at P_hit: V = A h / 3
+        out["volume_m3"] = region["volume_m3"]
+        if self.cell_area is not None:
+            out["landing_area_grid_m2"] = len(self) * self.cell_area
+        return out
+
+
+def _net_crossing(P_hit: np.ndarray, xL: np.ndarray, yL: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Net-plane crossing of the straight spike P_hit -> (xL, yL, 0), plus everything in the
+    # legality test except the net height
+    x_hit, y_hit, z_hit = P_hit
+    denom = xL - x_hit
+    safe = np.abs(denom) > 1e-10
+
+    s_star = np.empty_like(denom)
+    s_star.fill(np.nan)
+    s_star[safe] = (0.0 - x_hit) / denom[safe]
+
+    y_cross = y_hit + s_star * (yL - y_hit)
+    z_cross = z_hit + s_star * (0.0 - z_hit)
+    in_window = safe & (s_star > 0.0) & (s_star < 1.0) & (y_cross >= -4.5) & (y_cross <= 4.5)
+    return y_cross, z_cross, in_window
+
+
+def _spike_columns(
+    xL: np.ndarray, yL: np.ndarray, y_cross: np.ndarray, z_cross: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    # SpikeSegments' (2, M) float32 landing [x; y] and crossing [y; z] blocks
+    landing = np.empty((2, xL.size), dtype=np.float32)
+    landing[0] = xL
+    landing[1] = yL
+    cross = np.empty((2, xL.size), dtype=np.float32)
+    cross[0] = y_cross
+    cross[1] = z_cross
+    return landing, cross
+
+
+def grid_cell_area(nx: int, ny: int) -> float | None:
+    # Floor area per sample of the nx x ny landing grid
+    if nx < 2 or ny < 2:
+        return None
+    return (8.8 / (nx - 1)) * (9.0 / (ny - 1))
+
+
+class LegalSpikeEnvelope:
+    # Keeps the intermediate arrays of the envelope computation and, after update(), reruns
+    # only the stages downstream of the inputs that changed:
+    #   nx, ny -> grid;  P_hit -> crossing;  h_net -> legal;  k_samples -> segments
+    STAGES = ("grid", "crossing", "legal", "points", "segments")
+
+    def __init__(self, P_hit: np.ndarray, h_net: float, nx: int, ny: int, k_samples: int) -> None:
+        self.P_hit = np.array(P_hit, dtype=float)
+        self.h_net = float(h_net)
+        self.nx = int(nx)
+        self.ny = int(ny)
+        self.k_samples = int(k_samples)
+        self._dirty = 0
+        self.stage_timings: dict[str, float | None] = {name: None for name in self.STAGES}
+
+    def _invalidate(self, stage: str) -> None:
+        self._dirty = min(self._dirty, self.STAGES.index(stage))
+
+    def update(
+        self,
+        P_hit: np.ndarray | None = None,
+        h_net: float | None = None,
+        nx: int | None = None,
+        ny: int | None = None,
+        k_samples: int | None = None,
+    ) -> "LegalSpikeEnvelope":
+        if (nx is not None and int(nx) != self.nx) or (ny is not None and int(ny) != self.ny):
+            self.nx = self.nx if nx is None else int(nx)
+            self.ny = self.ny if ny is None else int(ny)
+            self._invalidate("grid")
+        if P_hit is not None and not np.array_equal(P_hit, self.P_hit):
+            self.P_hit = np.array(P_hit, dtype=float)
+            self._invalidate("crossing")
+        if h_net is not None and float(h_net) != self.h_net:
+            self.h_net = float(h_net)
+            self._invalidate("legal")
+        if k_samples is not None and int(k_samples) != self.k_samples:
+            self.k_samples = int(k_samples)
+            self._invalidate("segments")
+        return self
+
+    def _stage_grid(self) -> None:
+        xL_vals = np.linspace(0.2, 9.0, self.nx)
+        yL_vals = np.linspace(-4.5, 4.5, self.ny)
+        Xg, Yg = np.meshgrid(xL_vals, yL_vals, indexing="xy")
+        self.xL = Xg.ravel()
+        self.yL = Yg.ravel()
+
+    def _stage_crossing(self) -> None:
+        self.y_cross, self.z_cross, self.in_window = _net_crossing(self.P_hit, self.xL, self.yL)
+
+    def _stage_legal(self) -> None:
+        self.legal = self.in_window & (self.z_cross >= self.h_net)
+
+    def _stage_points(self) -> None:
+        # The float64 grid columns stay whole, with self.legal as their validity mask; only the
+        # float32 blocks hold the legal spikes compacted
+        legal = self.legal
+        self.landing, self.cross = _spike_columns(
+            self.xL[legal], self.yL[legal], self.y_cross[legal], self.z_cross[legal]
+        )
+
+    def _stage_segments(self) -> None:
+        landing_pts, _ = self._rows(cross=False)
+        s = np.linspace(0.0, 1.0, self.k_samples)
+        d = landing_pts - self.P_hit[None, :]
+        self.envelope_pts = (self.P_hit[None, None, :] + s[None, :, None] * d[:, None, :]).reshape(-1, 3)
+
+    def _rows(self, cross: bool = True) -> tuple[np.ndarray, np.ndarray | None]:
+        # Float64 (M, 3) landing / crossing rows of the legal grid nodes
+        legal = self.legal
+        landing_pts = np.zeros((np.count_nonzero(legal), 3))
+        landing_pts[:, 0] = self.xL[legal]
+        landing_pts[:, 1] = self.yL[legal]
+        if not cross:
+            return landing_pts, None
+        cross_pts = np.zeros_like(landing_pts)
+        cross_pts[:, 1] = self.y_cross[legal]
+        cross_pts[:, 2] = self.z_cross[legal]
+        return landing_pts, cross_pts
+
+    def refresh(self, dense: bool = True) -> "LegalSpikeEnvelope":
+        # dense=False stops before materializing the (M * k_samples, 3) point cloud
+        last = len(self.STAGES) if dense else self.STAGES.index("segments")
+        for i, name in enumerate(self.STAGES):
+            if i >= last:
+                if i >= self._dirty:
+                    self.stage_timings[name] = "deferred"
+                continue
+            if i < self._dirty:
+                self.stage_timings[name] = None
+                continue
+            t0 = time.perf_counter()
+            getattr(self, f"_stage_{name}")()
+            self.stage_timings[name] = time.perf_counter() - t0
+            if RECORDER.enabled:
+                RECORDER.record(f"envelope.{name}", self.stage_timings[name])
+        self._dirty = max(self._dirty, last)
+        return self
+
+    def cell_area(self) -> float | None:
+        return grid_cell_area(self.nx, self.ny)
+
+    def segments(self) -> SpikeSegments:
+        self.refresh(dense=False)
+        return SpikeSegments(self.P_hit, self.landing, self.cross, self.h_net, self.cell_area())
+
+    def result(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Float64 row-array form (cross_pts, landing_pts, envelope_pts), built from the grid
+        # columns; segments() is the compact float32 one
+        self.refresh()
+        landing_pts, cross_pts = self._rows()
+        return cross_pts, landing_pts, self.envelope_pts
+
+    def timings_us(self) -> dict[str, float | str]:
+        # Microseconds spent in each stage by the last refresh; "reused" if it was skipped
+        return {
+            k: v if isinstance(v, str) else "reused" if v is None else round(v * 1e6, 1)
+            for k, v in self.stage_timings.items()
+        }
+
+
+def compute_legal_spike_envelope(
+    P_hit: np.ndarray,
+    h_net: float,
+    nx: int,
+    ny: int,
+    k_samples: int,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    return LegalSpikeEnvelope(P_hit, h_net, nx, ny, k_samples).result()
+
+
+def compute_spike_segments(P_hit: np.ndarray, h_net: float, nx: int, ny: int) -> SpikeSegments:
+    # Compact form of compute_legal_spike_envelope; the dense cloud is left to sample()
+    return LegalSpikeEnvelope(P_hit, h_net, nx, ny, 0).segments()
+
+
+def _coarse_nodes(n: int, coarse: int) -> np.ndarray:
+    # Every stride-th grid index (stride a power of two, ~coarse nodes) plus the last one
+    stride = 1
+    while n > 1 and (n - 1) / (2 * stride) >= max(coarse - 1, 1):
+        stride *= 2
+    nodes = np.arange(0, n, stride)
+    if nodes[-1] != n - 1:
+        nodes = np.append(nodes, n - 1)
+    return nodes
+
+
+def _refine_nodes(nodes: np.ndarray) -> np.ndarray:
+    gap = np.diff(nodes)
+    return np.union1d(nodes, nodes[:-1][gap > 1] + gap[gap > 1] // 2)
+
+
+def _node_spans(nodes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    if nodes.size == 1:
+        return nodes, nodes
+    return nodes[:-1], nodes[1:]
+
+
+def _rects_outside_polygon(
+    poly: np.ndarray, x0: np.ndarray, x1: np.ndarray, y0: np.ndarray, y1: np.ndarray, eps: float = 1e-6
+) -> np.ndarray:
+    # Separating-axis test of axis-aligned rectangles against a convex polygon: the box axes,
+    # then every edge normal (compared with the rectangle's nearest corner)
+    if poly.shape[0] < 3:
+        return np.ones(x0.shape, dtype=bool)
+    out = (
+        (x1 < poly[:, 0].min() - eps)
+        | (x0 > poly[:, 0].max() + eps)
+        | (y1 < poly[:, 1].min() - eps)
+        | (y0 > poly[:, 1].max() + eps)
+    )
+    edge = np.roll(poly, -1, axis=0) - poly
+    length = np.hypot(edge[:, 0], edge[:, 1])
+    keep = length > 0.0
+    x, y = poly[:, 0], poly[:, 1]
+    orient = np.sign(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+    # Outward unit normals of a counter-clockwise polygon are (ey, -ex)
+    n = orient * np.column_stack([edge[keep, 1], -edge[keep, 0]]) / length[keep, None]
+    offset = np.einsum("ij,ij->i", n, poly[keep])
+    near = np.where(n[:, 0] > 0.0, n[:, 0] * x0[:, None], n[:, 0] * x1[:, None]) + np.where(
+        n[:, 1] > 0.0, n[:, 1] * y0[:, None], n[:, 1] * y1[:, None]
+    )
+    return out | np.any(near - offset > eps, axis=1)
+
+
+def _cover_rects(cover: np.ndarray, i0: np.ndarray, i1: np.ndarray, j0: np.ndarray, j1: np.ndarray) -> None:
+    # Adds the closed node spans [i0, i1] x [j0, j1] to a (ny + 1, nx + 1) difference array;
+    # its 2-D cumulative sum counts how many spans cover each node
+    np.add.at(cover, (j0, i0), 1)
+    np.add.at(cover, (j0, i1 + 1), -1)
+    np.add.at(cover, (j1 + 1, i0), -1)
+    np.add.at(cover, (j1 + 1, i1 + 1), 1)
+
+
+def iter_progressive_envelope(
+    P_hit: np.ndarray,
+    h_net: float,
+    nx: int,
+    ny: int,
+    coarse: int = PROGRESSIVE_COARSE_NODES,
+    previews: int | None = None,
+):
+    # Coarse-to-fine scan of the LegalSpikeEnvelope grid. Legality is first tested on a node
+    # lattice of ~coarse x coarse points; a cell whose four corners are legal is legal throughout
+    # (the legal region is convex), a cell clear of legal_landing_polygon is illegal throughout,
+    # and only the cells left over are split at their midpoints for the next level. Every level
+    # (or only the first `previews`) yields the exact result on its node lattice; the last
+    # (final=True) covers the full grid, reuses the legality already resolved and matches
+    # LegalSpikeEnvelope bit for bit.
+    P_hit = np.asarray(P_hit, dtype=float)
+    h_net = float(h_net)
+    nx, ny = int(nx), int(ny)
+    x_vals = np.linspace(0.2, 9.0, nx)
+    y_vals = np.linspace(-4.5, 4.5, ny)
+    # Flat (j * nx + i) per-node state; only evaluated nodes are ever written
+    evaluated = np.zeros(nx * ny, dtype=bool)
+    legal = np.zeros(nx * ny, dtype=bool)
+    # Nodes inside cells resolved as legal, accumulated over all levels
+    inside_cover = np.zeros((ny + 1, nx + 1), dtype=np.int32)
+    poly = legal_landing_polygon(P_hit, h_net)
+
+    xs, ys = _coarse_nodes(nx, coarse), _coarse_nodes(ny, coarse)
+    # Open cells as node spans [i0, i1] x [j0, j1]
+    (i0, i1), (j0, j1) = _node_spans(xs), _node_spans(ys)
+    i0, j0 = (a.ravel() for a in np.meshgrid(i0, j0, indexing="xy"))
+    i1, j1 = (a.ravel() for a in np.meshgrid(i1, j1, indexing="xy"))
+    level = 0
+    while True:
+        # Nodes still unknown are exactly the corners of the open cells not evaluated yet
+        flat = np.unique(np.concatenate([j0 * nx + i0, j0 * nx + i1, j1 * nx + i0, j1 * nx + i1]))
+        flat = flat[~evaluated[flat]]
+        _, z_cross, in_window = _net_crossing(P_hit, x_vals[flat % nx], y_vals[flat // nx])
+        evaluated[flat] = True
+        legal[flat] = in_window & (z_cross >= h_net)
+
+        corners = np.stack([legal[j0 * nx + i0], legal[j0 * nx + i1], legal[j1 * nx + i0], legal[j1 * nx + i1]])
+        inside = corners.all(axis=0)
+        outside = ~corners.any(axis=0)
+        outside[outside] = _rects_outside_polygon(
+            poly, x_vals[i0[outside]], x_vals[i1[outside]], y_vals[j0[outside]], y_vals[j1[outside]]
+        )
+        _cover_rects(inside_cover, i0[inside], i1[inside], j0[inside], j1[inside])
+
+        split = ~(inside | outside) & ((i1 - i0 > 1) | (j1 - j0 > 1))
+        i0, i1, j0, j1 = i0[split], i1[split], j0[split], j1[split]
+        final = i0.size == 0
+        if final or previews is None or level < previews:
+            # Legal = evaluated legal, or inside a cell resolved as legal (outside cells hold no
+            # legal node, evaluated or not)
+            covered = inside_cover.cumsum(axis=0, dtype=np.int8).cumsum(axis=1, dtype=np.int8)[:ny, :nx] > 0
+            mask = legal.reshape(ny, nx) | covered
+            if final:
+                xL = np.broadcast_to(x_vals, (ny, nx))[mask]
+                yL = np.broadcast_to(y_vals[:, None], (ny, nx))[mask]
+            else:
+                sub = np.ix_(ys, xs)
+                jj, ii = np.nonzero(mask[sub])
+                xL, yL = x_vals[xs[ii]], y_vals[ys[jj]]
+            y_cross, z_cross, _ = _net_crossing(P_hit, xL, yL)
+            landing, cross = _spike_columns(xL, yL, y_cross, z_cross)
+            cell = grid_cell_area(nx, ny) if final else grid_cell_area(xs.size, ys.size)
+            yield {
+                "level": level,
+                "nodes": (nx, ny) if final else (int(xs.size), int(ys.size)),
+                "segments": SpikeSegments(P_hit, landing, cross, h_net, cell),
+                "evaluated": int(np.count_nonzero(evaluated)),
+                "open_cells": int(i0.size),
+                "final": final,
+            }
+            if final:
+                return
+
+        # Split the open cells at their midpoints, x first, then y
+        mx = i1 - i0 > 1
+        mid = i0 + (i1 - i0) // 2
+        i0, i1, j0, j1 = (
+            np.concatenate([i0, mid[mx]]),
+            np.concatenate([np.where(mx, mid, i1), i1[mx]]),
+            np.concatenate([j0, j0[mx]]),
+            np.concatenate([j1, j1[mx]]),
+        )
+        my = j1 - j0 > 1
+        mid = j0 + (j1 - j0) // 2
+        i0, i1, j0, j1 = (
+            np.concatenate([i0, i0[my]]),
+            np.concatenate([i1, i1[my]]),
+            np.concatenate([j0, mid[my]]),
+            np.concatenate([np.where(my, mid, j1), j1[my]]),
+        )
+        xs, ys = _refine_nodes(xs), _refine_nodes(ys)
+        level += 1
+
+
+class LandingHeatmap:
+    # Weighted legal-spike counts over many contacts, accumulated straight into fixed bins:
+    # landing (x, y) on the far half and net crossing (y, z). Landing samples are the grid of
+    # compute_legal_spike_envelope; per-contact arrays only live for one chunk of add().
+    # Partial heatmaps with the same bins merge by addition (see merge()).
+    def __init__(
+        self,
+        nx: int = 60,
+        ny: int = 60,
+        landing_bins: tuple[int, int] = LANDING_HEATMAP_BINS,
+        net_bins: tuple[int, int] = NET_HEATMAP_BINS,
+        net_z_range: tuple[float, float] = NET_HEATMAP_Z_RANGE,
+        max_batch_bytes: int = BATCH_MAX_BYTES,
+    ) -> None:
+        self.nx, self.ny = int(nx), int(ny)
+        self.landing_x_edges = np.linspace(0.0, X_MAX, int(landing_bins[0]) + 1)
+        self.landing_y_edges = np.linspace(Y_MIN, Y_MAX, int(landing_bins[1]) + 1)
+        self.net_y_edges = np.linspace(Y_MIN, Y_MAX, int(net_bins[0]) + 1)
+        self.net_z_edges = np.linspace(float(net_z_range[0]), float(net_z_range[1]), int(net_bins[1]) + 1)
+        self.max_batch_bytes = max_batch_bytes
+        self.landing_counts = np.zeros((int(landing_bins[0]), int(landing_bins[1])))
+        self.net_counts = np.zeros((int(net_bins[0]), int(net_bins[1])))
+        self.net_overflow = 0.0
+        self.contacts = 0
+        self.weight_total = 0.0
+
+        Xg, Yg = np.meshgrid(np.linspace(0.2, 9.0, self.nx), np.linspace(-4.5, 4.5, self.ny), indexing="xy")
+        self._xL = Xg.ravel()
+        self._yL = Yg.ravel()
+        self._landing_bin = np.ravel_multi_index(
+            (_bin_index(self._xL, self.landing_x_edges), _bin_index(self._yL, self.landing_y_edges)),
+            self.landing_counts.shape,
+        )
+        self._samples_per_bin = np.bincount(self._landing_bin, minlength=self.landing_counts.size).reshape(
+            self.landing_counts.shape
+        )
+
+    def add(self, P_hits: np.ndarray, weights: np.ndarray | None = None, h_net=2.43) -> "LandingHeatmap":
+        # h_net is a scalar or one net height per contact
+        P_hits = np.atleast_2d(np.asarray(P_hits, dtype=float))
+        n_c = P_hits.shape[0]
+        w = np.ones(n_c) if weights is None else np.broadcast_to(np.asarray(weights, dtype=float), (n_c,))
+        h = np.broadcast_to(np.asarray(h_net, dtype=float), (n_c,))
+        xL, yL = self._xL, self._yL
+        n_l = xL.size
+
+        # Largest temporaries are the (contacts, landing samples) float64 blocks
+        rows = max(1, int(self.max_batch_bytes // (n_l * 8 * 6)))
+        for lo in range(0, n_c, rows):
+            hi = min(lo + rows, n_c)
+            P, wc = P_hits[lo:hi], w[lo:hi]
+            x_hit, y_hit, z_hit = P[:, 0, None], P[:, 1, None], P[:, 2, None]
+            denom = xL[None, :] - x_hit
+            with np.errstate(divide="ignore", invalid="ignore"):
+                s_star = np.where(np.abs(denom) > 1e-10, (0.0 - x_hit) / denom, np.nan)
+            y_cross = y_hit + s_star * (yL[None, :] - y_hit)
+            z_cross = z_hit + s_star * (0.0 - z_hit)
+            legal = (
+                (s_star > 0.0) & (s_star < 1.0) & (z_cross >= h[lo:hi, None]) & (y_cross >= -4.5) & (y_cross <= 4.5)
+            )
+
+            # Landing samples are shared by every contact: weight each sample, then bin once
+            per_sample = wc @ legal
+            self.landing_counts += np.bincount(
+                self._landing_bin, weights=per_sample, minlength=self.landing_counts.size
+            ).reshape(self.landing_counts.shape)
+
+            ci, li = np.nonzero(legal)
+            yc, zc, wl = y_cross[ci, li], z_cross[ci, li], wc[ci]
+            inside = (zc >= self.net_z_edges[0]) & (zc <= self.net_z_edges[-1])
+            self.net_overflow += float(wl[~inside].sum())
+            cell = np.ravel_multi_index(
+                (_bin_index(yc[inside], self.net_y_edges), _bin_index(zc[inside], self.net_z_edges)),
+                self.net_counts.shape,
+            )
+            self.net_counts += np.bincount(cell, weights=wl[inside], minlength=self.net_counts.size).reshape(
+                self.net_counts.shape
+            )
+
+        self.contacts += n_c
+        self.weight_total += float(w.sum())
+        return self
+
+    def _same_bins(self, other: "LandingHeatmap") -> bool:
+        return (
+            (self.nx, self.ny) == (other.nx, other.ny)
+            and all(
+                np.array_equal(getattr(self, name), getattr(other, name))
+                for name in ("landing_x_edges", "landing_y_edges", "net_y_edges", "net_z_edges")
+            )
+        )
+
+    def merge(self, other: "LandingHeatmap") -> "LandingHeatmap":
+        if not self._same_bins(other):
+            raise ValueError("Cannot merge landing heatmaps with different grids or bins")
+        self.landing_counts += other.landing_counts
+        self.net_counts += other.net_counts
+        self.net_overflow += other.net_overflow
+        self.contacts += other.contacts
+        self.weight_total += other.weight_total
+        return self
+
+    def landing_probability(self) -> np.ndarray:
+        # Chance that a spike at a landing sample in the bin is legal, over the weighted contacts
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p = self.landing_counts / (self._samples_per_bin * self.weight_total)
+        return np.nan_to_num(p)
+
+    def net_distribution(self) -> np.ndarray:
+        # Share of legal spikes crossing the net in each (y, z) bin
+        total = self.net_counts.sum() + self.net_overflow
+        return self.net_counts / total if total > 0 else np.zeros_like(self.net_counts)
+
+    def save(self, path) -> None:
+        np.savez(
+            path,
+            grid=np.array([self.nx, self.ny]),
+            landing_x_edges=self.landing_x_edges,
+            landing_y_edges=self.landing_y_edges,
+            net_y_edges=self.net_y_edges,
+            net_z_edges=self.net_z_edges,
+            landing_counts=self.landing_counts,
+            net_counts=self.net_counts,
+            totals=np.array([self.net_overflow, self.contacts, self.weight_total]),
+        )
+
+    @classmethod
+    def load(cls, path) -> "LandingHeatmap":
+        with np.load(path) as data:
+            heatmap = cls(
+                int(data["grid"][0]),
+                int(data["grid"][1]),
+                data["landing_counts"].shape,
+                data["net_counts"].shape,
+                (float(data["net_z_edges"][0]), float(data["net_z_edges"][-1])),
+            )
+            heatmap.landing_counts[:] = data["landing_counts"]
+            heatmap.net_counts[:] = data["net_counts"]
+            overflow, contacts, weight_total = data["totals"]
+        heatmap.net_overflow = float(overflow)
+        heatmap.contacts = int(contacts)
+        heatmap.weight_total = float(weight_total)
+        return heatmap
+
+
+def _bin_index(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    # Uniform bins, upper edge inclusive
+    n = edges.size - 1
+    return np.clip(((values - edges[0]) * (n / (edges[-1] - edges[0]))).astype(np.int64), 0, n - 1)
+
+
+@timed("kernel.compute_landing_heatmap")
+def compute_landing_heatmap(
+    P_hits: np.ndarray, weights: np.ndarray | None = None, h_net=2.43, nx: int = 60, ny: int = 60, **bins
+) -> LandingHeatmap:
+    return LandingHeatmap(nx, ny, **bins).add(P_hits, weights, h_net)
+
+
+@timed("kernel.compute_legal_cell_bitmaps")
+def compute_legal_cell_bitmaps(
+    P_hits: np.ndarray,
+    h_net: float,
+    nx: int = 60,
+    ny: int = 60,
+    blocker_counts: tuple[int, ...] = (0,),
+    landing_bins: tuple[int, int] = LANDING_HEATMAP_BINS,
+    net_bins: tuple[int, int] = NET_HEATMAP_BINS,
+    net_z_range: tuple[float, float] = NET_HEATMAP_Z_RANGE,
+    block: dict | None = None,
+) -> dict:
+    # Per contact and per wall size: which landing (x, y) bins and net (y, z) bins of
+    # LandingHeatmap hold at least one legal, unblocked spike of the envelope grid.
+    # Walls are anchored on each hitter as in the app. Returns bool (C, len(blocker_counts), cells).
+    P_hits = np.atleast_2d(np.asarray(P_hits, dtype=float))
+    grid = LandingHeatmap(nx, ny, landing_bins, net_bins, net_z_range)
+    xL, yL = grid._xL, grid._yL
+    n_c, n_lc, n_nc = P_hits.shape[0], grid.landing_counts.size, grid.net_counts.size
+
+    x_hit, y_hit, z_hit = P_hits[:, 0, None], P_hits[:, 1, None], P_hits[:, 2, None]
+    denom = xL[None, :] - x_hit
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s_star = np.where(np.abs(denom) > 1e-10, (0.0 - x_hit) / denom, np.nan)
+    y_cross = y_hit + s_star * (yL[None, :] - y_hit)
+    z_cross = z_hit + s_star * (0.0 - z_hit)
+    legal = (s_star > 0.0) & (s_star < 1.0) & (z_cross >= h_net) & (y_cross >= -4.5) & (y_cross <= 4.5)
+    ci, li = np.nonzero(legal)
+    yc, zc = y_cross[ci, li], z_cross[ci, li]
+    in_net = (zc >= grid.net_z_edges[0]) & (zc <= grid.net_z_edges[-1])
+    net_cell = np.full(ci.size, -1, dtype=np.int64)
+    net_cell[in_net] = np.ravel_multi_index(
+        (_bin_index(yc[in_net], grid.net_y_edges), _bin_index(zc[in_net], grid.net_z_edges)), grid.net_counts.shape
+    )
+
+    block = {**BLOCK_DEFAULTS, **(block or {})}
+    anchor = block_anchor_from_hitter(P_hits[:, 1], block["shade_inside"])
+    landing = np.zeros((n_c, len(blocker_counts), n_lc), dtype=bool)
+    net = np.zeros((n_c, len(blocker_counts), n_nc), dtype=bool)
+    for level, count in enumerate(blocker_counts):
+        keep = np.ones(ci.size, dtype=bool)
+        if count > 0 and ci.size:
+            landing_pts = np.column_stack([xL[li], yL[li]])
+            keep = ~classify_blocked_attacks(P_hits[ci], landing_pts, h_net, anchor[ci], count, block)["blocked"]
+        landing[ci[keep], level, grid._landing_bin[li[keep]]] = True
+        ok = keep & (net_cell >= 0)
+        net[ci[ok], level, net_cell[ok]] = True
+    return {"landing": landing, "net": net}
+
+
+def block_anchor_from_hitter(hitter_y, shade_inside: float = BLOCK_DEFAULTS["shade_inside"]):
+    # Scalar or array of hitter y
+    y = np.asarray(hitter_y, dtype=float)
+    anchor = np.clip(y - np.where(y < 0.0, -1.0, 1.0) * shade_inside, Y_MIN, Y_MAX)
+    return float(anchor) if anchor.ndim == 0 else anchor
+
+
+def _wall_offsets(count: int, block: dict) -> np.ndarray:
+    count = max(0, min(3, int(count)))
+    w, gap = block["hands_width"], block["blocker_gap"]
+    offsets = {0: [], 1: [0.0], 2: [-(w / 2 + gap / 2), w / 2 + gap / 2], 3: [-(w + gap), 0.0, w + gap]}[count]
+    return np.array(offsets, dtype=float)
+
+
+def blocker_positions(y_track: float, count: int, block: dict | None = None) -> np.ndarray:
+    block = {**BLOCK_DEFAULTS, **(block or {})}
+    y = y_track + _wall_offsets(count, block)
+    if y.size == 0:
+        return y
+    # Slide the whole wall back inside the antennae
+    shift = 0.0
+    if y.min() < Y_MIN:
+        shift += Y_MIN - y.min()
+    if y.max() + shift > Y_MAX:
+        shift -= y.max() + shift - Y_MAX
+    return np.clip(y + shift, Y_MIN, Y_MAX)
+
+
+def block_height_multiplier(t_net: float, block_timing: str = "Normal", reaction_speed: float = 0.7) -> float:
+    base = BLOCK_TIMING_BASE.get(block_timing, 0.85)
+    reaction = float(np.clip(reaction_speed, 0.0, 1.0))
+    k = 2.0 + reaction * 12.0
+    ramp = 1.0 / (1.0 + np.exp(-k * (t_net - 0.35)))
+    min_form = 0.45 + (1.0 - reaction) * 0.15
+    return float(np.clip(min_form + (base - min_form) * ramp, 0.35, 1.0))
+
+
+def _block_geometry(block: dict) -> dict:
+    # Hand strips, top of the block and probe planes, as in generatePossibleSpikeTrajectories
+    reach = block["reach_above_net"]
+    total_width = max(0.2, block["hands_width"])
+    gap = float(np.clip(block["hand_gap"], -0.05, 0.15))
+    hand_width = max(0.05, (total_width - gap) / 2.0)
+    press_rad = np.deg2rad(block["press_over_angle_deg"])
+    wrist_rad = np.deg2rad(block["wrist_over_deg"])
+    press_depth = max(
+        0.03,
+        max(0.0, block["press_over_net"]) + np.tan(press_rad) * reach * 0.5 + np.tan(wrist_rad) * reach * 0.2,
+    )
+    z_boost = (np.tan(press_rad) + np.tan(wrist_rad) * 0.5) * max(0.01, reach) * 0.08
+    probe_x = [0.0, -max(0.03, press_depth * 0.5)]
+    if press_rad > 0.0 or wrist_rad > 0.0:
+        probe_x.append(-max(0.03, press_depth))
+    return {
+        "hand_offset": gap / 2.0 + hand_width / 2.0,
+        "half_width": hand_width / 2.0,
+        "z_reach": reach + z_boost,
+        "probe_x": np.array(probe_x, dtype=float),
+    }
+
+
+def _blocker_hits(
+    P_hit: np.ndarray,
+    xL: np.ndarray,
+    yL: np.ndarray,
+    h_net: float,
+    blocker_ys: np.ndarray,
+    geo: dict,
+) -> np.ndarray:
+    # Spikes P_hit[k] -> (xL[k], yL[k], 0), all (K,) arrays. Returns (K, B): blocker b has a hand
+    # on the spike at the net plane or at one of the press-over probe planes.
+    x_hit, y_hit, z_hit = P_hit[:, 0], P_hit[:, 1], P_hit[:, 2]
+    hand_offset = geo["hand_offset"]
+    half_width = geo["half_width"]
+    z_top = h_net + geo["z_reach"]
+
+    hits = np.zeros((xL.size, blocker_ys.size), dtype=bool)
+    denom = xL - x_hit
+    for xp in geo["probe_x"]:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = (xp - x_hit) / denom
+        y = y_hit + r * (yL - y_hit)
+        z = z_hit + r * (0.0 - z_hit)
+        on_path = (r > 0.0) & (r < 1.0) & (z >= h_net) & (z <= z_top)
+        # Each blocker's two hands sit symmetrically at +-hand_offset around its centre
+        d = np.abs(np.abs(y[:, None] - blocker_ys[None, :]) - hand_offset)
+        hits |= (d <= half_width) & on_path[:, None]
+    return hits
+
+
+@timed("kernel.classify_blocked_spikes")
+def classify_blocked_spikes(
+    P_hit: np.ndarray,
+    landing_pts: np.ndarray,
+    h_net: float,
+    blocker_ys: np.ndarray,
+    block: dict | None = None,
+) -> dict:
+    # Single contact: split the legal spikes P_hit -> landing_pts into free and blocked
+    block = {**BLOCK_DEFAULTS, **(block or {})}
+    blocker_ys = np.asarray(blocker_ys, dtype=float)
+    m = landing_pts.shape[0]
+    if blocker_ys.size == 0 or m == 0:
+        return {
+            "free": np.ones(m, dtype=bool),
+            "blocked": np.zeros(m, dtype=bool),
+            "coverage": np.zeros(blocker_ys.size, dtype=np.int64),
+        }
+    P = np.broadcast_to(np.asarray(P_hit, dtype=float), (m, 3))
+    hits = _blocker_hits(P, landing_pts[:, 0], landing_pts[:, 1], h_net, blocker_ys, _block_geometry(block))
+    blocked = hits.any(axis=1)
+    return {"free": ~blocked, "blocked": blocked, "coverage": hits.sum(axis=0)}
+
+
+@timed("kernel.classify_blocked_attacks")
+def classify_blocked_attacks(
+    P_hits: np.ndarray,
+    landing_pts: np.ndarray,
+    h_net: float,
+    y_tracks: np.ndarray,
+    count: int,
+    block: dict | None = None,
+) -> dict:
+    # One spike per contact, each against its own wall of `count` blockers centred on
+    # y_tracks[k] (slid inside the antennae as in blocker_positions). The hand test only
+    # depends on y relative to the wall, so every spike is shifted into its wall's frame.
+    block = {**BLOCK_DEFAULTS, **(block or {})}
+    P_hits = np.atleast_2d(np.asarray(P_hits, dtype=float))
+    offsets = _wall_offsets(count, block)
+    m = P_hits.shape[0]
+    if offsets.size == 0 or m == 0:
+        return {"blocked": np.zeros(m, dtype=bool), "hits": np.zeros((m, offsets.size), dtype=bool)}
+    y_tracks = np.asarray(y_tracks, dtype=float)
+    centre = y_tracks + np.maximum(0.0, Y_MIN - (y_tracks + offsets[0]))
+    centre -= np.maximum(0.0, centre + offsets[-1] - Y_MAX)
+    P_rel = P_hits.copy()
+    P_rel[:, 1] -= centre
+    hits = _blocker_hits(
+        P_rel, landing_pts[:, 0], landing_pts[:, 1] - centre, h_net, offsets, _block_geometry(block)
+    )
+    return {"blocked": hits.any(axis=1), "hits": hits}
+
+
+@timed("kernel.compute_blocked_spike_grid")
+def compute_blocked_spike_grid(
+    P_hits: np.ndarray,
+    h_net: float,
+    nx: int,
+    ny: int,
+    blocker_ys: np.ndarray,
+    block: dict | None = None,
+    max_batch_bytes: int = BATCH_MAX_BYTES,
+) -> dict:
+    # Many contacts against one block: legal / blocked / free masks over the landing grid of
+    # compute_legal_spike_envelope, shaped (C, nx * ny), plus per-blocker coverage counts (C, B).
+    block = {**BLOCK_DEFAULTS, **(block or {})}
+    P_hits = np.atleast_2d(np.asarray(P_hits, dtype=float))
+    blocker_ys = np.asarray(blocker_ys, dtype=float)
+    geo = _block_geometry(block)
+
+    Xg, Yg = np.meshgrid(np.linspace(0.2, 9.0, nx), np.linspace(-4.5, 4.5, ny), indexing="xy")
+    xL = Xg.ravel()
+    yL = Yg.ravel()
+    n_c, n_l, n_b = P_hits.shape[0], xL.size, blocker_ys.size
+
+    legal = np.zeros((n_c, n_l), dtype=bool)
+    blocked = np.zeros((n_c, n_l), dtype=bool)
+    coverage = np.zeros((n_c, n_b), dtype=np.int64)
+
+    # Largest temporaries are the per-probe (legal spikes, blockers) distance blocks
+    row_bytes = n_l * (8 * 8 + max(1, n_b) * 18)
+    rows = max(1, int(max_batch_bytes // row_bytes))
+    for lo in range(0, n_c, rows):
+        hi = min(lo + rows, n_c)
+        P = P_hits[lo:hi]
+        x_hit, y_hit, z_hit = P[:, 0, None], P[:, 1, None], P[:, 2, None]
+        denom = xL[None, :] - x_hit
+        with np.errstate(divide="ignore", invalid="ignore"):
+            s_star = np.where(np.abs(denom) > 1e-10, (0.0 - x_hit) / denom, np.nan)
+        y_cross = y_hit + s_star * (yL[None, :] - y_hit)
+        z_cross = z_hit + s_star * (0.0 - z_hit)
+        ok = (s_star > 0.0) & (s_star < 1.0) & (z_cross >= h_net) & (y_cross >= -4.5) & (y_cross <= 4.5)
+        legal[lo:hi] = ok
+        if n_b == 0:
+            continue
+        # Only legal spikes are tested against the hands
+        ci, li = np.nonzero(ok)
+        hits = _blocker_hits(P[ci], xL[li], yL[li], h_net, blocker_ys, geo)
+        blocked[lo + ci, li] = hits.any(axis=1)
+        for b in range(n_b):
+            coverage[lo:hi, b] = np.bincount(ci[hits[:, b]], minlength=hi - lo)
+
+    return {
+        "landing_grid": np.column_stack([xL, yL]),
+        "legal": legal,
+        "blocked": blocked,
+        "free": legal & ~blocked,
+        "coverage": coverage,
+    }
+
+
+def omega_from_spin(spin_type: str, spin_rate_rps: float, spin_axis_tilt_deg: float = 0.0) -> np.ndarray:
+    tilt = np.deg2rad(spin_axis_tilt_deg)
+    axis = np.array([np.sin(tilt), np.cos(tilt), 0.0], dtype=float)
+    return axis * (SPIN_DIRECTION[spin_type] * spin_rate_rps * 2.0 * np.pi)
+
+
+def _rk4_time_steps(t_end: float, dt: float) -> list[float]:
+    # Same step sequence as integrateTrajectoryRK4: full dt steps, last one clipped to t_end
+    steps = []
+    t = 0.0
+    while t < t_end - 1e-9:
+        h = min(dt, t_end - t)
+        steps.append(h)
+        t += h
+    return steps
+
+
+def _aero_acceleration(v: np.ndarray, w: tuple[float, float, float], drag_strength: float) -> np.ndarray:
+    # v is component-major (3, m); w is omega pre-scaled by the Magnus strength
+    speed = np.sqrt(np.einsum("ij,ij->j", v, v))
+    a = v * (-drag_strength * speed)
+    wx, wy, wz = w
+    if wx:
+        a[1] -= wx * v[2]
+        a[2] += wx * v[1]
+    if wy:
+        a[0] += wy * v[2]
+        a[2] -= wy * v[0]
+    if wz:
+        a[0] -= wz * v[1]
+        a[1] += wz * v[0]
+    a[2] -= G
+    return a
+
+
+def _rk4_advance(
+    r: np.ndarray,
+    v: np.ndarray,
+    steps: list[float],
+    w: tuple[float, float, float],
+    drag_strength: float,
+    history: np.ndarray | None = None,
+) -> np.ndarray:
+    # Advances component-major (3, m) states in place. Balls are masked out of the working
+    # set at their first below-floor sample and keep that state; returns steps taken per ball.
+    m = r.shape[1]
+    n_steps = np.full(m, len(steps), dtype=np.int64)
+    idx = np.arange(m)
+    rr, vv = r, v
+    for i, h in enumerate(steps):
+        k1 = _aero_acceleration(vv, w, drag_strength)
+        v2 = vv + (0.5 * h) * k1
+        k2 = _aero_acceleration(v2, w, drag_strength)
+        v3 = vv + (0.5 * h) * k2
+        k3 = _aero_acceleration(v3, w, drag_strength)
+        v4 = vv + h * k3
+        k4 = _aero_acceleration(v4, w, drag_strength)
+
+        # Position stages are the stage velocities
+        v2 += v3
+        v2 *= 2.0
+        v2 += vv
+        v2 += v4
+        v2 *= h / 6.0
+        rr += v2
+        k2 += k3
+        k2 *= 2.0
+        k2 += k1
+        k2 += k4
+        k2 *= h / 6.0
+        vv += k2
+
+        if history is not None:
+            history[i + 1][:, idx] = rr
+
+        landed = rr[2] < 0.0
+        if landed.any():
+            done = idx[landed]
+            r[:, done] = rr[:, landed]
+            v[:, done] = vv[:, landed]
+            n_steps[done] = i + 1
+            keep = ~landed
+            idx, rr, vv = idx[keep], rr[:, keep], vv[:, keep]
+            if idx.size == 0:
+                break
+
+    r[:, idx] = rr
+    v[:, idx] = vv
+    return n_steps
+
+
+def _spin_terms(omega: np.ndarray | None, magnus_strength: float) -> tuple[float, float, float]:
+    if omega is None:
+        return 0.0, 0.0, 0.0
+    wx, wy, wz = np.asarray(omega, dtype=float) * magnus_strength
+    return float(wx), float(wy), float(wz)
+
+
+@timed("kernel.integrate_trajectories_rk4")
+def integrate_trajectories_rk4(
+    S: np.ndarray,
+    v0: np.ndarray,
+    t_end: float,
+    dt: float,
+    omega: np.ndarray | None = None,
+    drag_strength: float = DRAG_STRENGTH,
+    magnus_strength: float = MAGNUS_STRENGTH,
+    dtype=np.float64,
+    chunk_rows: int = RK4_CHUNK_ROWS,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Drag + Magnus flight for (N, 3) launches. Agrees with integrateTrajectoryRK4 to < 1e-9 m
+    # in float64. Trajectory i is valid for R[i, :n_samples[i]]; later samples repeat its
+    # floor-contact state. Pass drag_strength=0 / magnus_strength=0 for the disabled toggles.
+    S, v0 = _as_launch_batch(S, v0, dtype)
+    steps = _rk4_time_steps(t_end, dt)
+    t = np.concatenate([[0.0], np.cumsum(steps)]).astype(dtype, copy=False)
+    w = _spin_terms(omega, magnus_strength)
+    n = S.shape[0]
+
+    R = np.empty((n, t.size, 3), dtype=dtype)
+    n_samples = np.empty(n, dtype=np.int64)
+    for lo in range(0, n, chunk_rows):
+        hi = min(lo + chunk_rows, n)
+        r = np.ascontiguousarray(S[lo:hi].T)
+        v = np.ascontiguousarray(v0[lo:hi].T)
+        history = np.empty((t.size, 3, hi - lo), dtype=dtype)
+        history[0] = r
+        n_steps = _rk4_advance(r, v, steps, w, drag_strength, history)
+
+        frozen = np.arange(t.size)[:, None] > n_steps[None, :]
+        history = np.where(frozen[:, None, :], r[None, :, :], history)
+        R[lo:hi] = history.transpose(2, 0, 1)
+        n_samples[lo:hi] = n_steps + 1
+    return t, R, n_samples
+
+
+@timed("kernel.integrate_landings_rk4")
+def integrate_landings_rk4(
+    S: np.ndarray,
+    v0: np.ndarray,
+    t_end: float,
+    dt: float,
+    omega: np.ndarray | None = None,
+    drag_strength: float = DRAG_STRENGTH,
+    magnus_strength: float = MAGNUS_STRENGTH,
+    dtype=np.float64,
+    chunk_rows: int = RK4_CHUNK_ROWS,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Same integration as integrate_trajectories_rk4 without keeping the history; returns the
+    # time, position and velocity of each ball's last sample (first below-floor one if it landed).
+    S, v0 = _as_launch_batch(S, v0, dtype)
+    steps = _rk4_time_steps(t_end, dt)
+    t = np.concatenate([[0.0], np.cumsum(steps)]).astype(dtype, copy=False)
+    w = _spin_terms(omega, magnus_strength)
+    n = S.shape[0]
+
+    t_stop = np.empty(n, dtype=dtype)
+    r_stop = np.empty((n, 3), dtype=dtype)
+    v_stop = np.empty((n, 3), dtype=dtype)
+    for lo in range(0, n, chunk_rows):
+        hi = min(lo + chunk_rows, n)
+        r = np.ascontiguousarray(S[lo:hi].T)
+        v = np.ascontiguousarray(v0[lo:hi].T)
+        n_steps = _rk4_advance(r, v, steps, w, drag_strength)
+        t_stop[lo:hi] = t[n_steps]
+        r_stop[lo:hi] = r.T
+        v_stop[lo:hi] = v.T
+    return t_stop, r_stop, v_stop
+
+
+def _hermite(p0: np.ndarray, d0: np.ndarray, p1: np.ndarray, d1: np.ndarray, h: np.ndarray, s: np.ndarray) -> np.ndarray:
+    s2 = s * s
+    s3 = s2 * s
+    return (2 * s3 - 3 * s2 + 1) * p0 + (s3 - 2 * s2 + s) * h * d0 + (3 * s2 - 2 * s3) * p1 + (s3 - s2) * h * d1
+
+
+def _locate_step_root(
+    p0: np.ndarray,
+    d0: np.ndarray,
+    p1: np.ndarray,
+    d1: np.ndarray,
+    h: np.ndarray,
+    target: float,
+    n_iter: int = 48,
+) -> np.ndarray:
+    # Bisection on the cubic Hermite interpolant of one component; p0 and p1 bracket target
+    lo = np.zeros_like(h)
+    hi = np.ones_like(h)
+    f_lo = p0 - target
+    for _ in range(n_iter):
+        mid = 0.5 * (lo + hi)
+        f_mid = _hermite(p0, d0, p1, d1, h, mid) - target
+        same = np.signbit(f_mid) == np.signbit(f_lo)
+        lo = np.where(same, mid, lo)
+        f_lo = np.where(same, f_mid, f_lo)
+        hi = np.where(same, hi, mid)
+    return 0.5 * (lo + hi)
+
+
+def interpolate_dense(t: np.ndarray, R: np.ndarray, V: np.ndarray, t_query: np.ndarray) -> np.ndarray:
+    # Dense output for one adaptive trajectory: cubic Hermite in position between stored samples
+    t_query = np.clip(np.asarray(t_query, dtype=float), t[0], t[-1])
+    i = np.clip(np.searchsorted(t, t_query, side="right") - 1, 0, max(0, t.size - 2))
+    j = np.minimum(i + 1, t.size - 1)
+    h = t[j] - t[i]
+    s = np.where(h > 0.0, (t_query - t[i]) / np.where(h > 0.0, h, 1.0), 0.0)
+    return _hermite(R[i], V[i], R[j], V[j], h[:, None], s[:, None])
+
+
+@timed("kernel.integrate_trajectories_adaptive")
+def integrate_trajectories_adaptive(
+    S: np.ndarray,
+    v0: np.ndarray,
+    t_end: float,
+    h_net: float,
+    omega: np.ndarray | None = None,
+    drag_strength: float = DRAG_STRENGTH,
+    magnus_strength: float = MAGNUS_STRENGTH,
+    rtol: float = 1e-6,
+    atol: float = 1e-6,
+    h_init: float = 0.02,
+    h_max: float = 0.25,
+    max_iter: int = 10000,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict]:
+    # Dormand-Prince 5(4) with per-ball step control for the drag + Magnus model.
+    # Returns ragged samples (trajectory i is t/R/V[offsets[i]:offsets[i + 1]], the last one at
+    # floor contact or t_end) and the net-plane / floor events located on the dense interpolant.
+    S, v0 = _as_launch_batch(S, v0, np.float64)
+    w = _spin_terms(omega, magnus_strength)
+    n = S.shape[0]
+
+    r = np.ascontiguousarray(S.T)
+    v = np.ascontiguousarray(v0.T)
+    a = _aero_acceleration(v, w, drag_strength)
+    t = np.zeros(n)
+    h = np.full(n, h_init)
+    active = np.ones(n, dtype=bool)
+
+    t_net = np.full(n, np.nan)
+    y_net = np.full(n, np.nan)
+    z_net = np.full(n, np.nan)
+    t_floor = np.full(n, np.nan)
+
+    out_ball = [np.arange(n)]
+    out_t = [t.copy()]
+    out_r = [r.copy()]
+    out_v = [v.copy()]
+
+    for _ in range(max_iter):
+        ia = np.flatnonzero(active)
+        if ia.size == 0:
+            break
+        r0, vv0, a0, t0 = r[:, ia], v[:, ia], a[:, ia], t[ia]
+        hh = np.minimum(h[ia], t_end - t0)
+
+        vs = [vv0]
+        ks = [a0]
+        for i in range(1, 7):
+            vi = vv0 + hh * sum(c * k for c, k in zip(DOPRI_A[i], ks) if c)
+            vs.append(vi)
+            ks.append(_aero_acceleration(vi, w, drag_strength))
+        r1 = r0 + hh * sum(c * vi for c, vi in zip(DOPRI_B, vs) if c)
+        v1, a1 = vs[6], ks[6]
+
+        err_r = hh * sum(c * vi for c, vi in zip(DOPRI_E, vs) if c)
+        err_v = hh * sum(c * k for c, k in zip(DOPRI_E, ks) if c)
+        sc_r = atol + rtol * np.maximum(np.abs(r0), np.abs(r1))
+        sc_v = atol + rtol * np.maximum(np.abs(vv0), np.abs(v1))
+        err = np.sqrt((np.sum((err_r / sc_r) ** 2, axis=0) + np.sum((err_v / sc_v) ** 2, axis=0)) / 6.0)
+
+        with np.errstate(divide="ignore"):
+            factor = np.clip(0.9 * err ** -0.2, 0.2, 5.0)
+        h[ia] = np.minimum(hh * factor, h_max)
+
+        acc = err <= 1.0
+        if not acc.any():
+            continue
+        ib = ia[acc]
+        r0, vv0, a0, r1, v1, a1 = r0[:, acc], vv0[:, acc], a0[:, acc], r1[:, acc], v1[:, acc], a1[:, acc]
+        t0, hh = t0[acc], hh[acc]
+        t1 = t0 + hh
+
+        # Floor contact ends the flight inside this step
+        s_floor = np.ones_like(hh)
+        floor = r1[2] < 0.0
+        if floor.any():
+            s_floor[floor] = _locate_step_root(r0[2, floor], vv0[2, floor], r1[2, floor], v1[2, floor], hh[floor], 0.0)
+
+        # First net-plane crossing, if it happens before floor contact
+        cross = np.isnan(t_net[ib]) & (np.signbit(r0[0]) != np.signbit(r1[0]))
+        if cross.any():
+            ic = np.flatnonzero(cross)
+            s_net = _locate_step_root(r0[0, ic], vv0[0, ic], r1[0, ic], v1[0, ic], hh[ic], 0.0)
+            ok = s_net <= s_floor[ic]
+            ic, s_net = ic[ok], s_net[ok]
+            p_net = _hermite(r0[:, ic], vv0[:, ic], r1[:, ic], v1[:, ic], hh[ic], s_net)
+            t_net[ib[ic]] = t0[ic] + s_net * hh[ic]
+            y_net[ib[ic]] = p_net[1]
+            z_net[ib[ic]] = p_net[2]
+
+        if floor.any():
+            sf = s_floor[floor]
+            hf = hh[floor]
+            p_f = _hermite(r0[:, floor], vv0[:, floor], r1[:, floor], v1[:, floor], hf, sf)
+            v_f = _hermite(vv0[:, floor], a0[:, floor], v1[:, floor], a1[:, floor], hf, sf)
+            p_f[2] = 0.0
+            r1[:, floor] = p_f
+            v1[:, floor] = v_f
+            a1[:, floor] = _aero_acceleration(v_f, w, drag_strength)
+            t1[floor] = t0[floor] + sf * hf
+            t_floor[ib[floor]] = t1[floor]
+
+        r[:, ib] = r1
+        v[:, ib] = v1
+        a[:, ib] = a1
+        t[ib] = t1
+        active[ib] = ~floor & (t1 < t_end - 1e-12)
+
+        out_ball.append(ib)
+        out_t.append(t1)
+        out_r.append(r1)
+        out_v.append(v1)
+
+    ball = np.concatenate(out_ball)
+    order = np.argsort(ball, kind="stable")
+    t_out = np.concatenate(out_t)[order]
+    R_out = np.concatenate(out_r, axis=1).T[order]
+    V_out = np.concatenate(out_v, axis=1).T[order]
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ball, minlength=n), out=offsets[1:])
+
+    crosses_net = ~np.isnan(t_net)
+    events = {
+        "t_net": t_net,
+        "y_net": y_net,
+        "z_net": z_net,
+        "crosses_net": crosses_net,
+        "net_clearance": z_net - h_net,
+        "antenna_clearance": Y_MAX - np.abs(y_net),
+        "clears_net": crosses_net & (z_net >= h_net) & (np.abs(y_net) <= Y_MAX),
+        "t_floor": t_floor,
+        "floor_pts": np.where(np.isnan(t_floor)[:, None], np.nan, r.T),
+    }
+    return t_out, R_out, V_out, offsets, events
+
+
+def hitting_window(hitter_top: np.ndarray, window: dict | None = None) -> dict:
+    # hitter_top is the hitter's highest reach point; the dome sits height_range below it
+    window = {**HITTING_WINDOW_DEFAULTS, **(window or {})}
+    hitter_top = np.asarray(hitter_top, dtype=float)
+    window["origin"] = hitter_top - np.array([0.0, 0.0, window["height_range"]])
+    window["hitter_y"] = float(hitter_top[1])
+    d_up = max(0.2, window["height_range"])
+    d_side, d_forward = 1.40, 0.25
+    window["dome"] = {
+        "alpha_max": np.deg2rad(55.0),
+        "beta_min": np.deg2rad(15.0),
+        "beta_max": np.deg2rad(89.5),
+        "d_up": d_up,
+        "d_side": d_side,
+        "d_forward": d_forward,
+        "eps": float(np.clip(window["thickness"] / max(1e-6, min(d_forward, d_side, d_up)), 0.09, 0.35)),
+    }
+    return window
+
+
+def dome_quality(points: np.ndarray, window: dict) -> tuple[np.ndarray, np.ndarray]:
+    # (..., 3) world points -> (inside the dome shell, contact quality q in [0, 1])
+    p = window["dome"]
+    local = points - window["origin"]
+    fp = local[..., 0] - window["forward_offset"]
+    lat = local[..., 1]
+    up = local[..., 2]
+    E = (fp / p["d_forward"]) ** 2 + (lat / p["d_side"]) ** 2 + (up / p["d_up"]) ** 2
+    inside = (fp >= 0.0) & (up >= 0.0) & (np.abs(lat) <= window["width"] / 2.0) & (np.abs(E - 1.0) <= p["eps"])
+    return inside, np.clip(up / p["d_up"], 0.0, 1.0)
+
+
+def _green_dome_points(window: dict, alpha: np.ndarray, beta: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    p = window["dome"]
+    local = np.stack(
+        [
+            window["forward_offset"] + p["d_forward"] * np.cos(beta) * np.cos(alpha),
+            p["d_side"] * np.cos(beta) * np.sin(alpha),
+            p["d_up"] * np.sin(beta),
+        ],
+        axis=-1,
+    )
+    pts = local + window["origin"]
+    inside, q = dome_quality(pts, window)
+    return pts, inside & (q >= ZONE_GREEN_START)
+
+
+def green_contact_candidates(
+    window: dict,
+    alpha_count: int = 31,
+    beta_count: int = 12,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Green shell targets, alpha-major like generateGreenContactCandidates; returns (points, alpha, beta)
+    p = window["dome"]
+    beta_green_min = p["beta_min"] + (p["beta_max"] - p["beta_min"]) * 0.68
+    alpha, beta = np.meshgrid(
+        np.linspace(-p["alpha_max"], p["alpha_max"], alpha_count),
+        np.linspace(beta_green_min, p["beta_max"], beta_count),
+        indexing="ij",
+    )
+    pts, green = _green_dome_points(window, alpha.ravel(), beta.ravel())
+    return pts[green], alpha.ravel()[green], beta.ravel()[green]
+
+
+def _set_path_times(t_end: float, dt: float) -> np.ndarray:
+    # Same sample times as sampleSetPath
+    steps = max(2, int(np.floor(t_end / dt)))
+    return np.arange(steps + 1) / steps * t_end
+
+
+def analyze_sets_against_window(
+    S: np.ndarray,
+    v0: np.ndarray,
+    window: dict,
+    t_end: float,
+    dt: float,
+    max_batch_bytes: int = BATCH_MAX_BYTES,
+) -> dict:
+    # Time spent in each dome zone for N sets S -> v0 (no drag), one (N,) array per statistic
+    t = _set_path_times(t_end, dt)
+    S, v0 = _as_launch_batch(S, v0, np.float64)
+    n = v0.shape[0]
+    dt_i = np.diff(t)
+    out = {k: np.zeros(n) for k in ("green_time", "yellow_time", "red_time", "best_lateral_error", "peak_q")}
+    out["intersects_green"] = np.zeros(n, dtype=bool)
+
+    # A handful of (rows, T) temporaries per chunk
+    rows = _batch_chunk_rows(t.size, 8 * 4, max_batch_bytes)
+    for lo in range(0, n, rows):
+        hi = min(lo + rows, n)
+        R = S[lo:hi, None, :] + v0[lo:hi, None, :] * t[None, :, None] + 0.5 * G_VEC * (t[None, :, None] ** 2)
+        inside, q = dome_quality(R, window)
+        green = inside & (q >= ZONE_GREEN_START)
+        yellow = inside & ~green & (q >= ZONE_YELLOW_START)
+        red = inside & ~green & ~yellow
+        out["green_time"][lo:hi] = green[:, 1:] @ dt_i
+        out["yellow_time"][lo:hi] = yellow[:, 1:] @ dt_i
+        out["red_time"][lo:hi] = red[:, 1:] @ dt_i
+        out["intersects_green"][lo:hi] = green[:, 1:].any(axis=1)
+        # Lateral error at the first sample of peak quality
+        q_in = np.where(inside, q, -1.0)
+        best = np.argmax(q_in, axis=1)
+        rows_idx = np.arange(hi - lo)
+        hit_shell = inside.any(axis=1)
+        out["best_lateral_error"][lo:hi] = np.where(
+            hit_shell, np.abs(R[rows_idx, best, 1] - window["hitter_y"]), 999.0
+        )
+        out["peak_q"][lo:hi] = np.maximum(0.0, q_in[rows_idx, best])
+    return out
+
+
+def _set_limits_ok(v0: np.ndarray, limits: dict) -> np.ndarray:
+    speed = np.linalg.norm(v0, axis=-1)
+    elev = np.rad2deg(np.arctan2(v0[..., 2], np.maximum(1e-9, np.hypot(v0[..., 0], v0[..., 1]))))
+    return (
+        (speed >= limits["speed_min"])
+        & (speed <= limits["speed_max"])
+        & (elev >= limits["elev_min_deg"])
+        & (elev <= limits["elev_max_deg"])
+    )
+
+
+def _score_set_candidates(
+    S: np.ndarray,
+    targets: np.ndarray,
+    t_hits: np.ndarray,
+    window: dict,
+    h_net: float,
+    t_end: float,
+    dt: float,
+    limits: dict,
+) -> tuple[np.ndarray, np.ndarray, dict]:
+    # Objective of autoTuneGreenTargetForAuto; -inf where a candidate is filtered out
+    v0 = solve_v0_from_target(S, targets, t_hits[:, None])
+    ok = (
+        _set_limits_ok(v0, limits)
+        & (targets[:, 2] >= h_net)
+        & (np.abs(targets[:, 1] - window["hitter_y"]) <= 0.8)
+    )
+    stats = analyze_sets_against_window(S, v0, window, t_end, dt)
+    objective = stats["green_time"] + 0.35 * stats["yellow_time"] - 0.4 * stats["best_lateral_error"]
+    objective = np.where(ok & stats["intersects_green"], objective, -np.inf)
+    return objective, v0, stats
+
+
+@timed("kernel.auto_tune_set")
+def auto_tune_set(
+    S: np.ndarray,
+    window: dict,
+    nominal_time: float,
+    h_net: float,
+    t_end: float | None = None,
+    dt: float = 0.005,
+    limits: dict | None = None,
+    refine_iters: int = 12,
+) -> dict:
+    # Batched port of autoTuneGreenTargetForAuto: every (green target, contact time) pair is
+    # scored in one pass, then the winner is polished by a compass search over (alpha, beta, t).
+    limits = {**SET_LIMITS, **(limits or {})}
+    S = np.asarray(S, dtype=float)
+    if t_end is None:
+        t_end = max(1.2, nominal_time + 0.45)
+
+    pts, alpha, beta = green_contact_candidates(window)
+    keep = (pts[:, 2] >= h_net) & (np.abs(pts[:, 1] - window["hitter_y"]) <= 0.8)
+    pts, alpha, beta = pts[keep], alpha[keep], beta[keep]
+    if pts.shape[0] == 0:
+        return {"ok": False, "reason": "No green targets above net near hitter lane.", "candidates": 0}
+
+    t_center = float(np.clip(nominal_time, 0.25, 0.9))
+    t_lo, t_hi = max(0.22, t_center - 0.2), min(0.95, t_center + 0.2)
+    t_cand = np.linspace(t_lo, t_hi, 7)
+
+    # Target-major, time-minor, so argmax keeps the first best like the JS loop
+    n_t = t_cand.size
+    objective, v0, stats = _score_set_candidates(
+        S, np.repeat(pts, n_t, axis=0), np.tile(t_cand, pts.shape[0]), window, h_net, t_end, dt, limits
+    )
+    n_evaluated = objective.size
+    best = int(np.argmax(objective))
+    if not np.isfinite(objective[best]):
+        return {
+            "ok": False,
+            "reason": "No feasible green-intersecting trajectory under current constraints.",
+            "candidates": n_evaluated,
+        }
+
+    x = np.array([alpha[best // n_t], beta[best // n_t], t_cand[best % n_t]])
+    best_obj = float(objective[best])
+    best_v0 = v0[best]
+    best_stats = {k: v[best] for k, v in stats.items()}
+
+    p = window["dome"]
+    lo = np.array([-p["alpha_max"], p["beta_min"] + (p["beta_max"] - p["beta_min"]) * 0.68, t_lo])
+    hi = np.array([p["alpha_max"], p["beta_max"], t_hi])
+    step = (hi - lo) / np.array([30.0, 11.0, 6.0]) / 2.0
+    stencil = np.stack(np.meshgrid(*([np.array([-1.0, 0.0, 1.0])] * 3), indexing="ij"), axis=-1).reshape(-1, 3)
+    stencil = stencil[np.any(stencil != 0.0, axis=1)]
+    for _ in range(refine_iters):
+        trial = np.clip(x + stencil * step, lo, hi)
+        trial_pts, green = _green_dome_points(window, trial[:, 0], trial[:, 1])
+        obj, trial_v0, trial_stats = _score_set_candidates(
+            S, trial_pts, trial[:, 2], window, h_net, t_end, dt, limits
+        )
+        obj = np.where(green, obj, -np.inf)
+        n_evaluated += obj.size
+        i = int(np.argmax(obj))
+        if obj[i] > best_obj:
+            x, best_obj, best_v0 = trial[i], float(obj[i]), trial_v0[i]
+            best_stats = {k: v[i] for k, v in trial_stats.items()}
+        else:
+            step = step / 2.0
+
+    target, _ = _green_dome_points(window, x[0], x[1])
+    speed = float(np.linalg.norm(best_v0))
+    return {
+        "ok": True,
+        "target": target,
+        "t_hit": float(x[2]),
+        "v0": best_v0,
+        "objective": best_obj,
+        "speed": speed,
+        "elevation_deg": float(np.rad2deg(np.arctan2(best_v0[2], max(1e-9, np.hypot(best_v0[0], best_v0[1]))))),
+        "direction_deg": float(np.rad2deg(np.arctan2(best_v0[1], best_v0[0]))),
+        "green_time": float(best_stats["green_time"]),
+        "yellow_time": float(best_stats["yellow_time"]),
+        "best_lateral_error": float(best_stats["best_lateral_error"]),
+        "peak_q": float(best_stats["peak_q"]),
+        "candidates": n_evaluated,
+    }
+
+
+def validate_scene_config(scene_cfg: dict) -> tuple[bool, str]:
+    try:
+        assert scene_cfg["aspectmode"] == "manual"
+        assert list(scene_cfg["xaxis"]["range"]) == AXIS_RANGES["x"]
+        assert list(scene_cfg["yaxis"]["range"]) == AXIS_RANGES["y"]
+        assert list(scene_cfg["zaxis"]["range"]) == AXIS_RANGES["z"]
+        ar = scene_cfg["aspectratio"]
+        assert ar["x"] == ASPECT_RATIO["x"]
+        assert ar["y"] == ASPECT_RATIO["y"]
+        assert ar["z"] == ASPECT_RATIO["z"]
+        return True, "Scene scale config OK"
+    except AssertionError as exc:
+        return False, f"Scene scale config FAILED: {exc}"
+
+
+class KernelCache:
+    # Thread-safe LRU of read-only array tuples with a byte budget; sessions run on threads.
+    def __init__(self, max_bytes: int = KERNEL_CACHE_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key: tuple, compute) -> tuple:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        value = tuple(compute())
+        for arr in value:
+            arr.flags.writeable = False
+        size = sum(arr.nbytes for arr in value)
+
+        with self._lock:
+            if key in self._entries or size > self.max_bytes:
+                return value
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self.nbytes -= old_size
+                self.evictions += 1
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "mb_used": round(self.nbytes / 1e6, 2),
+                "mb_budget": round(self.max_bytes / 1e6, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+def _quantize(values, quantum: float = KERNEL_CACHE_QUANTUM) -> tuple[int, ...]:
+    return tuple(int(round(float(v) / quantum)) for v in np.ravel(values))
+
+
+def _dequantize(key: tuple[int, ...], quantum: float = KERNEL_CACHE_QUANTUM) -> np.ndarray:
+    return np.array(key, dtype=float) * quantum
+
+
+def cached_trajectory(cache: KernelCache, S: np.ndarray, v0: np.ndarray, t_end: float, dt: float) -> TrajectoryColumns:
+    # Computed from the quantized inputs so every hit returns exactly what the key describes.
+    # Only the float32 (3, n) block is cached; the time axis is implicit.
+    q = _quantize(np.concatenate([S, v0, [t_end, dt]]))
+    x = _dequantize(q)
+
+    def compute():
+        return (TrajectoryColumns.simulate(x[0:3], x[3:6], x[6], x[7]).xyz,)
+
+    (xyz,) = cache.get_or_compute(("trajectory",) + q, compute)
+    return TrajectoryColumns(xyz, x[7])
+
+
+def cached_legal_spike_envelope(
+    cache: KernelCache,
+    P_hit: np.ndarray,
+    h_net: float,
+    nx: int,
+    ny: int,
+    k_samples: int,
+    envelope: LegalSpikeEnvelope | None = None,
+    on_level=None,
+) -> SpikeSegments:
+    # Only the compact float32 (landing, cross) blocks are cached; dense points come from sample().
+    # On a miss, a session's incremental envelope (if given) recomputes only the changed stages.
+    # With on_level, a miss on a grid of at least PROGRESSIVE_MIN_NODES runs
+    # iter_progressive_envelope instead and hands the coarse level, then each refinement level,
+    # to on_level(level); its final level is the same result, so hits skip them.
+    q = _quantize(np.concatenate([P_hit, [h_net]]))
+    x = _dequantize(q)
+    if envelope is None:
+        envelope = LegalSpikeEnvelope(x[0:3], x[3], nx, ny, k_samples)
+
+    def compute():
+        if on_level is not None and nx * ny >= PROGRESSIVE_MIN_NODES:
+            for level in iter_progressive_envelope(x[0:3], x[3], nx, ny):
+                if not level["final"]:
+                    on_level(level)
+            seg = level["segments"]
+        else:
+            seg = envelope.update(x[0:3], x[3], nx, ny, k_samples).segments()
+        return seg.landing, seg.cross
+
+    landing, cross = cache.get_or_compute(("envelope", nx, ny) + q, compute)
+    # Cell area from this call's grid; the session envelope may still be at another nx / ny
+    return SpikeSegments(x[0:3], landing, cross, x[3], grid_cell_area(nx, ny))
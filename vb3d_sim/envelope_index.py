@@ -0,0 +1,320 @@
+﻿import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .core import LandingHeatmap, compute_legal_cell_bitmaps
+
+# Reverse lookups over precomputed envelopes: "which contacts (and set times) have a legal
+# shot into zone 5 past a double block?"
+#   python -m vb3d_sim.envelope_index build --index idx.npz --sweep sweep.jsonl
+#   python -m vb3d_sim.envelope_index query --index idx.npz --zone 5 --blockers 2
+# build adds the sweep's contacts that are not in the index yet.
+#
+# Contacts are bucketed on a uniform grid of CONTACT_CELL_M cubes. Every contact keeps packed
+# bitmaps of the landing (x, y) and net (y, z) bins of LandingHeatmap its legal, unblocked
+# spikes reach, one per wall size; every contact cell keeps the OR of its contacts' bitmaps.
+# A query tests the cell bitmaps first and only the contacts of matching cells after that.
+# Queries work at bin resolution: a bin belongs to a box when its centre is inside. Bitmaps are
+# padded to whole uint64 words; the per-contact ones are stored word-major, (levels, words,
+# contacts), so a test is a few contiguous word ANDs over all contacts.
+
+INDEX_VERSION = 1
+CONTACT_CELL_M = 0.25
+INSERT_BATCH = 512
+BLOCKER_COUNTS = (0, 1, 2, 3)
+
+# Landing zones on the far half, numbered from the defending team's view (facing -x)
+ZONES = {
+    1: ((3.0, 9.0), (1.5, 4.5)),
+    2: ((0.0, 3.0), (1.5, 4.5)),
+    3: ((0.0, 3.0), (-1.5, 1.5)),
+    4: ((0.0, 3.0), (-4.5, -1.5)),
+    5: ((3.0, 9.0), (-4.5, -1.5)),
+    6: ((3.0, 9.0), (-1.5, 1.5)),
+}
+
+
+def _grow(arr: np.ndarray, rows: int) -> np.ndarray:
+    if rows <= arr.shape[0]:
+        return arr
+    out = np.zeros((max(rows, 2 * arr.shape[0]),) + arr.shape[1:], dtype=arr.dtype)
+    out[: arr.shape[0]] = arr
+    return out
+
+
+def _grow_columns(arr: np.ndarray, cols: int) -> np.ndarray:
+    if cols <= arr.shape[-1]:
+        return arr
+    out = np.zeros(arr.shape[:-1] + (max(cols, 2 * arr.shape[-1]),), dtype=arr.dtype)
+    out[..., : arr.shape[-1]] = arr
+    return out
+
+
+def _any_masked(columns: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    # columns is (words, n); only the mask's non-zero words are read
+    hit = np.zeros(columns.shape[-1], dtype=bool)
+    for w in np.flatnonzero(mask):
+        hit |= (columns[w] & mask[w]) != 0
+    return hit
+
+
+def _box_mask(x_edges: np.ndarray, y_edges: np.ndarray, box: tuple) -> np.ndarray:
+    (x0, x1), (y0, y1) = box
+    xc = 0.5 * (x_edges[:-1] + x_edges[1:])
+    yc = 0.5 * (y_edges[:-1] + y_edges[1:])
+    inside = ((xc >= x0) & (xc <= x1))[:, None] & ((yc >= y0) & (yc <= y1))[None, :]
+    return _pack_words(inside.ravel())
+
+
+def _pack_words(bits: np.ndarray) -> np.ndarray:
+    # Packs the last axis of a bool array into little-endian uint64 words
+    packed = np.packbits(bits, axis=-1)
+    pad = -packed.shape[-1] % 8
+    if pad:
+        packed = np.concatenate([packed, np.zeros(packed.shape[:-1] + (pad,), dtype=np.uint8)], axis=-1)
+    return np.ascontiguousarray(packed).view("<u8")
+
+
+class EnvelopeIndex:
+    def __init__(
+        self,
+        h_net: float = 2.43,
+        nx: int = 60,
+        ny: int = 60,
+        blocker_counts: tuple[int, ...] = BLOCKER_COUNTS,
+        cell_size: float = CONTACT_CELL_M,
+    ) -> None:
+        self.h_net = float(h_net)
+        self.nx, self.ny = int(nx), int(ny)
+        self.blocker_counts = tuple(int(c) for c in blocker_counts)
+        self.cell_size = float(cell_size)
+        self.bins = LandingHeatmap(self.nx, self.ny)
+        levels = len(self.blocker_counts)
+        land_words = (self.bins.landing_counts.size + 63) // 64
+        net_words = (self.bins.net_counts.size + 63) // 64
+
+        self.size = 0
+        self._P = np.zeros((0, 3))
+        self._t = np.zeros(0)
+        self._cell = np.zeros(0, dtype=np.int64)
+        self._landing = np.zeros((levels, land_words, 0), dtype="<u8")
+        self._net = np.zeros((levels, net_words, 0), dtype="<u8")
+
+        self.n_cells = 0
+        self._cell_rows: dict[tuple[int, int, int], int] = {}
+        self._cell_keys = np.zeros((0, 3), dtype=np.int64)
+        self._cell_landing = np.zeros((0, levels, land_words), dtype="<u8")
+        self._cell_net = np.zeros((0, levels, net_words), dtype="<u8")
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _cell_ids(self, P: np.ndarray) -> np.ndarray:
+        keys = np.floor(P / self.cell_size).astype(np.int64)
+        ids = np.empty(keys.shape[0], dtype=np.int64)
+        for i, key in enumerate(map(tuple, keys)):
+            row = self._cell_rows.get(key)
+            if row is None:
+                row = self._cell_rows[key] = self.n_cells
+                self.n_cells += 1
+                self._cell_keys = _grow(self._cell_keys, self.n_cells)
+                self._cell_landing = _grow(self._cell_landing, self.n_cells)
+                self._cell_net = _grow(self._cell_net, self.n_cells)
+                self._cell_keys[row] = key
+            ids[i] = row
+        return ids
+
+    def insert(self, P_hits: np.ndarray, t_hits: np.ndarray | None = None) -> np.ndarray:
+        # Adds contacts (with optional set times); returns their ids
+        P_hits = np.atleast_2d(np.asarray(P_hits, dtype=float))
+        m = P_hits.shape[0]
+        t_hits = np.full(m, np.nan) if t_hits is None else np.broadcast_to(np.asarray(t_hits, dtype=float), (m,))
+        ids = np.arange(self.size, self.size + m)
+        end = self.size + m
+        self._P = _grow(self._P, end)
+        self._t = _grow(self._t, end)
+        self._cell = _grow(self._cell, end)
+        self._landing = _grow_columns(self._landing, end)
+        self._net = _grow_columns(self._net, end)
+
+        for lo in range(0, m, INSERT_BATCH):
+            hi = min(lo + INSERT_BATCH, m)
+            bits = compute_legal_cell_bitmaps(P_hits[lo:hi], self.h_net, self.nx, self.ny, self.blocker_counts)
+            landing = _pack_words(bits["landing"])
+            net = _pack_words(bits["net"])
+            cells = self._cell_ids(P_hits[lo:hi])
+            rows = slice(self.size + lo, self.size + hi)
+            self._landing[..., rows] = landing.transpose(1, 2, 0)
+            self._net[..., rows] = net.transpose(1, 2, 0)
+            self._cell[rows] = cells
+            np.bitwise_or.at(self._cell_landing, cells, landing)
+            np.bitwise_or.at(self._cell_net, cells, net)
+
+        self._P[ids] = P_hits
+        self._t[ids] = t_hits
+        self.size = end
+        return ids
+
+    def query(
+        self,
+        zone: int | None = None,
+        landing_box: tuple | None = None,
+        net_window: tuple | None = None,
+        blockers: int = 0,
+        contact_box: tuple | None = None,
+        t_range: tuple[float, float] | None = None,
+    ) -> np.ndarray:
+        # Ids of contacts with a legal spike, unblocked by a wall of `blockers`, landing in the
+        # zone / landing_box ((x0, x1), (y0, y1)) and one crossing net_window ((y0, y1), (z0, z1)).
+        # The two conditions may be met by different spikes. contact_box is ((x0, x1), (y0, y1), (z0, z1)).
+        level = self.blocker_counts.index(int(blockers))
+        if zone is not None:
+            landing_box = ZONES[int(zone)]
+        tests = []
+        if landing_box is not None:
+            mask = _box_mask(self.bins.landing_x_edges, self.bins.landing_y_edges, landing_box)
+            tests.append((self._landing, self._cell_landing, mask))
+        if net_window is not None:
+            mask = _box_mask(self.bins.net_y_edges, self.bins.net_z_edges, net_window)
+            tests.append((self._net, self._cell_net, mask))
+
+        cell_ok = np.ones(self.n_cells, dtype=bool)
+        for _, cell_bits, mask in tests:
+            cell_ok &= (cell_bits[: self.n_cells, level] & mask).any(axis=1)
+        if contact_box is not None:
+            # Cells overlapping the box; contacts are checked exactly below
+            lo = self._cell_keys[: self.n_cells] * self.cell_size
+            for axis, (a, b) in enumerate(contact_box):
+                cell_ok &= (lo[:, axis] <= b) & (lo[:, axis] + self.cell_size >= a)
+
+        ok = cell_ok[self._cell[: self.size]]
+        if ok.sum() * 4 > self.size:
+            # Most cells match: a contiguous scan beats gathering the candidates
+            for bits, _, mask in tests:
+                ok &= _any_masked(bits[level, :, : self.size], mask)
+            ids = np.flatnonzero(ok)
+        else:
+            ids = np.flatnonzero(ok)
+            for bits, _, mask in tests:
+                ids = ids[_any_masked(bits[level][:, ids], mask)]
+        if contact_box is not None:
+            P = self._P[ids]
+            keep = np.ones(ids.size, dtype=bool)
+            for axis, (a, b) in enumerate(contact_box):
+                keep &= (P[:, axis] >= a) & (P[:, axis] <= b)
+            ids = ids[keep]
+        if t_range is not None:
+            t = self._t[ids]
+            ids = ids[(t >= t_range[0]) & (t <= t_range[1])]
+        return ids
+
+    def entries(self, ids: np.ndarray) -> dict:
+        ids = np.asarray(ids, dtype=np.int64)
+        return {"P_hit": self._P[ids].copy(), "t_hit": self._t[ids].copy()}
+
+    def save(self, path: str | Path) -> None:
+        meta = {
+            "version": INDEX_VERSION,
+            "h_net": self.h_net,
+            "nx": self.nx,
+            "ny": self.ny,
+            "blocker_counts": list(self.blocker_counts),
+            "cell_size": self.cell_size,
+        }
+        n, c = self.size, self.n_cells
+        np.savez_compressed(
+            path,
+            meta=np.array(json.dumps(meta)),
+            P=self._P[:n],
+            t=self._t[:n],
+            cell=self._cell[:n],
+            landing=self._landing[..., :n],
+            net=self._net[..., :n],
+            cell_keys=self._cell_keys[:c],
+            cell_landing=self._cell_landing[:c],
+            cell_net=self._cell_net[:c],
+        )
+
+    @classmethod
+    def load(cls, path: str | Path) -> "EnvelopeIndex":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta["version"] != INDEX_VERSION:
+                raise ValueError(f"Unsupported envelope index version {meta['version']} in {path}")
+            index = cls(meta["h_net"], meta["nx"], meta["ny"], tuple(meta["blocker_counts"]), meta["cell_size"])
+            index._P, index._t, index._cell = data["P"], data["t"], data["cell"]
+            index._landing, index._net = data["landing"], data["net"]
+            index._cell_keys = data["cell_keys"]
+            index._cell_landing, index._cell_net = data["cell_landing"], data["cell_net"]
+        index.size = index._P.shape[0]
+        index.n_cells = index._cell_keys.shape[0]
+        index._cell_rows = {tuple(key): row for row, key in enumerate(index._cell_keys.tolist())}
+        return index
+
+
+def _parse_range(spec: str | None) -> tuple[float, float] | None:
+    if spec is None:
+        return None
+    lo, hi = spec.split(":")
+    return float(lo), float(hi)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Build or query a contact -> legal landing index")
+    parser.add_argument("command", choices=("build", "query"))
+    parser.add_argument("--index", required=True, help=".npz index file (created by build if missing)")
+    parser.add_argument("--sweep", help="build: JSON-lines output of sweep.py")
+    parser.add_argument("--h-net", type=float, default=2.43)
+    parser.add_argument("--zone", type=int, choices=sorted(ZONES))
+    parser.add_argument("--landing-x", help="query: x0:x1 of a landing box (with --landing-y)")
+    parser.add_argument("--landing-y")
+    parser.add_argument("--net-y", help="query: y0:y1 of a net window (with --net-z)")
+    parser.add_argument("--net-z")
+    parser.add_argument("--blockers", type=int, default=0)
+    parser.add_argument("--t-range", help="query: t0:t1 set times")
+    parser.add_argument("--limit", type=int, default=20, help="query: contacts to print")
+    args = parser.parse_args(argv)
+
+    path = Path(args.index)
+    if args.command == "build":
+        index = EnvelopeIndex.load(path) if path.exists() else EnvelopeIndex(args.h_net)
+        seen = set(map(tuple, np.column_stack([index._P[: index.size], index._t[: index.size]]).tolist()))
+        rows = []
+        with open(args.sweep, "r", encoding="utf-8") as fh:
+            for line in fh:
+                rec = json.loads(line)
+                row = (rec["x_t"], rec["y_t"], rec["z_t"], rec["t_hit"])
+                if row not in seen:
+                    seen.add(row)
+                    rows.append(row)
+        t0 = time.perf_counter()
+        if rows:
+            rows = np.array(rows, dtype=float)
+            index.insert(rows[:, :3], rows[:, 3])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        index.save(path)
+        print(json.dumps({"added": len(rows), "contacts": len(index), "cells": index.n_cells, "elapsed_s": time.perf_counter() - t0}))
+        return
+
+    index = EnvelopeIndex.load(path)
+    landing_box = None
+    if args.landing_x is not None:
+        landing_box = (_parse_range(args.landing_x), _parse_range(args.landing_y))
+    net_window = None
+    if args.net_y is not None:
+        net_window = (_parse_range(args.net_y), _parse_range(args.net_z))
+    t0 = time.perf_counter()
+    ids = index.query(args.zone, landing_box, net_window, args.blockers, t_range=_parse_range(args.t_range))
+    elapsed = time.perf_counter() - t0
+    found = index.entries(ids[: args.limit])
+    print(f"{ids.size} of {len(index)} contacts in {elapsed * 1e3:.3f} ms", file=sys.stderr)
+    for P, t in zip(found["P_hit"], found["t_hit"]):
+        print(json.dumps({"P_hit": [round(float(c), 4) for c in P], "t_hit": None if np.isnan(t) else float(t)}))
+
+
+if __name__ == "__main__":
+    main()
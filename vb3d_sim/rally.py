@@ -0,0 +1,408 @@
+﻿import argparse
+import json
+import time
+
+import numpy as np
+
+from .core import (
+    COURT_LENGTH,
+    G,
+    X_MAX,
+    Y_MAX,
+    block_anchor_from_hitter,
+    classify_blocked_attacks,
+    compute_flight_events,
+    integrate_trajectories_adaptive,
+    omega_from_spin,
+    solve_v0_from_target,
+)
+from .spans import timed
+
+# Batched Monte Carlo rallies: serve -> pass -> set -> attack -> block -> dig -> set -> ...
+#   python -m vb3d_sim.rally --rallies 20000 --seed 7
+# Every phase runs on the array of rallies still alive. Positions are kept in the frame of the
+# team playing the ball, which always attacks towards +x; crossing the net mirrors
+# (x, y) -> (-x, -y) into the other team's frame. Serves and spikes fly with drag + Magnus
+# (adaptive integrator, net / floor events); passes, digs and sets are slow enough for the
+# analytic drag-free events. Team 0 serves every rally.
+
+RALLY_DEFAULTS = {
+    "h_net": 2.43,
+    "max_attacks": 12,
+    # Serve: jump serves are topspin, the rest float
+    "jump_serve_share": 0.45,
+    "jump_serve_clearance": (0.1, 0.6),
+    "float_serve_clearance": (0.2, 0.8),
+    "serve_spin_rps": 5.0,
+    "serve_height": (2.4, 3.2),
+    "serve_depth": (3.0, 8.5),
+    "serve_aim_sigma": 1.1,
+    # First contact (reception / dig) towards the setter
+    "receivers": ((-6.0, -3.0), (-6.5, 0.0), (-6.0, 3.0)),
+    "defenders": ((-7.0, -3.2), (-7.5, 0.0), (-7.0, 3.2)),
+    "pass_base": 0.97,
+    "pass_reach": 25.0,
+    "pass_speed_ref": 15.0,
+    "pass_speed_scale": 30.0,
+    "dig_base": 0.9,
+    "dig_reach": 4.0,
+    "dig_speed_ref": 10.0,
+    "dig_speed_scale": 12.0,
+    "contact_height": 0.8,
+    "setter_target": (-0.7, 1.0, 2.5),
+    "pass_time": 1.2,
+    "pass_sigma": (0.3, 1.6),
+    "setter_reach": 2.2,
+    "free_ball_quality": 0.9,
+    # Set and attack
+    "hitters": {
+        "outside": {"share": 0.45, "x": -1.0, "y": 3.6, "t_set": 0.95, "blockers": 2},
+        "middle": {"share": 0.25, "x": -0.6, "y": -0.2, "t_set": 0.45, "blockers": 1},
+        "opposite": {"share": 0.30, "x": -1.0, "y": -3.6, "t_set": 0.85, "blockers": 2},
+    },
+    "hitter_reach": (3.0, 3.4),
+    "set_sigma": (0.1, 0.6),
+    "set_tolerance": 0.9,
+    "spike_speed": (16.0, 26.0),
+    "spike_spin_rps": 8.0,
+    "attack_aim_sigma": 0.6,
+    "extra_blocker_chance": 0.5,
+    "block_formed_share": 0.5,
+    "stuff_share": 0.2,
+    "tool_share": 0.15,
+}
+
+OUTCOMES = (
+    "unfinished",
+    "serve_error",
+    "ace",
+    "reception_error",
+    "set_error",
+    "attack_error",
+    "kill",
+    "block_point",
+)
+_CODE = {name: i for i, name in enumerate(OUTCOMES)}
+# Outcomes the acting team wins; the others it loses ("unfinished" has no winner)
+_ACTOR_WINS = {"ace", "kill"}
+
+
+def _mirror(P: np.ndarray) -> np.ndarray:
+    out = P.copy()
+    out[:, :2] *= -1.0
+    return out
+
+
+def _in_court(P: np.ndarray) -> np.ndarray:
+    # Far half of the current frame, lines are in
+    return (P[:, 0] > 0.0) & (P[:, 0] <= X_MAX) & (np.abs(P[:, 1]) <= Y_MAX)
+
+
+def _reach_probability(
+    landing: np.ndarray, speed: np.ndarray, players: np.ndarray, base: float, reach: float, speed_ref: float, scale: float
+) -> np.ndarray:
+    # landing is in the receiving team's frame; chance falls off with the distance to the
+    # nearest player and with how fast the ball arrives
+    d = np.sqrt(((landing[:, None, :2] - players[None, :, :]) ** 2).sum(axis=2)).min(axis=1)
+    return base * np.exp(-d / reach) * np.exp(-np.maximum(0.0, speed - speed_ref) / scale)
+
+
+def _fly_aero(S: np.ndarray, v0: np.ndarray, h_net: float, omega: np.ndarray, t_end: float = 4.0) -> tuple[dict, np.ndarray]:
+    # Adaptive drag + Magnus flight; returns the events and the floor-contact speed
+    _, _, V, offsets, events = integrate_trajectories_adaptive(S, v0, t_end, h_net, omega)
+    speed = np.linalg.norm(V[offsets[1:] - 1], axis=1)
+    return events, speed
+
+
+@timed("rally.serve")
+def _serve(n: int, rng: np.random.Generator, p: dict) -> dict:
+    h_net = p["h_net"]
+    S = np.column_stack(
+        [
+            -COURT_LENGTH / 2.0 - rng.uniform(0.5, 1.5, n),
+            rng.uniform(-4.0, 4.0, n),
+            rng.uniform(*p["serve_height"], n),
+        ]
+    )
+    jump = rng.random(n) < p["jump_serve_share"]
+    target = np.column_stack([rng.uniform(*p["serve_depth"], n), rng.uniform(-3.8, 3.8, n), np.zeros(n)])
+    z_net = h_net + np.where(
+        jump, rng.uniform(*p["jump_serve_clearance"], n), rng.uniform(*p["float_serve_clearance"], n)
+    )
+    noise = np.column_stack([rng.normal(0.0, p["serve_aim_sigma"], (n, 2)), rng.normal(0.0, p["serve_aim_sigma"] / 4.0, n)])
+
+    # The server knows their serve: the drag-free plan is flown once and the tape height and
+    # target are shifted by how far the real flight missed them, then executed with noise
+    spins = ((jump, omega_from_spin("Topspin", p["serve_spin_rps"])), (~jump, None))
+    planned = _fly_serves(S, _serve_velocity(S, target, z_net), h_net, spins)
+    miss_net = np.nan_to_num(z_net - planned["z_net"])
+    miss_floor = np.nan_to_num(target[:, :2] - planned["landing"][:, :2])
+    aim = target.copy()
+    aim[:, :2] += miss_floor + noise[:, :2]
+    return _fly_serves(S, _serve_velocity(S, aim, z_net + miss_net + noise[:, 2]), h_net, spins)
+
+
+def _serve_velocity(S: np.ndarray, target: np.ndarray, z_net: np.ndarray) -> np.ndarray:
+    # Drag-free parabola from S through height z_net above the net line and down onto target
+    D = np.linalg.norm((target - S)[:, :2], axis=1)
+    f = -S[:, 0] / (target[:, 0] - S[:, 0])
+    curv = np.maximum((z_net - S[:, 2] * (1.0 - f)) / (f * D * (D - f * D)), 1e-6)
+    return solve_v0_from_target(S, target, (D * np.sqrt(2.0 * curv / G))[:, None])
+
+
+def _fly_serves(S: np.ndarray, v0: np.ndarray, h_net: float, spins: tuple) -> dict:
+    n = S.shape[0]
+    clears = np.zeros(n, dtype=bool)
+    z_net = np.full(n, np.nan)
+    landing = np.full((n, 3), np.nan)
+    land_speed = np.zeros(n)
+    # The spin vector is shared per integrator call, so each serve type gets its own batch
+    for mask, omega in spins:
+        idx = np.flatnonzero(mask)
+        if idx.size == 0:
+            continue
+        events, v_floor = _fly_aero(S[idx], v0[idx], h_net, omega)
+        clears[idx] = events["clears_net"]
+        z_net[idx] = events["z_net"]
+        landing[idx] = events["floor_pts"]
+        land_speed[idx] = v_floor
+    return {"clears": clears, "z_net": z_net, "landing": landing, "speed": land_speed}
+
+
+@timed("rally.first_contact")
+def _first_contact(C: np.ndarray, quality: np.ndarray, rng: np.random.Generator, p: dict) -> dict:
+    # Pass or dig from C (own half) to the setter; quality in [0, 1] scales the error
+    m = C.shape[0]
+    lo, hi = p["pass_sigma"]
+    sigma = lo + (hi - lo) * (1.0 - quality)
+    target = np.broadcast_to(np.array(p["setter_target"], dtype=float), (m, 3)).copy()
+    target[:, :2] += rng.normal(0.0, 1.0, (m, 2)) * sigma[:, None]
+    v0 = solve_v0_from_target(C, target, p["pass_time"])
+    events = compute_flight_events(C, v0, p["h_net"])
+    over = events["crosses_net"] & (events["t_net"] < p["pass_time"])
+    miss = np.linalg.norm(target[:, :2] - np.asarray(p["setter_target"][:2]), axis=1)
+    return {
+        "setter": target,
+        "quality": np.clip(1.0 - miss / p["setter_reach"], 0.0, 1.0),
+        "over": over,
+        "over_clears": over & events["clears_net"],
+        "over_landing": events["floor_pts"],
+        "error": ~over & (miss > p["setter_reach"]),
+    }
+
+
+@timed("rally.set")
+def _set(A: np.ndarray, quality: np.ndarray, rng: np.random.Generator, p: dict) -> dict:
+    m = A.shape[0]
+    hitters = list(p["hitters"].values())
+    shares = np.array([h["share"] for h in hitters], dtype=float)
+    choice = rng.choice(len(hitters), size=m, p=shares / shares.sum())
+    plan = np.column_stack(
+        [
+            np.array([h["x"] for h in hitters])[choice],
+            np.array([h["y"] for h in hitters])[choice],
+            rng.uniform(*p["hitter_reach"], m),
+        ]
+    )
+    t_set = np.array([h["t_set"] for h in hitters])[choice]
+    lo, hi = p["set_sigma"]
+    miss = rng.normal(0.0, 1.0, (m, 2)) * (lo + (hi - lo) * (1.0 - quality))[:, None]
+    P_set = plan.copy()
+    P_set[:, :2] += miss
+    # A set that drifts over the net before the hitter gets there is the setter's error
+    events = compute_flight_events(A, solve_v0_from_target(A, P_set, t_set[:, None]), p["h_net"])
+    over = events["crosses_net"] & (events["t_net"] < t_set)
+    dist = np.linalg.norm(miss, axis=1)
+    # The hitter can chase a loose set but loses height on it
+    P_hit = P_set.copy()
+    P_hit[:, 0] = np.minimum(P_hit[:, 0], -0.1)
+    P_hit[:, 2] -= 0.5 * np.minimum(dist, p["set_tolerance"])
+    blockers = np.array([h["blockers"] for h in hitters])[choice]
+    blockers = blockers + (rng.random(m) < p["extra_blocker_chance"] * (1.0 - quality))
+    return {
+        "P_hit": P_hit,
+        "quality": np.clip(1.0 - dist / p["set_tolerance"], 0.0, 1.0),
+        "blockers": np.minimum(blockers, 3),
+        "error": over | (dist > 2.0 * p["set_tolerance"]),
+    }
+
+
+@timed("rally.attack")
+def _attack(P_hit: np.ndarray, quality: np.ndarray, blockers: np.ndarray, rng: np.random.Generator, p: dict) -> dict:
+    m = P_hit.shape[0]
+    h_net = p["h_net"]
+    aim = np.column_stack([rng.uniform(1.5, 8.5, m), rng.uniform(-4.2, 4.2, m)])
+    # Hitters pick straight lines that clear the tape inside the antennae; redraw the others
+    for _ in range(4):
+        s = -P_hit[:, 0] / (aim[:, 0] - P_hit[:, 0])
+        bad = (P_hit[:, 2] * (1.0 - s) < h_net) | (np.abs(P_hit[:, 1] + s * (aim[:, 1] - P_hit[:, 1])) > Y_MAX)
+        if not bad.any():
+            break
+        aim[bad] = np.column_stack([rng.uniform(1.5, 8.5, bad.sum()), rng.uniform(-4.2, 4.2, bad.sum())])
+    aim += rng.normal(0.0, p["attack_aim_sigma"], (m, 2))
+    lo, hi = p["spike_speed"]
+    speed = rng.uniform(lo, hi, m) * (0.75 + 0.25 * quality)
+
+    # Block on the intended line, one classification per wall size
+    formed = rng.random(m) < p["block_formed_share"]
+    blocked = np.zeros(m, dtype=bool)
+    anchor = block_anchor_from_hitter(P_hit[:, 1])
+    for count in (1, 2, 3):
+        idx = np.flatnonzero(formed & (blockers == count))
+        if idx.size:
+            blocked[idx] = classify_blocked_attacks(P_hit[idx], aim[idx], h_net, anchor[idx], count)["blocked"]
+
+    direction = np.column_stack([aim, np.zeros(m)]) - P_hit
+    v0 = direction * (speed / np.linalg.norm(direction, axis=1))[:, None]
+    clears = np.zeros(m, dtype=bool)
+    landing = np.full((m, 3), np.nan)
+    land_speed = np.zeros(m)
+    free = np.flatnonzero(~blocked)
+    if free.size:
+        events, v_floor = _fly_aero(P_hit[free], v0[free], h_net, omega_from_spin("Topspin", p["spike_spin_rps"]))
+        clears[free] = events["clears_net"]
+        landing[free] = events["floor_pts"]
+        land_speed[free] = v_floor
+    touch = rng.random(m)
+    return {
+        "blocked": blocked,
+        "stuff": blocked & (touch < p["stuff_share"]),
+        "tool": blocked & (touch >= p["stuff_share"]) & (touch < p["stuff_share"] + p["tool_share"]),
+        "clears": clears,
+        "landing": landing,
+        "speed": land_speed,
+    }
+
+
+def simulate_rallies(n: int, seed: int = 0, params: dict | None = None) -> dict:
+    p = {**RALLY_DEFAULTS, **(params or {})}
+    rng = np.random.default_rng(seed)
+    receivers = np.array(p["receivers"], dtype=float)
+    defenders = np.array(p["defenders"], dtype=float)
+
+    outcome = np.zeros(n, dtype=np.int8)
+    winner = np.full(n, -1, dtype=np.int8)
+    attacks = np.zeros(n, dtype=np.int16)
+    contacts = np.ones(n, dtype=np.int16)
+    team = np.zeros(n, dtype=np.int8)  # team playing the ball next
+
+    def finish(idx: np.ndarray, name: str, actor: np.ndarray) -> None:
+        outcome[idx] = _CODE[name]
+        winner[idx] = actor if name in _ACTOR_WINS else 1 - actor
+
+    serve = _serve(n, rng, p)
+    idx = np.arange(n)
+    finish(idx[~serve["clears"]], "serve_error", 0)
+    ok = serve["clears"]
+    out = ok & ~_in_court(serve["landing"])
+    finish(idx[out], "serve_error", 0)
+    live = idx[ok & ~out]
+    landing = _mirror(serve["landing"][live])
+    p_pass = _reach_probability(
+        landing, serve["speed"][live], receivers, p["pass_base"], p["pass_reach"], p["pass_speed_ref"], p["pass_speed_scale"]
+    )
+    passed = rng.random(live.size) < p_pass
+    finish(live[~passed], "ace", 0)
+    live, C, quality = live[passed], landing[passed], p_pass[passed]
+    C[:, 2] = p["contact_height"]
+    team[live] = 1
+
+    for _ in range(p["max_attacks"]):
+        if live.size == 0:
+            break
+        contacts[live] += 1
+        fc = _first_contact(C, quality, rng, p)
+        actor = team[live]
+        err = fc["error"] | (fc["over"] & ~fc["over_clears"])
+        finish(live[err], "reception_error", actor[err])
+
+        # Overpasses that clear the net are free balls for the other side
+        fb = fc["over_clears"]
+        fb_out = fb & ~_in_court(fc["over_landing"])
+        finish(live[fb_out], "reception_error", actor[fb_out])
+        fb &= ~fb_out
+        fb_live = live[fb]
+        fb_C = _mirror(fc["over_landing"][fb])
+        team[fb_live] = 1 - team[fb_live]
+
+        go = ~(fc["error"] | fc["over"])
+        live, setter, quality = live[go], fc["setter"][go], fc["quality"][go]
+        contacts[live] += 1
+        st = _set(setter, quality, rng, p)
+        finish(live[st["error"]], "set_error", team[live[st["error"]]])
+        go = ~st["error"]
+        live = live[go]
+        contacts[live] += 1
+        attacks[live] += 1
+        at = _attack(st["P_hit"][go], st["quality"][go], st["blockers"][go], rng, p)
+        actor = team[live]
+
+        finish(live[at["stuff"]], "block_point", actor[at["stuff"]])
+        finish(live[at["tool"]], "kill", actor[at["tool"]])
+        flown = ~at["blocked"]
+        err = flown & (~at["clears"] | ~_in_court(at["landing"]))
+        finish(live[err], "attack_error", actor[err])
+
+        # Soft block touches drop into the defence's own half
+        soft = at["blocked"] & ~at["stuff"] & ~at["tool"]
+        soft_C = np.column_stack(
+            [-rng.uniform(1.0, 5.0, soft.sum()), rng.uniform(-4.0, 4.0, soft.sum()), np.full(soft.sum(), p["contact_height"])]
+        )
+
+        land = flown & ~err
+        dig_C = _mirror(at["landing"][land])
+        p_dig = _reach_probability(
+            dig_C, at["speed"][land], defenders, p["dig_base"], p["dig_reach"], p["dig_speed_ref"], p["dig_speed_scale"]
+        )
+        dug = rng.random(p_dig.size) < p_dig
+        finish(live[land][~dug], "kill", actor[land][~dug])
+        dig_C[:, 2] = p["contact_height"]
+
+        nxt = np.concatenate([live[soft], live[land][dug]])
+        team[nxt] = 1 - team[nxt]
+        contacts[live[soft]] += 1
+        live = np.concatenate([nxt, fb_live])
+        C = np.concatenate([soft_C, dig_C[dug], fb_C])
+        C[:, 2] = p["contact_height"]
+        quality = np.concatenate(
+            [np.full(soft.sum(), p["free_ball_quality"]), p_dig[dug], np.full(fb_live.size, p["free_ball_quality"])]
+        )
+
+    return {"outcome": outcome, "winner": winner, "attacks": attacks, "contacts": contacts}
+
+
+def rally_statistics(result: dict) -> dict:
+    outcome, winner = result["outcome"], result["winner"]
+    n = outcome.size
+    counts = np.bincount(outcome, minlength=len(OUTCOMES))
+    finished = winner >= 0
+    n_attacks = int(result["attacks"].sum())
+    return {
+        "rallies": n,
+        "outcomes": {name: int(c) for name, c in zip(OUTCOMES, counts)},
+        "outcome_share": {name: float(c) / max(1, n) for name, c in zip(OUTCOMES, counts)},
+        "server_win_rate": float((winner == 0).sum()) / max(1, int(finished.sum())),
+        "side_out_rate": float((winner == 1).sum()) / max(1, int(finished.sum())),
+        "mean_attacks": float(result["attacks"].mean()) if n else 0.0,
+        "mean_contacts": float(result["contacts"].mean()) if n else 0.0,
+        "kill_rate": float(counts[_CODE["kill"]]) / max(1, n_attacks),
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Monte Carlo rally simulation with aggregate outcome statistics")
+    parser.add_argument("--rallies", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--params", help="JSON object overriding RALLY_DEFAULTS")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    result = simulate_rallies(args.rallies, args.seed, json.loads(args.params) if args.params else None)
+    elapsed = time.perf_counter() - t0
+    stats = rally_statistics(result)
+    stats.update({"seed": args.seed, "elapsed_s": elapsed, "rallies_per_s": args.rallies / max(elapsed, 1e-9)})
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
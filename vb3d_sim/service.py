@@ -0,0 +1,348 @@
+﻿import argparse
+import asyncio
+import json
+import os
+import struct
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+from websockets.asyncio.server import serve
+from websockets.datastructures import Headers
+from websockets.exceptions import ConnectionClosed
+from websockets.http11 import Response
+
+from .core import (
+    auto_tune_set,
+    compute_flight_events,
+    compute_spike_segments,
+    hitting_window,
+    simulate_trajectory,
+    solve_v0_from_target,
+)
+
+# Local simulation service for the 3D frontend and scripts:  python -m vb3d_sim.service --port 8765
+#
+# WebSocket (ws://host:port/ws): text messages {"id": 7, "op": "envelope", "channel": "spike",
+# "params": {...}}. A newer message on the same channel cancels the older one, which is answered
+# with {"id": 7, "cancelled": true}. Results come back as binary frames, errors as {"id", "error"}.
+# HTTP: GET /v1/<op>?P_hit=-0.8,3.8,3.1&h_net=2.43 returns one frame; GET /health returns stats.
+#
+# Identical requests in flight share one computation and finished frames stay in an LRU, so
+# every client shares one warm engine. Kernels run in a process pool.
+#
+# Frame: b"VB3D" | uint32 request id | uint32 header length | JSON header, space-padded so the
+# data starts 4-byte aligned | array data. The header is {"op", "meta", "arrays": {name:
+# {"dtype", "shape", "offset"}}} with offsets from the data start; arrays are little-endian
+# float32 (uint8 for masks) and each starts 4-byte aligned.
+
+FRAME_MAGIC = b"VB3D"
+FRAME_PREFIX = struct.Struct("<4sII")
+FRAME_CONTENT_TYPE = "application/x-vb3d-frame"
+RESULT_CACHE_BYTES = 64 * 1024 * 1024
+MAX_ENVELOPE_SAMPLES = 160
+# Longest contact time / extra flight a request may ask for; keeps worker allocations bounded
+MAX_FLIGHT_S = 5.0
+
+
+def encode_frame(op: str, meta: dict, arrays: dict[str, np.ndarray]) -> bytes:
+    layout = {}
+    chunks = []
+    offset = 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr, dtype=np.uint8 if arr.dtype == bool else np.float32)
+        layout[name] = {"dtype": arr.dtype.name, "shape": list(arr.shape), "offset": offset}
+        raw = arr.astype(arr.dtype.newbyteorder("<"), copy=False).tobytes()
+        chunks.append(raw + b"\0" * (-len(raw) % 4))
+        offset += len(chunks[-1])
+    header = json.dumps({"op": op, "meta": meta, "arrays": layout}, separators=(",", ":")).encode("utf-8")
+    header += b" " * (-(FRAME_PREFIX.size + len(header)) % 4)
+    return FRAME_PREFIX.pack(FRAME_MAGIC, 0, len(header)) + header + b"".join(chunks)
+
+
+def decode_frame(frame: bytes) -> tuple[int, dict, dict[str, np.ndarray]]:
+    magic, request_id, header_len = FRAME_PREFIX.unpack_from(frame)
+    if magic != FRAME_MAGIC:
+        raise ValueError("Not a VB3D frame")
+    start = FRAME_PREFIX.size + header_len
+    header = json.loads(frame[FRAME_PREFIX.size : start])
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"]).newbyteorder("<")
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        arrays[name] = np.frombuffer(frame, dtype=dtype, count=count, offset=start + spec["offset"]).reshape(spec["shape"])
+    return request_id, header, arrays
+
+
+def _with_id(frame: bytes, request_id: int) -> bytes:
+    out = bytearray(frame)
+    struct.pack_into("<I", out, 4, request_id & 0xFFFFFFFF)
+    return bytes(out)
+
+
+def _vec(params: dict, name: str, default=None) -> np.ndarray:
+    value = params.get(name, default)
+    if value is None:
+        raise ValueError(f"Missing parameter {name!r}")
+    arr = np.asarray(value, dtype=float)
+    if arr.shape[-1:] != (3,):
+        raise ValueError(f"{name} must be a 3-vector or a list of 3-vectors")
+    return arr
+
+
+def _num(params: dict, name: str, default=None) -> float:
+    value = params.get(name, default)
+    if value is None:
+        raise ValueError(f"Missing parameter {name!r}")
+    return float(value)
+
+
+def _bounded(params: dict, name: str, default, lo: float, hi: float, lo_open: bool = False) -> float:
+    value = _num(params, name, default)
+    if not (lo < value <= hi if lo_open else lo <= value <= hi):
+        raise ValueError(f"{name} must be in {'(' if lo_open else '['}{lo:g}, {hi:g}]")
+    return value
+
+
+def _op_solve_v0(params: dict) -> tuple[dict, dict]:
+    S, P_hit = _vec(params, "S"), _vec(params, "P_hit")
+    t_hit = np.asarray(params.get("t_hit", 0.55), dtype=float)
+    # Scalar or per-target contact times, each bounded like the other ops' t_hit
+    if not np.all((t_hit > 0.0) & (t_hit <= MAX_FLIGHT_S)):
+        raise ValueError(f"t_hit must be in (0, {MAX_FLIGHT_S:g}]")
+    v0 = solve_v0_from_target(S, P_hit, t_hit if t_hit.ndim == 0 else t_hit[:, None])
+    return {}, {"v0": v0}
+
+
+def _op_trajectory(params: dict) -> tuple[dict, dict]:
+    S, P_hit = _vec(params, "S"), _vec(params, "P_hit")
+    t_hit = _bounded(params, "t_hit", None, 0.0, MAX_FLIGHT_S, lo_open=True)
+    t_after = _bounded(params, "t_after", 0.3, 0.0, MAX_FLIGHT_S)
+    dt = _bounded(params, "dt", 0.01, 1e-4, 0.1)
+    v0 = solve_v0_from_target(S, P_hit, t_hit)
+    t, R = simulate_trajectory(S, v0, t_hit + t_after, dt)
+    events = compute_flight_events(S, v0, _num(params, "h_net", 2.43))
+    meta = {"set_crosses_net": bool(events["t_net"][0] <= t_hit + 1e-9), "t_floor": float(events["t_floor"][0])}
+    return meta, {"v0": v0, "t": t, "R": R}
+
+
+def _op_flight_events(params: dict) -> tuple[dict, dict]:
+    S, v0 = _vec(params, "S"), _vec(params, "v0")
+    events = compute_flight_events(S, v0, _num(params, "h_net", 2.43))
+    return {}, {k: v for k, v in events.items()}
+
+
+def _op_envelope(params: dict) -> tuple[dict, dict]:
+    P_hit, h_net = _vec(params, "P_hit"), _num(params, "h_net", 2.43)
+    nx, ny, k = (int(_num(params, name, d)) for name, d in (("nx", 60), ("ny", 60), ("k_samples", 10)))
+    if not (2 <= nx <= MAX_ENVELOPE_SAMPLES and 2 <= ny <= MAX_ENVELOPE_SAMPLES and 2 <= k <= 64):
+        raise ValueError(f"nx, ny must be in [2, {MAX_ENVELOPE_SAMPLES}] and k_samples in [2, 64]")
+    segments = compute_spike_segments(P_hit, h_net, nx, ny)
+    # Constant axes (landing z = 0, crossing x = 0) are not sent
+    arrays = {"landing_xy": segments.landing.T, "cross_yz": segments.cross.T}
+    if params.get("dense"):
+        arrays["env_pts"] = segments.sample(k)
+    return {"legal_count": len(segments)}, arrays
+
+
+def _op_auto_tune(params: dict) -> tuple[dict, dict]:
+    S, hitter_top = _vec(params, "S"), _vec(params, "hitter_top")
+    h_net = _num(params, "h_net", 2.43)
+    nominal_time = _bounded(params, "nominal_time", 0.55, 0.0, MAX_FLIGHT_S, lo_open=True)
+    t_after = _bounded(params, "t_after", 0.3, 0.0, MAX_FLIGHT_S)
+    tuned = auto_tune_set(S, hitting_window(hitter_top), nominal_time, h_net)
+    if not tuned["ok"]:
+        return {"ok": False, "reason": tuned["reason"]}, {}
+    t, R = simulate_trajectory(S, tuned["v0"], tuned["t_hit"] + t_after, 0.005)
+    meta = {k: v for k, v in tuned.items() if k not in ("target", "v0")}
+    return meta, {"target": tuned["target"], "v0": tuned["v0"], "t": t, "R": R}
+
+
+OPS = {
+    "solve_v0": _op_solve_v0,
+    "trajectory": _op_trajectory,
+    "flight_events": _op_flight_events,
+    "envelope": _op_envelope,
+    "auto_tune": _op_auto_tune,
+}
+
+
+def run_op(op: str, params: dict) -> bytes:
+    # Runs in a worker process; the frame is encoded there so the event loop only moves bytes
+    meta, arrays = OPS[op](params)
+    return encode_frame(op, meta, arrays)
+
+
+class _Job:
+    __slots__ = ("future", "waiters")
+
+    def __init__(self, future: asyncio.Future) -> None:
+        self.future = future
+        self.waiters = 0
+
+
+class SimulationService:
+    def __init__(self, workers: int | None = None, cache_bytes: int = RESULT_CACHE_BYTES, executor=None) -> None:
+        self.executor = executor or ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+        self.cache_bytes = cache_bytes
+        self._cache: OrderedDict[str, bytes] = OrderedDict()
+        self._cached_bytes = 0
+        self._inflight: dict[str, _Job] = {}
+        self.counters = {"requests": 0, "computed": 0, "coalesced": 0, "cache_hits": 0, "cancelled": 0, "errors": 0}
+
+    def stats(self) -> dict:
+        return {**self.counters, "in_flight": len(self._inflight), "cached": len(self._cache), "cached_bytes": self._cached_bytes}
+
+    def _remember(self, key: str, frame: bytes) -> None:
+        if len(frame) > self.cache_bytes:
+            return
+        self._cache[key] = frame
+        self._cached_bytes += len(frame)
+        while self._cached_bytes > self.cache_bytes:
+            _, old = self._cache.popitem(last=False)
+            self._cached_bytes -= len(old)
+
+    def _finish(self, key: str, job: _Job) -> None:
+        if self._inflight.get(key) is job:
+            del self._inflight[key]
+        fut = job.future
+        if not fut.cancelled() and fut.exception() is None:
+            self._remember(key, fut.result())
+
+    async def submit(self, op: str, params: dict) -> bytes:
+        if op not in OPS:
+            raise ValueError(f"Unknown op {op!r}; expected one of {sorted(OPS)}")
+        self.counters["requests"] += 1
+        key = json.dumps([op, params], sort_keys=True, separators=(",", ":"))
+        frame = self._cache.get(key)
+        if frame is not None:
+            self._cache.move_to_end(key)
+            self.counters["cache_hits"] += 1
+            return frame
+
+        job = self._inflight.get(key)
+        if job is None:
+            loop = asyncio.get_running_loop()
+            job = self._inflight[key] = _Job(loop.run_in_executor(self.executor, run_op, op, params))
+            job.future.add_done_callback(lambda _, key=key, job=job: self._finish(key, job))
+            self.counters["computed"] += 1
+        else:
+            self.counters["coalesced"] += 1
+
+        job.waiters += 1
+        try:
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            self.counters["cancelled"] += 1
+            # The last waiter drops work that has not started yet; running work finishes and is cached
+            if job.waiters == 1:
+                job.future.cancel()
+            raise
+        finally:
+            job.waiters -= 1
+
+    async def handle_ws(self, connection) -> None:
+        pending: dict[str, tuple[int, asyncio.Task]] = {}
+        send_lock = asyncio.Lock()
+
+        async def reply(message) -> None:
+            async with send_lock:
+                try:
+                    await connection.send(message)
+                except ConnectionClosed:
+                    pass
+
+        async def answer(channel: str, request_id: int, op: str, params: dict) -> None:
+            try:
+                frame = await self.submit(op, params)
+            except Exception as exc:
+                self.counters["errors"] += 1
+                frame = json.dumps({"id": request_id, "error": str(exc)})
+            else:
+                frame = _with_id(frame, request_id)
+            # Past this point the answer is no longer stale
+            if pending.get(channel, (None,))[0] == request_id:
+                del pending[channel]
+            await reply(frame)
+
+        try:
+            async for message in connection:
+                try:
+                    msg = json.loads(message)
+                    request_id, op, params = int(msg["id"]), str(msg["op"]), dict(msg.get("params", {}))
+                except (TypeError, ValueError, KeyError) as exc:
+                    await reply(json.dumps({"id": None, "error": f"Bad request: {exc}"}))
+                    continue
+                # A newer value on the same channel supersedes the one still being computed
+                channel = str(msg.get("channel", op))
+                stale = pending.pop(channel, None)
+                if stale is not None:
+                    stale[1].cancel()
+                    await reply(json.dumps({"id": stale[0], "cancelled": True}))
+                pending[channel] = (request_id, asyncio.create_task(answer(channel, request_id, op, params)))
+        except ConnectionClosed:
+            pass
+        finally:
+            for _, task in pending.values():
+                task.cancel()
+
+    async def handle_http(self, connection, request) -> Response | None:
+        url = urlsplit(request.path)
+        if url.path == "/ws":
+            return None
+        if url.path == "/health":
+            return _response(200, "OK", json.dumps(self.stats()).encode("utf-8"), "application/json")
+        if not url.path.startswith("/v1/"):
+            return _response(404, "Not Found", b"Not found\n", "text/plain")
+        try:
+            params = {k: _query_value(v) for k, v in parse_qsl(url.query)}
+            frame = await self.submit(url.path[len("/v1/") :], params)
+        except Exception as exc:
+            self.counters["errors"] += 1
+            return _response(400, "Bad Request", json.dumps({"error": str(exc)}).encode("utf-8"), "application/json")
+        return _response(200, "OK", frame, FRAME_CONTENT_TYPE)
+
+    async def serve_forever(self, host: str, port: int) -> None:
+        async with serve(self.handle_ws, host, port, process_request=self.handle_http, max_size=2**20) as server:
+            print(f"vb3d service on ws://{host}:{port}/ws and http://{host}:{port}/v1/<op>", file=sys.stderr)
+            await server.serve_forever()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _query_value(value: str):
+    # "1,2,3" -> [1.0, 2.0, 3.0]; "1.5" -> 1.5; anything else stays a string
+    try:
+        parts = [float(v) for v in value.split(",")]
+    except ValueError:
+        return {"true": True, "false": False}.get(value.lower(), value)
+    return parts if len(parts) > 1 else parts[0]
+
+
+def _response(status: int, reason: str, body: bytes, content_type: str) -> Response:
+    headers = Headers([("Content-Type", content_type), ("Content-Length", str(len(body))), ("Access-Control-Allow-Origin", "*")])
+    return Response(status, reason, headers, body)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Local simulation service over HTTP and WebSocket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache-mb", type=int, default=RESULT_CACHE_BYTES // 2**20)
+    args = parser.parse_args(argv)
+
+    service = SimulationService(args.workers, args.cache_mb * 2**20)
+    try:
+        asyncio.run(service.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+﻿import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from functools import wraps
+from pathlib import Path
+
+import numpy as np
+
+# Named timing spans for main() stages and kernels. Disabled (the default), span() returns a
+# shared no-op context and @timed adds one flag check per call. The flag is per thread, so
+# each Streamlit session (its reruns run on their own script thread) switches recording on or
+# off for itself only. Enabled, each thread collects its spans for the current rerun
+# (begin_rerun / end_rerun) and every duration also lands in a process-wide rolling window per
+# name for p50 / p95. VB3D_SPANS=1 turns recording on by default; VB3D_SPAN_LOG=spans.jsonl
+# does too and appends one JSON line per rerun.
+
+ROLLING_WINDOW = 512
+_NOOP = nullcontext()
+
+
+def _noop_lap(name: str) -> None:
+    pass
+
+
+class _Span:
+    __slots__ = ("recorder", "name", "t0")
+
+    def __init__(self, recorder: "SpanRecorder", name: str) -> None:
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self) -> "_Span":
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.recorder.record(self.name, time.perf_counter() - self.t0)
+
+
+class SpanRecorder:
+    def __init__(self, window: int = ROLLING_WINDOW, default_enabled: bool = False) -> None:
+        self.default_enabled = default_enabled
+        self.window = window
+        self.log_path: Path | None = None
+        self._history: dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def enabled(self) -> bool:
+        return getattr(self._local, "enabled", self.default_enabled)
+
+    @enabled.setter
+    def enabled(self, value: bool) -> None:
+        # Only the calling thread; other sessions keep their own setting
+        self._local.enabled = bool(value)
+
+    def span(self, name: str):
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, name)
+
+    def record(self, name: str, seconds: float) -> None:
+        frame = getattr(self._local, "frame", None)
+        if frame is not None:
+            # Repeated spans within one rerun add up
+            frame[name] = frame.get(name, 0.0) + seconds
+        with self._lock:
+            hist = self._history.get(name)
+            if hist is None:
+                hist = self._history[name] = deque(maxlen=self.window)
+            hist.append(seconds)
+
+    def lap_timer(self):
+        # lap(name) records the time since the previous lap (or since lap_timer()); lets a long
+        # function be split into stages without re-indenting it under with-blocks
+        if not self.enabled:
+            return _noop_lap
+        last = [time.perf_counter()]
+
+        def lap(name: str) -> None:
+            now = time.perf_counter()
+            self.record(name, now - last[0])
+            last[0] = now
+
+        return lap
+
+    def begin_rerun(self) -> None:
+        self._local.frame = {}
+        self._local.t0 = time.perf_counter()
+
+    def end_rerun(self) -> dict[str, float]:
+        # Spans of this thread's rerun in ms, plus "rerun" for the whole of it; appended to
+        # log_path as one JSON line when set
+        frame = getattr(self._local, "frame", None)
+        self._local.frame = None
+        if frame is None:
+            return {}
+        # This rerun's own elapsed time; the shared "rerun" history may already hold another
+        # session's entry after it
+        elapsed = time.perf_counter() - self._local.t0
+        self.record("rerun", elapsed)
+        frame["rerun"] = elapsed
+        out = {name: round(sec * 1e3, 3) for name, sec in frame.items()}
+        if self.log_path is not None:
+            line = json.dumps({"ts": time.time(), "thread": threading.get_ident(), "spans_ms": out})
+            with self._lock, self.log_path.open("a", encoding="utf-8") as fh:
+                fh.write(line + "\n")
+        return out
+
+    def summary(self) -> list[dict]:
+        # Rolling per-name statistics in ms, slowest p95 first
+        with self._lock:
+            items = [(name, np.array(hist)) for name, hist in self._history.items() if hist]
+        rows = [
+            {
+                "span": name,
+                "count": int(v.size),
+                "p50_ms": round(float(np.percentile(v, 50)) * 1e3, 3),
+                "p95_ms": round(float(np.percentile(v, 95)) * 1e3, 3),
+                "max_ms": round(float(v.max()) * 1e3, 3),
+            }
+            for name, v in items
+        ]
+        return sorted(rows, key=lambda r: -r["p95_ms"])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._history.clear()
+
+
+RECORDER = SpanRecorder(
+    default_enabled=os.environ.get("VB3D_SPANS", "0") != "0" or bool(os.environ.get("VB3D_SPAN_LOG"))
+)
+if os.environ.get("VB3D_SPAN_LOG"):
+    RECORDER.log_path = Path(os.environ["VB3D_SPAN_LOG"])
+
+
+def span(name: str):
+    return RECORDER.span(name)
+
+
+def timed(name: str):
+    # Kernel decorator; a single enabled check when spans are off
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not RECORDER.enabled:
+                return fn(*args, **kwargs)
+            with _Span(RECORDER, name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,208 @@
+﻿import io
+import json
+from pathlib import Path
+
+import numpy as np
+
+# Columnar result store for sweep outputs.
+#
+# <root>/meta.json              param fields, array names and widths
+# <root>/param.<field>.npy      float64, one row per scenario
+# <root>/<array>.<c>.npy        float32, component c of every scenario's rows back to back
+# <root>/<array>.offsets.npy    int64, scenario i owns rows offsets[i]:offsets[i + 1]
+#
+# Columns are regular .npy files with a fixed 128-byte header that is rewritten on close,
+# so they can be appended to in place and memory-mapped with np.load(mmap_mode="r").
+
+STORE_VERSION = 1
+HEADER_BYTES = 128
+COMPONENTS = "xyz"
+
+
+def _column_header(dtype: np.dtype, count: int) -> bytes:
+    buf = io.BytesIO()
+    header = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (count,)}
+    np.lib.format.write_array_header_1_0(buf, header)
+    raw = buf.getvalue()
+    if len(raw) != HEADER_BYTES:
+        raise ValueError(f"Unexpected .npy header size {len(raw)} for {count} rows")
+    return raw
+
+
+def _column_count(path: Path, dtype: np.dtype) -> int:
+    # Derived from the file size rather than the header so an unclosed writer is recoverable
+    return max(0, (path.stat().st_size - HEADER_BYTES) // dtype.itemsize)
+
+
+def _component_names(width: int) -> list[str]:
+    return [COMPONENTS[c] if width <= len(COMPONENTS) else str(c) for c in range(width)] if width > 1 else ["v"]
+
+
+def scenario_key(values) -> str:
+    return ",".join(f"{float(v):.6f}" for v in values)
+
+
+class _ColumnAppender:
+    def __init__(self, path: Path, dtype) -> None:
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        if path.exists():
+            self.count = _column_count(path, self.dtype)
+            self.fh = path.open("rb+")
+            self.fh.seek(HEADER_BYTES + self.count * self.dtype.itemsize)
+            self.fh.truncate()
+        else:
+            self.count = 0
+            self.fh = path.open("wb")
+            self.fh.write(b"\0" * HEADER_BYTES)
+
+    def append(self, values) -> None:
+        arr = np.ascontiguousarray(values, dtype=self.dtype).ravel()
+        self.fh.write(arr.tobytes())
+        self.count += arr.size
+
+    def truncate(self, count: int) -> None:
+        self.fh.seek(HEADER_BYTES + count * self.dtype.itemsize)
+        self.fh.truncate()
+        self.count = count
+
+    def flush(self) -> None:
+        self.fh.flush()
+
+    def close(self) -> None:
+        self.fh.seek(0)
+        self.fh.write(_column_header(self.dtype, self.count))
+        self.fh.close()
+
+
+class ResultStoreWriter:
+    def __init__(self, path: str | Path, param_fields: list[str], arrays: dict[str, int]) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta_path = self.path / "meta.json"
+        meta = {"version": STORE_VERSION, "param_fields": list(param_fields), "arrays": dict(arrays)}
+        if meta_path.exists():
+            existing = json.loads(meta_path.read_text(encoding="utf-8"))
+            if existing != meta:
+                raise ValueError(f"Store at {self.path} has a different layout: {existing}")
+        else:
+            meta_path.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+        self.param_fields = list(param_fields)
+        self.arrays = dict(arrays)
+        self._params = {f: _ColumnAppender(self.path / f"param.{f}.npy", np.float64) for f in self.param_fields}
+        self._offsets = {}
+        self._data = {}
+        for name, width in self.arrays.items():
+            self._offsets[name] = _ColumnAppender(self.path / f"{name}.offsets.npy", np.int64)
+            if self._offsets[name].count == 0:
+                self._offsets[name].append([0])
+            self._data[name] = [
+                _ColumnAppender(self.path / f"{name}.{c}.npy", np.float32) for c in _component_names(width)
+            ]
+        self._recover()
+
+    def _recover(self) -> None:
+        # Rows are written data -> offsets -> params; cut everything back to the last full row
+        n = min([col.count for col in self._params.values()] + [off.count - 1 for off in self._offsets.values()])
+        for col in self._params.values():
+            col.truncate(n)
+        for name, off in self._offsets.items():
+            off.truncate(n + 1)
+            off.flush()
+            end = int(np.memmap(off.path, dtype=np.int64, mode="r", offset=HEADER_BYTES, shape=(n + 1,))[n])
+            for col in self._data[name]:
+                col.truncate(end)
+        self._ends = {name: self._data[name][0].count for name in self.arrays}
+        self.count = n
+
+    def append(self, params: dict, arrays: dict[str, np.ndarray]) -> None:
+        for name, width in self.arrays.items():
+            arr = np.asarray(arrays[name], dtype=np.float32).reshape(-1, width)
+            for c, col in enumerate(self._data[name]):
+                col.append(arr[:, c])
+            self._ends[name] += arr.shape[0]
+        for name in self.arrays:
+            self._offsets[name].append([self._ends[name]])
+        for f in self.param_fields:
+            self._params[f].append([params[f]])
+        self.count += 1
+
+    def flush(self) -> None:
+        for col in self._all_columns():
+            col.flush()
+
+    def _all_columns(self) -> list[_ColumnAppender]:
+        cols = list(self._params.values()) + list(self._offsets.values())
+        for data in self._data.values():
+            cols.extend(data)
+        return cols
+
+    def close(self) -> None:
+        for col in self._all_columns():
+            col.close()
+
+    def __enter__(self) -> "ResultStoreWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ResultStore:
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        if meta["version"] != STORE_VERSION:
+            raise ValueError(f"Unsupported store version {meta['version']}")
+        self.param_fields = meta["param_fields"]
+        self.arrays = meta["arrays"]
+        self._cache: dict[str, np.ndarray] = {}
+        self._index: dict[str, int] | None = None
+        self.count = self._map(f"param.{self.param_fields[0]}.npy", np.float64).size if self.param_fields else 0
+
+    def _map(self, filename: str, dtype) -> np.ndarray:
+        if filename not in self._cache:
+            path = self.path / filename
+            dtype = np.dtype(dtype)
+            n = _column_count(path, dtype)
+            self._cache[filename] = (
+                np.memmap(path, dtype=dtype, mode="r", offset=HEADER_BYTES, shape=(n,)) if n else np.empty(0, dtype)
+            )
+        return self._cache[filename]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def param(self, field: str) -> np.ndarray:
+        return self._map(f"param.{field}.npy", np.float64)[: self.count]
+
+    def params(self) -> dict[str, np.ndarray]:
+        return {f: self.param(f) for f in self.param_fields}
+
+    def offsets(self, name: str) -> np.ndarray:
+        return self._map(f"{name}.offsets.npy", np.int64)[: self.count + 1]
+
+    def column(self, name: str, component: str = "v") -> np.ndarray:
+        # Whole memory-mapped component across every scenario
+        return self._map(f"{name}.{component}.npy", np.float32)
+
+    def get(self, i: int, name: str) -> np.ndarray:
+        off = self.offsets(name)
+        lo, hi = int(off[i]), int(off[i + 1])
+        cols = [self.column(name, c)[lo:hi] for c in _component_names(self.arrays[name])]
+        return np.column_stack(cols) if len(cols) > 1 else np.asarray(cols[0])
+
+    def index_of(self, params: dict) -> int:
+        # Last row written for a key wins, so a resumed sweep that redid a scenario is consistent
+        if self._index is None:
+            cols = [self.param(f) for f in self.param_fields]
+            self._index = {scenario_key(row): i for i, row in enumerate(zip(*cols))}
+        return self._index[scenario_key(params[f] for f in self.param_fields)]
+
+    def select(self, **ranges: tuple[float, float]) -> np.ndarray:
+        mask = np.ones(self.count, dtype=bool)
+        for field, (lo, hi) in ranges.items():
+            col = self.param(field)
+            mask &= (col >= lo) & (col <= hi)
+        return np.flatnonzero(mask)
@@ -0,0 +1,290 @@
+﻿import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+
+from .core import (
+    LandingHeatmap,
+    SpikeSegments,
+    TrajectoryColumns,
+    compute_flight_events,
+    compute_spike_segments,
+    solve_v0_from_target,
+)
+from .store import ResultStoreWriter
+
+# Headless what-if sweeps over the sliders of main():
+#   python -m vb3d_sim.sweep --out sweep.jsonl --axis xs=-6:-1:11 --axis t_hit=0.4:0.9:6 --workers 32
+# Results are appended as JSON lines while chunks finish; rerunning with the same --out
+# skips scenarios already on disk. --store DIR also keeps the trajectory and envelope arrays
+# in a columnar ResultStore (see store.py). --heatmap FILE.npz accumulates every scenario's
+# legal landings and net crossings into one LandingHeatmap. FILE is rewritten after each chunk's
+# JSON lines, and holds one contact per record in --out order, so on resume the records past
+# its contact count (a crash between the two writes) are added back before the sweep continues.
+
+SCENARIO_FIELDS = ("xs", "ys", "zs", "x_t", "y_t", "z_t", "t_hit")
+DEFAULT_SCENARIO = {"xs": -3.0, "ys": 0.0, "zs": 2.3, "x_t": -0.8, "y_t": 3.8, "z_t": 3.1, "t_hit": 0.55}
+DEFAULT_SETTINGS = {"h_net": 2.43, "t_after": 0.3, "dt": 0.01, "nx": 60, "ny": 60, "k_samples": 10}
+STORE_ARRAYS = {"t": 1, "R": 3, "cross_pts": 3, "landing_pts": 3, "env_pts": 3}
+
+
+def scenario_key(scenario: dict) -> str:
+    return ",".join(f"{float(scenario[k]):.6f}" for k in SCENARIO_FIELDS)
+
+
+def build_grid(axes: dict[str, list[float]], base: dict | None = None) -> list[dict]:
+    unknown = set(axes) - set(SCENARIO_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown sweep axes: {sorted(unknown)}")
+    base = {**DEFAULT_SCENARIO, **(base or {})}
+    names = list(axes)
+    return [{**base, **dict(zip(names, values))} for values in itertools.product(*(axes[k] for k in names))]
+
+
+def run_scenario(
+    scenario: dict, settings: dict, keep_arrays: bool = False
+) -> tuple[dict, tuple[TrajectoryColumns, SpikeSegments] | None]:
+    S = np.array([scenario["xs"], scenario["ys"], scenario["zs"]], dtype=float)
+    P_hit = np.array([scenario["x_t"], scenario["y_t"], scenario["z_t"]], dtype=float)
+    t_hit = float(scenario["t_hit"])
+    h_net = float(settings["h_net"])
+
+    v0 = solve_v0_from_target(S, P_hit, t_hit)
+    traj = TrajectoryColumns.simulate(S, v0, t_hit + settings["t_after"], settings["dt"])
+    events = compute_flight_events(S, v0, h_net)
+    segments = compute_spike_segments(P_hit, h_net, settings["nx"], settings["ny"])
+
+    has_legal = len(segments) > 0
+    record = {
+        "key": scenario_key(scenario),
+        **{k: float(scenario[k]) for k in SCENARIO_FIELDS},
+        "v0": [float(c) for c in v0],
+        "speed": float(np.linalg.norm(v0)),
+        "set_crosses_net": bool(events["t_net"][0] <= t_hit + 1e-9),
+        "set_max_z": float(traj.xyz[2, : traj.index_after(t_hit)].max()),
+        "legal_count": len(segments),
+        "envelope_points": segments.point_count(settings["k_samples"]),
+        "z_cross_min": float(segments.cross_z.min()) if has_legal else None,
+        "z_cross_max": float(segments.cross_z.max()) if has_legal else None,
+    }
+    if not keep_arrays:
+        return record, None
+    # Workers hand back the compact containers; store_arrays() expands them in the parent
+    return record, (traj, segments)
+
+
+def store_arrays(traj: TrajectoryColumns, segments: SpikeSegments, k_samples: int) -> dict[str, np.ndarray]:
+    # STORE_ARRAYS rows for one scenario; the dense cloud is only materialized here
+    return {
+        "t": traj.t,
+        "R": traj.R,
+        "cross_pts": segments.cross_pts,
+        "landing_pts": segments.landing_pts,
+        "env_pts": segments.sample(k_samples),
+    }
+
+
+def _run_chunk(
+    scenarios: list[dict], settings: dict, keep_arrays: bool, heatmap: bool = False
+) -> tuple[list[tuple[dict, tuple | None]], LandingHeatmap | None]:
+    results = [run_scenario(s, settings, keep_arrays) for s in scenarios]
+    if not heatmap:
+        return results, None
+    # Workers return their partial histogram; the parent merges them
+    P_hits = np.array([[s["x_t"], s["y_t"], s["z_t"]] for s in scenarios], dtype=float)
+    return results, LandingHeatmap(settings["nx"], settings["ny"]).add(P_hits, h_net=settings["h_net"])
+
+
+def _drop_torn_tail(out_path: Path) -> None:
+    # A crash mid-write leaves a partial last line; cut it so appended records start clean
+    if not out_path.exists():
+        return
+    with out_path.open("rb+") as fh:
+        data = fh.read()
+        if data and not data.endswith(b"\n"):
+            fh.truncate(data.rfind(b"\n") + 1)
+
+
+def load_completed_keys(out_path: Path) -> set[str]:
+    done: set[str] = set()
+    if not out_path.exists():
+        return done
+    with out_path.open("r", encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                done.add(json.loads(line)["key"])
+            except (json.JSONDecodeError, KeyError):
+                continue
+    return done
+
+
+def _load_records(out_path: Path) -> list[dict]:
+    records = []
+    if not out_path.exists():
+        return records
+    with out_path.open("r", encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "key" in record:
+                records.append(record)
+    return records
+
+
+def _catch_up_heatmap(heatmap: LandingHeatmap, out_path: Path, h_net: float) -> LandingHeatmap:
+    # Contacts of records written after the heatmap was last saved
+    missing = _load_records(out_path)[heatmap.contacts :]
+    if missing:
+        heatmap.add(np.array([[r["x_t"], r["y_t"], r["z_t"]] for r in missing], dtype=float), h_net=h_net)
+    return heatmap
+
+
+def _save_heatmap(heatmap: LandingHeatmap, path: Path) -> None:
+    # Write-then-rename so a crash never leaves a truncated file
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as fh:
+        heatmap.save(fh)
+    os.replace(tmp, path)
+
+
+def run_sweep(
+    scenarios: list[dict],
+    out_path: str | Path,
+    settings: dict | None = None,
+    workers: int | None = None,
+    chunk_size: int = 32,
+    resume: bool = True,
+    progress=None,
+    store_path: str | Path | None = None,
+    heatmap_path: str | Path | None = None,
+) -> dict:
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if resume:
+        _drop_torn_tail(out_path)
+    done = load_completed_keys(out_path) if resume else set()
+    pending = [s for s in scenarios if scenario_key(s) not in done]
+    chunks = [pending[i : i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+
+    store = None
+    if store_path is not None:
+        store = ResultStoreWriter(store_path, list(SCENARIO_FIELDS) + list(DEFAULT_SETTINGS), STORE_ARRAYS)
+    keep_arrays = store is not None
+    heatmap = None
+    if heatmap_path is not None:
+        heatmap_path = Path(heatmap_path)
+        heatmap_path.parent.mkdir(parents=True, exist_ok=True)
+        if resume and heatmap_path.exists():
+            heatmap = LandingHeatmap.load(heatmap_path)
+        else:
+            heatmap = LandingHeatmap(settings["nx"], settings["ny"])
+        if resume:
+            _catch_up_heatmap(heatmap, out_path, settings["h_net"])
+            _save_heatmap(heatmap, heatmap_path)
+
+    t0 = time.perf_counter()
+    completed = 0
+    mode = "a" if resume else "w"
+    with out_path.open(mode, encoding="utf-8") as fh, ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep a few chunks queued per worker so huge sweeps don't sit in the pool's queue
+        chunk_iter = iter(chunks)
+        in_flight = set()
+        while True:
+            for chunk in itertools.islice(chunk_iter, 4 * workers - len(in_flight)):
+                in_flight.add(pool.submit(_run_chunk, chunk, settings, keep_arrays, heatmap is not None))
+            if not in_flight:
+                break
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                results, partial = fut.result()
+                # Arrays go to the store before the JSON line that marks the scenario as done
+                if store is not None:
+                    for record, (traj, segments) in results:
+                        store.append({**record, **settings}, store_arrays(traj, segments, settings["k_samples"]))
+                    store.flush()
+                for record, _ in results:
+                    fh.write(json.dumps(record) + "\n")
+                fh.flush()
+                # The heatmap follows the JSON lines; resume adds back anything it missed
+                if partial is not None:
+                    _save_heatmap(heatmap.merge(partial), heatmap_path)
+                completed += len(results)
+            if progress is not None:
+                progress(completed, len(pending), time.perf_counter() - t0)
+    if store is not None:
+        store.close()
+
+    elapsed = time.perf_counter() - t0
+    return {
+        "total": len(scenarios),
+        "skipped": len(scenarios) - len(pending),
+        "completed": completed,
+        "elapsed_s": elapsed,
+        "scenarios_per_s": completed / elapsed if elapsed > 0 else 0.0,
+        "workers": workers,
+    }
+
+
+def _parse_axis(spec: str) -> tuple[str, list[float]]:
+    # name=start:stop:num or name=v1,v2,v3
+    name, _, values = spec.partition("=")
+    if ":" in values:
+        start, stop, num = values.split(":")
+        return name, [float(v) for v in np.linspace(float(start), float(stop), int(num))]
+    return name, [float(v) for v in values.split(",")]
+
+
+def _print_progress(done: int, total: int, elapsed: float) -> None:
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"\r{done}/{total} scenarios, {rate:.1f}/s", end="", file=sys.stderr, flush=True)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Headless set/contact/t_hit parameter sweep")
+    parser.add_argument("--out", required=True, help="JSON-lines result file (appended, used for resume)")
+    parser.add_argument("--axis", action="append", default=[], help="name=start:stop:num or name=v1,v2,...")
+    parser.add_argument("--scenarios", help="JSON-lines file of scenarios instead of a grid")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=32)
+    parser.add_argument("--no-resume", action="store_true", help="overwrite --out instead of resuming")
+    parser.add_argument("--store", help="directory of a columnar ResultStore for the full arrays")
+    parser.add_argument("--heatmap", help=".npz file for the merged landing / net-crossing heatmap")
+    for name, default in DEFAULT_SETTINGS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default)
+    args = parser.parse_args(argv)
+
+    if args.scenarios:
+        with open(args.scenarios, "r", encoding="utf-8") as fh:
+            scenarios = [{**DEFAULT_SCENARIO, **json.loads(line)} for line in fh if line.strip()]
+    else:
+        scenarios = build_grid(dict(_parse_axis(spec) for spec in args.axis))
+
+    settings = {name: getattr(args, name) for name in DEFAULT_SETTINGS}
+    stats = run_sweep(
+        scenarios,
+        args.out,
+        settings=settings,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        resume=not args.no_resume,
+        progress=_print_progress,
+        store_path=args.store,
+        heatmap_path=args.heatmap,
+    )
+    print(file=sys.stderr)
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+﻿# Streamlit entry point for the vb3d_sim UI, run from the repository root:
+#   streamlit run vb3d_sim_app.py
+from vb3d_sim.app import main
+
+main()